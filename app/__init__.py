@@ -1,9 +1,15 @@
-from . import services
-from . import models
-from . import config
+import importlib
 
 __all__ = [
     "services",
     "models", 
     "config"
 ]
+
+
+# Submodules load on first attribute access, so importing one module (app.main, app.config) does not pull in
+# every service and its SDK
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from app.config import settings
+from app.metrics import registry
+from app.tracing import span
+
+logger = logging.getLogger(__name__)
+
+admission_rejected = registry.counter("admission_rejected_total", "Requests shed with 503 by admission control", ("route_class", "reason"))
+admission_wait = registry.histogram("admission_wait_seconds", "Time admitted requests spent queued for a slot", ("route_class",))
+
+# Path prefix -> route class, first match wins. Probes and metrics are never limited so a busy worker still reports
+# itself busy, and lookups served locally get a class of their own so they never wait behind upstream calls. Routes
+# that can fall through to an upstream on a cache miss stay in their upstream's class
+ROUTE_CLASSES: Tuple[Tuple[str, Optional[str]], ...] = (
+    ("/health", None),
+    ("/ready", None),
+    ("/metrics", None),
+    ("/admin/", None),
+    ("/tickers/search", "cheap"),
+    ("/market/movers/", "cheap"),
+    ("/market/snapshot/refresh", "ingest"),
+    ("/gemini/", "gemini"),
+    ("/alpaca/", "alpaca"),
+    ("/retrieval/", "retrieval"),
+    ("/news/", "news"),
+    ("/reddit/", "ingest"),
+)
+
+
+def route_class(path: str) -> Optional[str]:
+    for prefix, name in ROUTE_CLASSES:
+        if path.startswith(prefix):
+            return name
+    return "default"
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# Default executor of the running loop (asyncio.to_thread): thread cap, threads started and calls waiting for a thread.
+# Read from the executor's internals, which is cheap enough to do per request
+def executor_status() -> Dict[str, Any]:
+    try:
+        executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    except RuntimeError:
+        executor = None
+    if executor is None:
+        return {"max_workers": None, "threads": 0, "queued": 0, "saturated": False}
+    queued = executor._work_queue.qsize()
+    return {"max_workers": executor._max_workers, "threads": len(executor._threads), "queued": queued,
+            "saturated": queued > settings.admission_executor_max_queued}
+
+
+# Concurrency limit with a bounded FIFO wait queue for one route class. Only touched from the event loop, so plain
+# counters are enough. A released slot is handed straight to the oldest waiter instead of being raced for
+class AdmissionPool:
+    def __init__(self, name: str, limit: int, queue_size: int, priority: bool = False):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        # Priority classes keep queueing while the executor is saturated, the others are shed right away
+        self.priority = priority
+        self.in_flight = 0
+        self.waiters: "deque[asyncio.Future]" = deque()
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self.waiters)
+
+    async def acquire(self, timeout: float, saturated: bool = False):
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.queue_size:
+            raise Rejected("queue_full")
+        if saturated and not self.priority:
+            raise Rejected("executor_saturated")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            with span("admission.queue", route_class=self.name):
+                await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise Rejected("queue_timeout")
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the client went away
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        admission_wait.observe(time.perf_counter() - started, self.name)
+        self.admitted += 1
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                # in_flight stays the same, the slot moves to the waiter
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def get_status(self) -> Dict[str, Any]:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queue_size": self.queue_size, "queued": self.queued,
+                "priority": self.priority, "admitted": self.admitted, "rejected": self.rejected}
+
+
+# Pools per route class from settings.admission_limits ({"class": [concurrency, queue size]}), routes of classes
+# without limits are admitted as they come
+class AdmissionController:
+    def __init__(self, limits: Optional[Dict[str, List[int]]] = None, priority_classes: Optional[List[str]] = None):
+        limits = settings.admission_limits if limits is None else limits
+        priority_classes = settings.admission_priority_classes if priority_classes is None else priority_classes
+        self.pools: Dict[str, AdmissionPool] = {
+            name: AdmissionPool(name, limit, queue_size, name in priority_classes) for name, (limit, queue_size) in limits.items()
+        }
+
+    def pool_for(self, path: str) -> Optional[AdmissionPool]:
+        name = route_class(path)
+        return self.pools.get(name) if name else None
+
+    # Not ready while a class has its wait queue more than admission_ready_queue_ratio full, so the load balancer
+    # sends new requests elsewhere before this worker starts shedding them
+    def readiness(self) -> Tuple[bool, Dict[str, Any]]:
+        busy = [name for name, pool in self.pools.items()
+                if pool.queue_size and pool.queued >= pool.queue_size * settings.admission_ready_queue_ratio]
+        return not busy, {"busy_classes": busy, "classes": self.get_status()}
+
+    def get_status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: pool.get_status() for name, pool in self.pools.items()}
+
+    def metrics(self):
+        pools = list(self.pools.values())
+        return [
+            ("admission_in_flight", "gauge", "Requests holding an admission slot by route class",
+             [({"route_class": pool.name}, pool.in_flight) for pool in pools]),
+            ("admission_queued", "gauge", "Requests waiting for an admission slot by route class",
+             [({"route_class": pool.name}, pool.queued) for pool in pools]),
+        ]
+
+
+def rejection_response(reason: str, route_class_name: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Service Unavailable", "detail": f"Too many {route_class_name} requests in progress ({reason}), retry later"},
+        headers={"Retry-After": str(settings.admission_retry_after)}
+    )
+
+
+# Pure ASGI middleware holding a slot of the request's route class until the response (streams included) is sent.
+# Requests that cannot get one within admission_queue_timeout, or find the queue full, fail fast with 503
+class AdmissionMiddleware:
+    def __init__(self, app, controller: Optional[AdmissionController] = None,
+                 executor_status: Callable[[], Dict[str, Any]] = executor_status):
+        self.app = app
+        self.controller = controller or AdmissionController()
+        self.executor_status = executor_status
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.admission_enabled:
+            await self.app(scope, receive, send)
+            return
+        pool = self.controller.pool_for(scope["path"])
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await pool.acquire(settings.admission_queue_timeout, saturated=self.executor_status()["saturated"])
+        except Rejected as e:
+            pool.rejected += 1
+            admission_rejected.inc(pool.name, e.reason)
+            await rejection_response(e.reason, pool.name)(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release()
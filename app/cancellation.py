@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, Optional
+
+from app.config import settings
+from app.serialization import dumps
+
+
+# Raised by services when the request that started the work has gone away
+class OperationCancelled(Exception):
+    pass
+
+
+# Thread safe flag shared between the event loop and worker threads doing upstream calls
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled("Client disconnected")
+
+
+# Polls the ASGI receive channel so long non-streaming requests notice a closed connection
+@asynccontextmanager
+async def cancel_on_disconnect(request, poll_interval: Optional[float] = None) -> AsyncGenerator[CancellationToken, None]:
+    token = CancellationToken()
+    poll_interval = poll_interval or settings.disconnect_poll_interval
+
+    async def watch():
+        while not token.cancelled:
+            if await request.is_disconnected():
+                token.cancel()
+                return
+            await asyncio.sleep(poll_interval)
+
+    watcher = asyncio.create_task(watch())
+    try:
+        yield token
+    finally:
+        token.cancel()
+        watcher.cancel()
+
+
+# Frames are bytes so StreamingResponse sends them without another encode
+def sse_event(payload: Dict[str, Any]) -> bytes:
+    return b"data: " + dumps(payload) + b"\n\n"
+
+
+# Turns a stream of text chunks into SSE frames. Small chunks are merged until `coalesce_chars` are buffered
+# or `coalesce_interval` seconds passed, and a comment frame is sent when the source is idle for `heartbeat_interval`
+async def sse_frames(chunks: AsyncIterator[str], heartbeat_interval: Optional[float] = None, coalesce_chars: Optional[int] = None,
+                     coalesce_interval: Optional[float] = None, encode: Callable[[Dict[str, Any]], bytes] = sse_event) -> AsyncGenerator[bytes, None]:
+    heartbeat_interval = heartbeat_interval or settings.sse_heartbeat_interval
+    coalesce_chars = settings.sse_coalesce_chars if coalesce_chars is None else coalesce_chars
+    coalesce_interval = settings.sse_coalesce_interval if coalesce_interval is None else coalesce_interval
+
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    pending = None
+    buffer = []
+    buffered = 0
+    last_frame = loop.time()
+    flush_at = None
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+
+            now = loop.time()
+            deadline = last_frame + heartbeat_interval
+            if flush_at is not None:
+                deadline = min(deadline, flush_at)
+
+            done, _ = await asyncio.wait({pending}, timeout=max(0.0, deadline - now))
+
+            if done:
+                task, pending = pending, None
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    break
+                buffer.append(chunk)
+                buffered += len(chunk)
+                if flush_at is None:
+                    flush_at = loop.time() + coalesce_interval
+
+            now = loop.time()
+            if buffer and (buffered >= coalesce_chars or now >= flush_at):
+                yield encode({"content": "".join(buffer)})
+                buffer, buffered, flush_at = [], 0, None
+                last_frame = now
+            elif not buffer and now - last_frame >= heartbeat_interval:
+                yield b": keep-alive\n\n"
+                last_frame = now
+
+        if buffer:
+            yield encode({"content": "".join(buffer)})
+    finally:
+        # Stops the upstream generator when the client disconnects mid stream
+        if pending is not None and not pending.done():
+            pending.cancel()
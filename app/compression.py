@@ -0,0 +1,217 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.http_cache import variant_etag
+from app.tracing import span, to_thread
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Bodies above this are compressed on a worker thread instead of the event loop
+THREAD_MIN_SIZE = 256 * 1024
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/javascript", "application/xml", "text/", "image/svg+xml")
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output (and so the cached variant) identical for identical input
+    return gzip.compress(data, compresslevel=settings.compression_gzip_level, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=settings.compression_brotli_quality)
+
+
+def _zstd(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=settings.compression_zstd_level).compress(data)
+
+
+# Content-Encoding -> compressor, in server preference order for equal client q-values
+CODECS: Dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    CODECS["br"] = _brotli
+if zstandard is not None:
+    CODECS["zstd"] = _zstd
+CODECS["gzip"] = _gzip
+
+
+# Best coding the client accepts (Accept-Encoding with q-values, "*" covers unlisted codings), None for identity
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in CODECS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+# Compressed bodies by (ETag, coding). An ETag names exact bytes, so responses served from the caches (bars, search,
+# catalog) are compressed once per worker and later hits reuse the stored variant. Bounded by total size
+class CompressedVariants:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag: str, coding: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get((etag, coding))
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((etag, coding))
+            self.hits += 1
+            return body
+
+    def set(self, etag: str, coding: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop((etag, coding), None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[(etag, coding)] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get_status(self):
+        return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+# Compresses complete response bodies of at least `minimum_size` bytes with the negotiated coding. Streamed bodies
+# (SSE, NDJSON) are left alone so every chunk still reaches the client as soon as it is written
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: Optional[int] = None, variants: Optional[CompressedVariants] = None):
+        self.app = app
+        self.minimum_size = settings.compression_min_size if minimum_size is None else minimum_size
+        self.variants = variants or CompressedVariants(settings.compression_cache_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = dict(scope["headers"])
+        coding = negotiate(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if_none_match = request_headers.get(b"if-none-match", b"").decode("latin-1")
+        start = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", [])
+                content_type = content_encoding = ""
+                for name, value in headers:
+                    if name.lower() == b"content-type":
+                        content_type = value.decode("latin-1").lower()
+                    elif name.lower() == b"content-encoding":
+                        content_encoding = value.decode("latin-1")
+                if message["status"] == 304:
+                    passthrough = True
+                    await send(self._not_modified_start(message, coding, if_none_match))
+                    return
+                compressible = content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
+                if not compressible or content_encoding:
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+
+            # First body message, held start message
+            if message.get("more_body", False) or coding is None or len(message.get("body", b"")) < self.minimum_size:
+                passthrough = True
+                await send(self._with_vary(start))
+                await send(message)
+                return
+
+            body, etag = await self._compress(message.get("body", b""), coding, start)
+            await send(self._compressed_start(start, coding, len(body), etag))
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _compress(self, body: bytes, coding: str, start) -> Tuple[bytes, Optional[str]]:
+        etag = next((value.decode("latin-1") for name, value in start.get("headers", []) if name.lower() == b"etag"), None)
+        if etag:
+            cached = self.variants.get(etag, coding)
+            if cached is not None:
+                return cached, etag
+        with span("response.compress", coding=coding, size=len(body)):
+            if len(body) >= THREAD_MIN_SIZE:
+                compressed = await to_thread(CODECS[coding], body)
+            else:
+                compressed = CODECS[coding](body)
+        if etag:
+            self.variants.set(etag, coding, compressed)
+        return compressed, etag
+
+    @staticmethod
+    def _with_vary(start):
+        headers = [(name, value) for name, value in start.get("headers", []) if name.lower() != b"vary"]
+        vary = [value for name, value in start.get("headers", []) if name.lower() == b"vary"]
+        if not any(b"accept-encoding" in value.lower() for value in vary):
+            vary.append(b"Accept-Encoding")
+        headers.append((b"vary", b", ".join(vary)))
+        return {**start, "headers": headers}
+
+    def _compressed_start(self, start, coding: str, length: int, etag: Optional[str]):
+        headers: List[Tuple[bytes, bytes]] = []
+        for name, value in self._with_vary(start)["headers"]:
+            lowered = name.lower()
+            if lowered == b"content-length":
+                continue
+            if lowered == b"etag" and etag:
+                # The compressed body is a different representation, it gets its own strong validator
+                value = variant_etag(etag, coding).encode("latin-1")
+            headers.append((name, value))
+        headers += [(b"content-encoding", coding.encode("latin-1")), (b"content-length", str(length).encode("latin-1"))]
+        return {**start, "headers": headers}
+
+    # A 304 carries the validator the client holds, which is the compressed variant's when it asked for that one
+    def _not_modified_start(self, start, coding: Optional[str], if_none_match: str):
+        start = self._with_vary(start)
+        if not coding:
+            return start
+        headers = []
+        for name, value in start["headers"]:
+            if name.lower() == b"etag":
+                variant = variant_etag(value.decode("latin-1"), coding)
+                if variant in if_none_match:
+                    value = variant.encode("latin-1")
+            headers.append((name, value))
+        return {**start, "headers": headers}
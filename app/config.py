@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field, ConfigDict
 
@@ -21,10 +22,181 @@ class Settings(BaseSettings):
     news_everything_url: str = Field(...)
     news_headlines_url: str = Field(...)
 
+    # NewsAPI client pool and response cache (stale entries are revalidated with ETag / If-Modified-Since)
+    news_timeout: float = 10.0
+    news_max_connections: int = 20
+    news_cache_ttl: int = 300
+    news_cache_max_entries: int = 256
+
+    # Local article store, incremental ingestion and near-duplicate threshold (SimHash bits)
+    news_db_file: str = "data/news.db"
+    news_ingest_page_size: int = 100
+    news_ingest_max_pages: int = 5
+    news_simhash_distance: int = 7
+    news_dedup_window_days: int = 3
+
+    # Mention extraction
+    mention_catalog_check_interval: float = 60.0
+    # Rolling mention counters, flushed to SQLite every mention_checkpoint_interval seconds
+    mention_db_file: Optional[str] = "data/mentions.db"
+    mention_checkpoint_interval: float = 60.0
+
+    # Reddit ingestion pipeline (reddit_fixture_path replays local listings instead of calling Reddit)
+    reddit_base_url: str = "https://www.reddit.com"
+    reddit_user_agent: str = "python_microservices:ticker-mentions:1.0"
+    reddit_subreddits: str = "wallstreetbets,stocks,investing"
+    reddit_fixture_path: Optional[str] = None
+    reddit_db_file: str = "data/reddit.db"
+    reddit_page_limit: int = 100
+    reddit_max_pages: int = 3
+    reddit_queue_size: int = 500
+    reddit_batch_size: int = 50
+    reddit_fetch_workers: int = 2
+    reddit_normalize_workers: int = 2
+    reddit_extract_workers: int = 2
+    reddit_dedupe_window: int = 100000
+
     # Parameters
     max_tokens: int = 1000
     temperature: float  = 0.7
 
+    # Conversation sessions. Without session_db_file they live in each worker's memory, so with WEB_CONCURRENCY > 1
+    # a session only continues on the worker that created it. The file (SQLite) shares them across workers
+    session_ttl_seconds: int = 3600
+    session_max_entries: int = 1000
+    session_db_file: Optional[str] = None
+
+    # Batch completions, concurrency cap and minimum spacing between upstream calls
+    gemini_batch_concurrency: int = 4
+    gemini_batch_min_interval: float = 0.25
+    gemini_batch_max_items: int = 1000
+
+    # Streaming and client disconnect handling
+    sse_heartbeat_interval: float = 15.0
+    sse_coalesce_chars: int = 64
+    sse_coalesce_interval: float = 0.05
+    disconnect_poll_interval: float = 0.5
+
+    # Long bar pulls are split into windows of this many days, cancellation is checked between windows
+    alpaca_bars_chunk_days: int = 7
+
+    # Cache shared by all uvicorn workers on the host (SQLite WAL file), ttl values in seconds
+    shared_cache_file: str = "data/shared_cache.db"
+    shared_cache_local_ttl: float = 5.0
+    shared_cache_lease_seconds: float = 60.0
+    shared_cache_lock_timeout: float = 30.0
+    alpaca_catalog_ttl: int = 86400
+    alpaca_bars_ttl: int = 60
+    alpaca_closed_bars_ttl: int = 86400
+    gemini_cache_ttl: int = 600
+
+    # JSON encoder for responses and cached payloads: "auto" (orjson when installed, else "json"), "orjson" or "json".
+    # Search results are kept pre-encoded per process for search_cache_ttl seconds
+    json_encoder: str = "auto"
+    search_cache_ttl: float = 300.0
+    search_cache_max_entries: int = 4096
+    # Search-as-you-type WebSocket (/tickers/search/ws): seconds a query waits for the next keystroke, max results
+    search_channel_debounce: float = 0.05
+    search_channel_max_limit: int = 50
+
+    # Watchlist snapshots (/alpaca/snapshot): per symbol cache ttl in seconds, symbols per request, sparkline length
+    watchlist_ttl: int = 30
+    watchlist_max_symbols: int = 100
+    watchlist_sparkline_points: int = 32
+
+    # Market wide daily snapshot behind /market/movers: rebuilt from daily bars of the tickers table every
+    # market_snapshot_interval seconds (0 disables the job), workers look for a newer version every check interval.
+    # Mover lists only rank symbols at or above the price and volume floors
+    market_snapshot_interval: int = 900
+    market_snapshot_check_interval: int = 60
+    market_snapshot_batch_size: int = 200
+    market_snapshot_concurrency: int = 4
+    market_snapshot_lookback_days: int = 30
+    market_snapshot_list_size: int = 100
+    market_snapshot_lease_seconds: int = 600
+    market_snapshot_retention: int = 86400
+    market_movers_min_price: float = 1.0
+    market_movers_min_volume: float = 100000
+
+    # HTTP caching (ETag + Cache-Control max-age in seconds) for search answers and for minute bars of closed sessions,
+    # which never change. Bars of the current window are cached until the window ends
+    http_cache_search_max_age: int = 60
+    http_cache_closed_bars_max_age: int = 86400
+
+    # Response compression (gzip, br / zstd when brotli / zstandard are installed) for complete bodies of at least
+    # compression_min_size bytes. Compressed variants of cached responses are kept per worker up to compression_cache_bytes
+    compression_min_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 5
+    compression_zstd_level: int = 3
+    compression_cache_bytes: int = 64 * 1024 * 1024
+
+    # Admission control per route class (see app/admission.py): [concurrent requests, queued requests]. Queued requests
+    # wait up to admission_queue_timeout seconds, beyond that or with a full queue they get 503 with Retry-After.
+    # Priority classes keep queueing while more than admission_executor_max_queued calls wait for an executor thread
+    admission_enabled: bool = True
+    admission_limits: Dict[str, List[int]] = {
+        "cheap": [256, 1024], "gemini": [16, 64], "alpaca": [32, 128], "retrieval": [16, 64], "news": [32, 128],
+        "ingest": [2, 4], "default": [64, 256]
+    }
+    admission_priority_classes: List[str] = ["cheap"]
+    admission_queue_timeout: float = 5.0
+    admission_retry_after: int = 2
+    admission_executor_max_queued: int = 32
+    # /ready reports the worker busy once a class's queue is this full
+    admission_ready_queue_ratio: float = 0.5
+
+    # Upstream resilience (see app/resilience.py): per upstream call timeouts in seconds, breakers open after
+    # resilience_failure_threshold consecutive failures and let resilience_half_open_calls probes through after
+    # resilience_reset_timeout. Idempotent reads are hedged once they run past the recent p95. Last known good
+    # values are kept resilience_stale_ttl seconds past their ttl and served, flagged stale, while loads fail
+    resilience_timeouts: Dict[str, float] = {"alpaca": 10.0, "gemini": 60.0}
+    resilience_default_timeout: float = 30.0
+    resilience_failure_threshold: int = 5
+    resilience_reset_timeout: float = 30.0
+    resilience_half_open_calls: int = 1
+    resilience_hedge_enabled: bool = True
+    resilience_hedge_percentile: float = 0.95
+    resilience_hedge_min_samples: int = 20
+    resilience_hedge_min_delay: float = 0.05
+    resilience_stale_ttl: int = 7 * 86400
+    # Upstreams whose open breaker makes /ready fail
+    resilience_required_upstreams: List[str] = []
+
+    # Rate limits shared by all uvicorn workers ("memory://" keeps them per process). Route limits are multiplied
+    # per API key (X-API-Key header) or per client IP, e.g. RATE_LIMIT_API_KEYS='{"partner-key": 10}'
+    rate_limit_storage_uri: str = "sqlite:///data/rate_limits.db"
+    rate_limit_strategy: str = "sliding-window-counter"
+    rate_limit_api_keys: Dict[str, float] = {}
+    rate_limit_ips: Dict[str, float] = {}
+    # Seconds a check waits for another worker's write lock on the SQLite storage before letting the request through
+    rate_limit_busy_timeout: float = 0.05
+
+    # Request tracing, traces slower than trace_slow_ms or failing are kept, plus a trace_sample_rate share of the rest
+    trace_enabled: bool = True
+    trace_slow_ms: float = 500.0
+    trace_sample_rate: float = 0.01
+    trace_buffer_size: int = 500
+    trace_max_spans: int = 256
+    trace_file: str = "data/traces/traces.jsonl"
+    trace_file_max_bytes: int = 10 * 1024 * 1024
+    trace_file_backups: int = 5
+
+    # Admin routes (profiling) need this key in the X-Admin-Key header and are disabled while it is unset
+    admin_api_key: Optional[str] = None
+    profile_max_seconds: float = 60.0
+    profile_sample_interval: float = 0.005
+
+    # Retrieval index injected into conversation prompts (IVF partitioning kicks in above the threshold, 0 disables it)
+    retrieval_index_path: str = "data/retrieval/index"
+    retrieval_embedder: str = "hashing"  # "hashing" (local, deterministic) or "gemini"
+    retrieval_dim: int = 512
+    retrieval_top_k: int = 4
+    retrieval_min_score: float = 0.3
+    retrieval_rerank_candidates: int = 50
+    retrieval_ivf_threshold: int = 50000
+    retrieval_ivf_probes: int = 4
+
     # Config in dictionary
     model_config = ConfigDict(env_file=BASE_DIR / ".env", env_file_encoding="utf-8", case_sensitive=False, extra="forbid")
 
@@ -1,16 +1,26 @@
 import sqlite3
 import threading
+import weakref
 from pathlib import Path
 from contextlib import contextmanager
 
+from app.metrics import instrument, timed
+
 # Create a ticker DB to not waste API usage
 DB_FILE = Path("data/tickers.db")
 
 class SQLitePool:
+    # Every pool in the process, reported by /metrics
+    pools = weakref.WeakSet()
+
     def __init__(self, db_file):
         self.db_file = db_file
         self.pool_of_connections = []
         self.lock = threading.Lock()
+        self.opened = 0
+        self.checkouts = 0
+        self.in_use = 0
+        SQLitePool.pools.add(self)
     
     @contextmanager
     def get_connection(self):
@@ -30,6 +40,9 @@ class SQLitePool:
             if conn is None:
                 conn = sqlite3.connect(self.db_file, check_same_thread=False)
                 conn.row_factory = sqlite3.Row
+                self.opened += 1
+            self.checkouts += 1
+            self.in_use += 1
         
         try:
             yield conn
@@ -53,12 +66,20 @@ class SQLitePool:
                         conn.close()
                     except:
                         pass
+        finally:
+            with self.lock:
+                self.in_use -= 1
+
+    def get_status(self):
+        with self.lock:
+            return {"idle": len(self.pool_of_connections), "in_use": self.in_use, "opened": self.opened, "checkouts": self.checkouts}
 
 # Initialize the database pool
 db_pool = SQLitePool(str(DB_FILE))
 
 
 
+@instrument("tickerdb")
 class TickerDB:
     _instance = None
 
@@ -99,6 +120,19 @@ class TickerDB:
                 (f"%{query}%", f"%{query}%", limit)
             )
             return cursor.fetchall()
+
+    def get_all_tickers(self):
+        with self.db_pool.get_connection() as conn:
+            cursor = conn.execute("SELECT ticker, company_name, exchange FROM tickers")
+            return cursor.fetchall()
+
+    # Changes whenever rows are added, removed or renamed, used to know when derived indexes are stale
+    def get_catalog_version(self):
+        with self.db_pool.get_connection() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(id), TOTAL(LENGTH(ticker) + LENGTH(IFNULL(company_name, ''))) FROM tickers"
+            ).fetchone()
+            return tuple(row)
     def get_ticker_db_connection():
         with db_pool.get_connection() as db:
             yield db
@@ -129,6 +163,7 @@ def init_ticker_db():
         except Exception as e:
             print(f"ERROR IN MAKING TICKER TABLE: {e}")
 
+@timed("tickerdb", "search_tickers_db")
 def search_tickers_db(query, limit=10):
     with db_pool.get_connection() as conn:
         cursor = conn.execute(
@@ -137,6 +172,7 @@ def search_tickers_db(query, limit=10):
         )
         return cursor.fetchall()
 
+@timed("tickerdb", "get_ticker_count")
 def get_ticker_count():
     with db_pool.get_connection() as conn:
         cursor = conn.execute("SELECT COUNT(*) FROM tickers")
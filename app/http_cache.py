@@ -0,0 +1,65 @@
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.serialization import get_encoder_name
+from app.tracing import TracedJSONResponse
+
+
+# Strong validator from the parts that determine a response body: the body itself, or a version plus the request
+# parameters when the body is fixed by them. The encoder that actually runs is part of it since it decides the exact
+# bytes (float formatting and escaping differ between orjson and json)
+def strong_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(get_encoder_name().encode("utf-8"))
+    for part in parts:
+        digest.update(b"\x00")
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+# Validator of a compressed representation, "<hash>-gzip" for "<hash>"
+def variant_etag(etag: str, coding: str) -> str:
+    return f'{etag[:-1]}-{coding}"' if etag.endswith('"') else f"{etag}-{coding}"
+
+
+def base_etag(tag: str) -> str:
+    base, _, coding = tag.rstrip('"').rpartition("-")
+    if base and coding in ("gzip", "br", "zstd"):
+        return f'{base}"' if tag.endswith('"') else base
+    return tag
+
+
+# If-None-Match uses the weak comparison, so W/ prefixes are ignored, and a compressed variant matches its identity body
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(base_etag(tag.strip().removeprefix("W/")) == etag for tag in if_none_match.split(","))
+
+
+# Last known good data served while the upstream is unavailable, clients must not keep it
+STALE_HEADERS = {"Cache-Control": "no-cache", "X-Data-Stale": "true"}
+
+
+def cache_headers(etag: str, max_age: int, immutable: bool = False) -> Dict[str, str]:
+    cache_control = f"public, max-age={max(0, int(max_age))}"
+    if immutable:
+        cache_control += ", immutable"
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+# 304 for a request that already holds this version, checked before the body is built
+def not_modified(request: Request, headers: Dict[str, str]) -> Optional[Response]:
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+# Encoded JSON body with validators, or a 304 when the client's copy matches. Without an etag it is the body's hash
+def cached_json(request: Request, body: bytes, max_age: int, etag: Optional[str] = None, immutable: bool = False) -> Response:
+    headers = cache_headers(etag or strong_etag(body), max_age, immutable)
+    return not_modified(request, headers) or TracedJSONResponse(body, headers=headers)
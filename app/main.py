@@ -1,43 +1,52 @@
-# CRITICAL: Add Python path fix FIRST - before ANY other imports
-import sys
-from pathlib import Path
-
-# Add the app directory to Python path
-app_dir = Path(__file__).parent
-sys.path.insert(0, str(app_dir))
-
-# Now your regular imports
 import os
 import logging
-import json
-import uvicorn
-from typing import AsyncGenerator
-
-# Directory issues best solution rn
-try:
-    from app.services.gemini_service import GeminiService
-    from app.services.alpaca_service import AlpacaMarketService
-    from app.db import SQLitePool, DB_FILE, db_pool, get_ticker_db_connection, search_tickers_db, TickerDB
-except ImportError:
-    from services.gemini_service import GeminiService
-    from services.alpaca_service import AlpacaMarketService
-    from db import SQLitePool, DB_FILE, db_pool, get_ticker_db_connection, search_tickers_db, TickerDB
+import time
+import hashlib
+import hmac
+import asyncio
+import math
+import httpx
+from typing import Any, AsyncGenerator, Dict, Optional
+from datetime import date, datetime, timedelta
+
+from app.services.gemini_service import GeminiService, load_genai
+from app.services.alpaca_service import AlpacaMarketService, TIMEFRAMES, load_alpaca_sdk
+from app.services.session_store import ConversationSessionStore
+from app.services.retrieval_service import RetrievalService
+from app.services.news_api_service import NewsAPIService
+from app.services.article_store import ArticleStore
+from app.services.mention_extractor import MentionExtractor
+from app.services.reddit_service import RedditService
+from app.services.mention_aggregator import MentionAggregator, RESOLUTIONS
+from app.services.market_snapshot import MarketSnapshotService, MOVER_LISTS
+from app.shared_cache import SharedCache
+from app.rate_limit import create_limiter
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry as metrics_registry, route_template
+from app.tracing import TracedJSONResponse, TracedRoute, TraceRecorder, TracingMiddleware
+from app.profiling import RouteProfiler, SamplingProfiler
+from app.cancellation import CancellationToken, OperationCancelled, cancel_on_disconnect, sse_event, sse_frames
+from app.db import SQLitePool, DB_FILE, db_pool, get_ticker_db_connection, init_ticker_db, search_tickers_db, TickerDB
+from app.startup import StartupTracker
+from app.serialization import EncodedCache, dumps
+from app.http_cache import STALE_HEADERS, cache_headers, cached_json, not_modified, strong_etag
+from app.compression import CompressedVariants, CompressionMiddleware
+from app.search_channel import SearchChannel
+from app.admission import AdmissionController, AdmissionMiddleware, executor_status
+from app.resilience import STALE_SUFFIX, UpstreamUnavailable, breaker_readiness, get_or_load_with_fallback, upstreams_status
+from app.resilience import metrics as resilience_metrics
 
 # FastAPI for Gemini AI req
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 # Slow API for rate limiter
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
 # Misc
-try:
-    from app.models import *
-except ImportError:
-    from models import *
+from app.models import *
+from app.config import settings
 
 # Rest of your code goes here...
 
@@ -45,13 +54,25 @@ except ImportError:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Time to first /health and to ready, served at /ready and /metrics
+startup_tracker = StartupTracker()
+
+# Encoded /tickers/search and catalog responses of this worker, cleared when the catalog changes
+search_cache = EncodedCache(settings.search_cache_ttl, settings.search_cache_max_entries)
+
 
 # FASTAPI app
 app = FastAPI (
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=TracedJSONResponse
 )
-# Rate Limiter (# of API calls)
-limiter = Limiter(key_func=get_remote_address)
+# Routes declared below time request validation, the handler and response serialization separately
+app.router.route_class = TracedRoute
+# Version of the tickers table, the ETag of /tickers/search answers. Set once the warm-up has loaded the catalog
+app.state.catalog_version = None
+app.state.retrieval_rebuild = None
+# Rate Limiter (# of API calls), sliding window counters shared by all workers, per API key or client IP
+limiter = create_limiter()
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -64,6 +85,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip / br / zstd for large JSON bodies, reusing compressed variants of cached responses
+compressed_variants = CompressedVariants(settings.compression_cache_bytes)
+app.add_middleware(CompressionMiddleware, variants=compressed_variants)
+
+# Per route class concurrency limits with bounded wait queues, overflow is shed with 503 + Retry-After
+admission_controller = AdmissionController()
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# Per route latency, status codes and in-flight requests, served at /metrics
+app.add_middleware(MetricsMiddleware)
+# Span tree per request, slow and failed requests are kept for /traces/slowest
+app.add_middleware(TracingMiddleware, route_template=route_template)
+
 # Dependency injection of services
 async def get_gemini_service() -> GeminiService:
     return GeminiService()
@@ -74,35 +108,185 @@ async def get_alpaca_service() -> AlpacaMarketService:
 async def ticker_db_object() -> TickerDB:
     return TickerDB(db_pool, DB_FILE)
 
+async def get_session_store() -> ConversationSessionStore:
+    return ConversationSessionStore()
 
-# API startup
-@app.on_event("startup")
-async def startup():
+async def get_retrieval_service() -> RetrievalService:
+    return RetrievalService()
+
+async def get_news_service() -> NewsAPIService:
+    return NewsAPIService()
+
+async def get_article_store() -> ArticleStore:
+    return ArticleStore()
+
+async def get_mention_extractor() -> MentionExtractor:
+    return MentionExtractor()
+
+async def get_reddit_service() -> RedditService:
+    return RedditService()
+
+async def get_mention_aggregator() -> MentionAggregator:
+    return MentionAggregator()
+
+async def get_market_snapshot_service() -> MarketSnapshotService:
+    return MarketSnapshotService()
+
+async def get_route_profiler() -> RouteProfiler:
+    return RouteProfiler()
+
+# Admin routes need the X-Admin-Key header to match settings.admin_api_key and do not exist while it is unset
+async def require_admin(request: Request):
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=404, detail=f"Route {request.url.path} not found")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Key", ""), settings.admin_api_key):
+        raise HTTPException(status_code=403, detail="Admin key required")
+
+
+# Incremental NewsAPI pull into the article store, new articles also become retrieval snippets
+async def ingest_news(query: str, news_service: NewsAPIService, article_store: ArticleStore) -> Dict[str, Any]:
+    result = await article_store.refresh(news_service, query)
+    articles = result.pop("articles")
+    if articles:
+        # Embedding and counting are CPU work, kept off the event loop
+        await asyncio.to_thread(lambda: RetrievalService().add_articles(articles))
+        await asyncio.to_thread(MentionAggregator().record_documents, [
+            {"tickers": a.get("tickers"), "text": f"{a.get('title') or ''} {a.get('description') or ''}", "timestamp": published_timestamp(a)}
+            for a in articles
+        ])
+    return result
+
+
+def published_timestamp(article: Dict[str, Any]) -> Optional[float]:
+    published_at = article.get("publishedAt")
+    return datetime.fromisoformat(published_at.replace("Z", "+00:00")).timestamp() if published_at else None
+
+
+# Flushes rolling mention counters so a restart keeps their history
+async def checkpoint_mentions_periodically():
+    while True:
+        await asyncio.sleep(settings.mention_checkpoint_interval)
+        try:
+            await asyncio.to_thread(MentionAggregator().checkpoint)
+        except Exception as e:
+            logger.error(f"Error checkpointing mention counters: {str(e)}")
+
+
+# Keeps the market snapshot current: every check interval each worker picks up a newer stored version, and once the
+# latest one is older than market_snapshot_interval the worker holding the lease materializes the next
+async def refresh_market_snapshot_periodically():
+    await startup_tracker.wait_ready()
+    while True:
+        try:
+            await MarketSnapshotService().refresh(AlpacaMarketService(), await ticker_db_object())
+        except Exception as e:
+            logger.error(f"Error refreshing market snapshot: {str(e)}")
+        await asyncio.sleep(settings.market_snapshot_check_interval)
+
+
+# Embeds the ticker catalog into the retrieval index, partitions it once it is large and persists it
+def rebuild_retrieval_index(retrieval_service: RetrievalService, ticker_db: TickerDB) -> int:
+    count = retrieval_service.add_tickers(ticker_db.get_all_tickers())
+    if settings.retrieval_ivf_threshold and len(retrieval_service.index) >= settings.retrieval_ivf_threshold:
+        retrieval_service.build_ivf()
+    retrieval_service.save()
+    return count
+
+
+# 503 with Retry-After while an upstream's breaker is open or it timed out, 500 for anything else
+def upstream_error(e: Exception) -> HTTPException:
+    if isinstance(e, UpstreamUnavailable):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    return HTTPException(status_code=500, detail=str(e))
+
+
+# Stored history for a session request, None when the client sends the full conversation
+async def resolve_session_history(conversation_request: ConversationRequest, session_store: ConversationSessionStore):
+    if not conversation_request.session_id:
+        return None
+    history = await asyncio.to_thread(session_store.get_history, conversation_request.session_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"Session {conversation_request.session_id} not found or expired, resend the full conversation")
+    return history
+
+
+# Fills the tickers table from Alpaca on first boot. A failed fetch raises so the warm-up step records it instead
+# of leaving an empty catalog behind
+async def populate_tickers():
+    with db_pool.get_connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM tickers").fetchone()[0]
+    if count > 0:
+        return
+
+    logger.info("Populating ticker DB for the first time...")
+    ticker_data = await AlpacaMarketService().fetch_all_tickers()
+    if ticker_data.get("error"):
+        raise RuntimeError(f"Could not fetch the ticker catalog: {ticker_data['error']}")
+    tickers = ticker_data["results"]
 
     with db_pool.get_connection() as conn:
-        cursor = conn.execute("SELECT COUNT(*) FROM tickers")
-        count = cursor.fetchone()[0]
-    
-    if count == 0:
-        print("Populating ticker DB for the first time...")
-        # Populate DB
-        alpaca = AlpacaMarketService()
-        ticker_data = await alpaca.fetch_all_tickers() # fetch tickers with alpaca service
-        tickers = ticker_data["results"]
-        # Populate
         conn.executemany(
-            "INSERT INTO tickers (ticker, company_name, exchange) VALUES (?, ?, ?)", 
-                    [(t["ticker"], t["company_name"], t["exchange"]) for t in tickers]
+            "INSERT INTO tickers (ticker, company_name, exchange) VALUES (?, ?, ?)",
+            [(t["ticker"], t["company_name"], t["exchange"]) for t in tickers]
         )
         conn.commit()
-    
-    # Checking if anything
-    # cursor = conn.execute("SELECT ticker, company_name, exchange FROM tickers LIMIT 100")
-    # row = cursor.fetchall()
-    # for i, r in enumerate(row):
-    #     print(f"Index {i} : {r['ticker']},({r['company_name']}, {r['exchange']})")
+    logger.info(f"Ticker DB populated with {len(tickers)} tickers")
+
 
-    conn.close()
+# Heavy SDK imports, off the event loop so /health keeps answering while they load
+async def load_sdks():
+    await asyncio.to_thread(load_genai)
+    await asyncio.to_thread(load_alpaca_sdk)
+
+
+async def load_tickers():
+    await asyncio.to_thread(init_ticker_db)
+    # With several uvicorn workers only the first one in populates the catalog, the others wait and find it filled
+    async with SharedCache().lock("tickers:populate", timeout=300):
+        await populate_tickers()
+    search_cache.clear()
+    app.state.catalog_version = await asyncio.to_thread((await ticker_db_object()).get_catalog_version)
+
+
+# First boot without a persisted retrieval index builds it in the background, it does not hold up readiness
+async def load_retrieval_index():
+    retrieval_service = await asyncio.to_thread(RetrievalService)
+    if len(retrieval_service.index) == 0:
+        app.state.retrieval_rebuild = asyncio.create_task(asyncio.to_thread(rebuild_retrieval_index, retrieval_service, await ticker_db_object()))
+        app.state.retrieval_rebuild.add_done_callback(log_retrieval_rebuild)
+
+
+def log_retrieval_rebuild(task: asyncio.Task):
+    if task.cancelled():
+        return
+    if task.exception() is not None:
+        logger.error(f"Error rebuilding retrieval index: {str(task.exception())}")
+    else:
+        logger.info(f"Retrieval index built with {task.result()} tickers")
+
+
+# API startup, returns right away so the worker serves /health while the warm-up runs. /ready turns 200 once it is done
+@app.on_event("startup")
+async def startup():
+    asyncio.create_task(checkpoint_mentions_periodically())
+    if settings.market_snapshot_interval > 0:
+        asyncio.create_task(refresh_market_snapshot_periodically())
+    app.state.warm_up = asyncio.create_task(startup_tracker.warm_up([
+        ("sdk_imports", load_sdks),
+        ("tickers", load_tickers),
+        ("retrieval_index", load_retrieval_index)
+    ]))
+    if settings.session_db_file is None and int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning("Conversation sessions are kept per worker, set SESSION_DB_FILE so every worker can continue them")
+    startup_tracker.mark("startup_complete")
+
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await NewsAPIService().aclose()
+    await asyncio.to_thread(MentionAggregator().checkpoint)
+    TraceRecorder().stop()
 
 
 
@@ -115,71 +299,148 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    startup_tracker.mark("first_health")
     return {"status": "healthy", "service": "Gemini FastAPI Integration"}
 
 
+# Tickers table loaded and not empty, as of the last warm-up
+def ticker_db_readiness():
+    version = app.state.catalog_version
+    return bool(version and version[0]), {"tickers": version[0] if version else None}
+
+
+def executor_readiness():
+    status = executor_status()
+    return not status["saturated"], status
+
+
+startup_tracker.add_check("ticker_db", ticker_db_readiness)
+startup_tracker.add_check("executor", executor_readiness)
+startup_tracker.add_check("admission", admission_controller.readiness)
+startup_tracker.add_check("upstreams", breaker_readiness)
+
+
+# Readiness for load balancers: 503 until the startup warm-up has finished and while a check fails (empty ticker DB,
+# saturated executor, admission queues filling up), so traffic goes to other workers. /health only reports liveness
+@app.get("/ready")
+async def ready_check():
+    status = startup_tracker.check_readiness()
+    return status if status["ready"] else JSONResponse(status_code=503, content=status)
+
+
 
 # Gemini Routes
 # ---------------------------------------------------- #
 @app.post("/gemini/test", response_model=ChatResponse)
 @limiter.limit("3/minute")
 async def simple_route(request: Request, chat_request: ChatRequest):
-    return ChatResponse( response=f"Echo: {chat_request.message}", model=chat_request.model, usage=None)
+    return ChatResponse( response=f"Echo: {chat_request.message}", model=chat_request.model or settings.gemini_model, usage=None)
 
 
 
 @app.post("/gemini/simple", response_model=ChatResponse)
 @limiter.limit("3/minute")
 async def simple_chat( request: Request, chat_request: ChatRequest,  gemini_service: GeminiService = Depends(get_gemini_service) ):
-    try:
-        result = await gemini_service.simple_chat(
+    async def complete():
+        return await gemini_service.simple_chat(
             message=chat_request.message,
             model=chat_request.model,
             temperature=chat_request.temperature,
             max_tokens=chat_request.max_tokens
         )
+
+    try:
+        if settings.gemini_cache_ttl > 0:
+            # Identical one-shot prompts are answered once per host for gemini_cache_ttl seconds
+            key = hashlib.sha256(chat_request.model_dump_json().encode("utf-8")).hexdigest()
+            result = await SharedCache().get_or_load(f"gemini:simple:{key}", settings.gemini_cache_ttl, complete)
+        else:
+            result = await complete()
         return ChatResponse( response=result["response"], usage=result["usage"], model=result["model"])
     except Exception as e:
         logger.error(f"Error in simple_chat: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
 
 
 
 @app.post("/gemini/conversation", response_model=ChatResponse)
 @limiter.limit("10/minute")
-async def conversation_chat( request: Request, conversation_request: ConversationRequest, gemini_service: GeminiService = Depends(get_gemini_service)):
-    try:
-        result = await gemini_service.create_chat_completion(
-            messages=conversation_request.messages,
-            model=conversation_request.model,
-            temperature=conversation_request.temperature,
-            max_tokens=conversation_request.max_tokens
-        )
-        
-        return ChatResponse( response=result["response"], usage=result["usage"], model=result["model"])
-    except Exception as e:
-        logger.error(f"Error in conversation_chat: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+async def conversation_chat( request: Request, conversation_request: ConversationRequest, gemini_service: GeminiService = Depends(get_gemini_service),
+                            session_store: ConversationSessionStore = Depends(get_session_store),
+                            retrieval_service: RetrievalService = Depends(get_retrieval_service)):
+    session_id = conversation_request.session_id or await asyncio.to_thread(session_store.create_session)
+    # One turn at a time per session, the next one is built on this one's reply
+    async with session_store.turn(session_id):
+        history = await resolve_session_history(conversation_request, session_store)
+        try:
+            context = None
+            if conversation_request.use_retrieval and conversation_request.messages:
+                # Embedding plus a scan of the whole index, kept off the event loop
+                context = await asyncio.to_thread(retrieval_service.build_context, conversation_request.messages[-1].content)
+
+            result = await gemini_service.create_chat_completion(
+                messages=conversation_request.messages,
+                model=conversation_request.model,
+                temperature=conversation_request.temperature,
+                max_tokens=conversation_request.max_tokens,
+                history=history,
+                context=context
+            )
+            await asyncio.to_thread(session_store.append, session_id, result["turns"])
+
+            return ChatResponse( response=result["response"], usage=result["usage"], model=result["model"], session_id=session_id)
+        except Exception as e:
+            logger.error(f"Error in conversation_chat: {str(e)}")
+            raise upstream_error(e)
 
 
 
 @app.post("/gemini/stream")
 @limiter.limit("10/minute")
-async def stream_chat( request: Request, conversation_request: ConversationRequest, gemini_service: GeminiService = Depends(get_gemini_service)):
-    async def generate_stream() -> AsyncGenerator[str, None]:
-        try:
+async def stream_chat( request: Request, conversation_request: ConversationRequest, gemini_service: GeminiService = Depends(get_gemini_service),
+                      session_store: ConversationSessionStore = Depends(get_session_store)):
+    # 404 before the stream starts, the history itself is read again once the stream holds the session's turn
+    await resolve_session_history(conversation_request, session_store)
+    session_id = conversation_request.session_id or await asyncio.to_thread(session_store.create_session)
+
+    async def generate_stream() -> AsyncGenerator[bytes, None]:
+        async with session_store.turn(session_id):
+            history = None
+            if conversation_request.session_id:
+                history = await asyncio.to_thread(session_store.get_history, session_id) or []
+            async for frame in stream_turn(history):
+                yield frame
+
+    async def stream_turn(history) -> AsyncGenerator[bytes, None]:
+        cancel_token = CancellationToken()
+        chunks = []
+
+        async def reply_chunks() -> AsyncGenerator[str, None]:
             async for chunk in gemini_service.streaming_chat_completion(
                 messages=conversation_request.messages,
                 model=conversation_request.model,
                 temperature=conversation_request.temperature,
-                max_tokens=conversation_request.max_tokens
+                max_tokens=conversation_request.max_tokens,
+                history=history,
+                cancel_token=cancel_token
             ):
-                yield f"data: {json.dumps({'content': chunk})}\n\n"
+                chunks.append(chunk)
+                yield chunk
+
+        try:
+            # Starlette cancels this generator when the client disconnects, the token then stops the Gemini worker thread
+            async for frame in sse_frames(reply_chunks()):
+                yield frame
+
+            # Only completed replies become part of the stored conversation
+            turns = gemini_service.build_turns(conversation_request.messages, "".join(chunks))
+            await asyncio.to_thread(session_store.append, session_id, turns)
         except Exception as e:
             logger.error(f"Error in stream_chat: {str(e)}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield sse_event({'error': str(e)})
         finally:
-            yield "data: [DONE]\n\n"
+            cancel_token.cancel()
+        yield b"data: [DONE]\n\n"
     
     return StreamingResponse(
         generate_stream(),
@@ -187,9 +448,49 @@ async def stream_chat( request: Request, conversation_request: ConversationReque
         headers={
             "Cache-Control": "no-cache", 
             "Connection": "keep-alive",
-            "Content-Type": "text/event-stream"
+            "Content-Type": "text/event-stream",
+            "X-Session-Id": session_id
         }
     )
+
+
+# Streams one NDJSON line per prompt as results finish, the `index` field maps results back to the request order
+@app.post("/gemini/batch")
+@limiter.limit("2/minute")
+async def batch_chat(request: Request, batch_request: BatchChatRequest, gemini_service: GeminiService = Depends(get_gemini_service)):
+    if not batch_request.prompts:
+        raise HTTPException(status_code=400, detail="No prompts given")
+    if len(batch_request.prompts) > settings.gemini_batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Batch limited to {settings.gemini_batch_max_items} prompts")
+
+    async def generate_results() -> AsyncGenerator[bytes, None]:
+        try:
+            async for result in gemini_service.batch_chat(
+                prompts=[prompt.model_dump() for prompt in batch_request.prompts],
+                model=batch_request.model,
+                temperature=batch_request.temperature,
+                max_tokens=batch_request.max_tokens,
+                concurrency=min(batch_request.concurrency or settings.gemini_batch_concurrency, settings.gemini_batch_concurrency)
+            ):
+                yield dumps(result) + b"\n"
+        except Exception as e:
+            logger.error(f"Error in batch_chat: {str(e)}")
+            yield dumps({"error": str(e)}) + b"\n"
+
+    return StreamingResponse(generate_results(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache"})
+
+
+@app.delete("/gemini/sessions/{session_id}")
+async def delete_session(request: Request, session_id: str, session_store: ConversationSessionStore = Depends(get_session_store)):
+    if not await asyncio.to_thread(session_store.delete, session_id):
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
+    return {"message": "Session deleted", "session_id": session_id}
+
+
+@app.get("/gemini/sessions/status")
+async def get_session_status(request: Request, session_store: ConversationSessionStore = Depends(get_session_store)):
+    """Get the size and settings of the conversation session store"""
+    return session_store.get_status()
 # ---------------------------------------------------- #
 
 
@@ -200,26 +501,37 @@ async def stream_chat( request: Request, conversation_request: ConversationReque
 
 # Alpaca Routes
 # ---------------------------------------------------- #
+
+# Catalog matches for a query, kept encoded in search_cache and sent with validators. Matches from a stale catalog
+# (Alpaca unavailable) are neither kept nor cacheable by clients
+async def ticker_bundle_response(request: Request, query: str, limit: int, alpaca_service: AlpacaMarketService) -> Response:
+    key = ("catalog", query.upper().strip(), limit)
+    encoded = search_cache.get(key)
+    if encoded is None:
+        result = await alpaca_service.get_bundle_of_tickers(query=query, limit_payload=limit)
+        if result.get("stale"):
+            return TracedJSONResponse(result, headers=STALE_HEADERS)
+        encoded = search_cache.set(key, result)
+    return cached_json(request, encoded, settings.http_cache_search_max_age)
+
 @app.get("/alpaca/fetch_tickers")
 @limiter.limit("20/minute")
 async def fetch_markets(request: Request, query: str, limit: int = 5, alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
     try:
-        result = await alpaca_service.get_bundle_of_tickers(query=query, limit_payload=limit)
-        return result
+        return await ticker_bundle_response(request, query, limit, alpaca_service)
     except Exception as e:
         logger.error(f"Error in fetch_markets Alpaca API: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
     
 
 @app.get("/alpaca/fetch_markets")
 @limiter.limit("20/minute")
 async def fetch_markets(request: Request, query: str, limit: int = 5, alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
     try:
-        result = await alpaca_service.get_bundle_of_tickers(query=query, limit_payload=limit)
-        return result
+        return await ticker_bundle_response(request, query, limit, alpaca_service)
     except Exception as e:
         logger.error(f"Error in fetch_markets Alpaca API: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e)
 
 
 
@@ -231,9 +543,9 @@ async def fetch_tickers(request: Request):
 
 @app.get("/alpaca/cache/status")
 async def get_alpaca_cache_status(request: Request, alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
-    """Get the current cache status for popular stocks"""
+    """Get hit/miss/load counts for the cache shared by all workers"""
     try:
-        cache_status = alpaca_service.get_cache_status()
+        cache_status = await asyncio.to_thread(alpaca_service.get_cache_status)
         return cache_status
     except Exception as e:
         logger.error(f"Error getting cache status: {str(e)}")
@@ -243,13 +555,14 @@ async def get_alpaca_cache_status(request: Request, alpaca_service: AlpacaMarket
 
 @app.post("/alpaca/cache/refresh")
 async def refresh_alpaca_cache(request: Request, alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
-    """Manually refresh the popular stocks cache"""
+    """Drop cached Alpaca responses so the next request refetches them, for every worker"""
     try:
-        refreshed_stocks = alpaca_service.refresh_popular_stocks_cache()
+        removed = await asyncio.to_thread(alpaca_service.clear_cache)
+        search_cache.clear()
         return {
             "message": "Cache refreshed successfully",
-            "refreshed_count": len(refreshed_stocks),
-            "cache_status": alpaca_service.get_cache_status()
+            "removed_entries": removed,
+            "cache_status": await asyncio.to_thread(alpaca_service.get_cache_status)
         }
     except Exception as e:
         logger.error(f"Error refreshing cache: {str(e)}")
@@ -257,27 +570,368 @@ async def refresh_alpaca_cache(request: Request, alpaca_service: AlpacaMarketSer
 
 
 
+# Bars as plain dicts, the pull stops between windows once the client disconnects. The range end is aligned to
+# alpaca_bars_ttl so every worker asking in the same window shares one upstream pull, and the cache holds the
+# encoded response so hits are sent as stored. Clients may reuse it until the window ends. While Alpaca is
+# unavailable the last window that loaded is served instead, flagged stale
 @app.get("/alpaca/fetch_company_bars")
-async def fetch_company_historical_bars(request: Request):
-    return {"detail": "Not added"}
+@limiter.limit("20/minute")
+async def fetch_company_historical_bars(request: Request, symbol: str, days: int = 30, timeframe: str = "day",
+                                        alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
+    if timeframe not in TIMEFRAMES:
+        raise HTTPException(status_code=400, detail=f"timeframe must be one of {list(TIMEFRAMES)}")
+
+    symbol = symbol.upper().strip()
+    ttl = settings.alpaca_bars_ttl
+    window = int(time.time() // ttl)
+    end = datetime.fromtimestamp(window * ttl)
+
+    async def load_bars():
+        async with cancel_on_disconnect(request) as cancel_token:
+            bars = await alpaca_service.get_historical_bars(symbol, timeframe=timeframe, start=end - timedelta(days=days), end=end,
+                                                            cancel_token=cancel_token)
+        data = [alpaca_service.bar_to_dict(bar) for bar in bars.data.get(symbol, [])] if bars else []
+        return {"symbol": symbol, "timeframe": timeframe, "total_samples": len(data), "data": data}
+
+    try:
+        key = f"alpaca:bars:{symbol}:{timeframe}:{days}"
+        encoded, stale = await get_or_load_with_fallback(f"{key}:{window}", ttl, load_bars, encoded=True, stale_key=key + STALE_SUFFIX)
+        if stale:
+            return TracedJSONResponse(encoded, headers=STALE_HEADERS)
+        return cached_json(request, encoded, (window + 1) * ttl - time.time())
+    except OperationCancelled:
+        # Nobody is listening anymore, 499 mirrors nginx's "client closed request"
+        return Response(status_code=499)
+    except Exception as e:
+        logger.error(f"Error in fetch_company_historical_bars Alpaca API: {str(e)}")
+        raise upstream_error(e)
+
+
+# Dashboard watchlist in one request: last price, day change and a sparkline of `points` closes over `days` days
+# per symbol. Symbols not in the short per symbol cache are fetched together in one batched bars request
+@app.get("/alpaca/snapshot")
+@limiter.limit("60/minute")
+async def watchlist_snapshot(request: Request, symbols: str, days: int = 30, points: Optional[int] = None,
+                             alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
+    symbol_list = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols.split(",") if symbol.strip()))
+    if not symbol_list:
+        raise HTTPException(status_code=400, detail="No symbols given")
+    if len(symbol_list) > settings.watchlist_max_symbols:
+        raise HTTPException(status_code=413, detail=f"Watchlist limited to {settings.watchlist_max_symbols} symbols")
+    days = min(max(days, 2), 365)
+    points = min(max(points or settings.watchlist_sparkline_points, 2), 365)
+
+    try:
+        async with cancel_on_disconnect(request) as cancel_token:
+            result = await alpaca_service.get_watchlist_snapshot(symbol_list, days, points, cancel_token)
+    except OperationCancelled:
+        return Response(status_code=499)
+    except Exception as e:
+        logger.error(f"Error in watchlist_snapshot Alpaca API: {str(e)}")
+        raise upstream_error(e)
 
+    if any(snapshot.get("stale") for snapshot in result["results"]):
+        return TracedJSONResponse(result, headers=STALE_HEADERS)
+    return TracedJSONResponse(result, headers={"Cache-Control": f"private, max-age={settings.watchlist_ttl}"})
+
+
+# A finished session never changes, its ETag follows from symbol and date so repeat requests get a 304 before the
+# bars are even looked up. The current session is validated by content and only briefly cacheable
+@app.get("/alpaca/fetch_minute_prices")
+@limiter.limit("20/minute")
+async def fetch_minute_prices(request: Request, symbol: str, date: str, alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
+    symbol = symbol.upper().strip()
+    try:
+        session = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        # Reported by the service in its usual error shape
+        session = None
+
+    headers = None
+    if session is not None and session < datetime.now().date():
+        headers = cache_headers(strong_etag("minute", symbol, session.isoformat()), settings.http_cache_closed_bars_max_age, immutable=True)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+
+    try:
+        async with cancel_on_disconnect(request) as cancel_token:
+            result = await alpaca_service.get_minute_prices_for_day(symbol, date, cancel_token=cancel_token)
+    except OperationCancelled:
+        return Response(status_code=499)
+
+    if result["status"] != "success":
+        return result
+    if result.get("stale"):
+        return TracedJSONResponse(result, headers=STALE_HEADERS)
+    if headers is not None:
+        return TracedJSONResponse(result, headers=headers)
+    return cached_json(request, dumps(result), settings.alpaca_bars_ttl)
+
+# ---------------------------------------------------- #
+
+
+
+
+# Market Routes
+# ---------------------------------------------------- #
+
+# Top movers of the latest session from the precomputed snapshot, a slice of an already ranked list. The ETag follows
+# from the snapshot version, so clients polling between refreshes get a 304
+@app.get("/market/movers/{kind}")
+async def market_movers(request: Request, kind: str, limit: int = 20,
+                        snapshot_service: MarketSnapshotService = Depends(get_market_snapshot_service)):
+    if kind not in MOVER_LISTS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {list(MOVER_LISTS)}")
+    limit = min(max(limit, 1), settings.market_snapshot_list_size)
+    if snapshot_service.version is None:
+        raise HTTPException(status_code=503, detail="Market snapshot not materialized yet",
+                            headers={"Retry-After": str(settings.market_snapshot_check_interval)})
+
+    etag = strong_etag("movers", snapshot_service.version, kind, limit)
+    headers = cache_headers(etag, settings.market_snapshot_check_interval)
+    return not_modified(request, headers) or TracedJSONResponse(snapshot_service.movers(kind, limit), headers=headers)
+
+
+@app.get("/market/snapshot/status")
+async def market_snapshot_status(request: Request, snapshot_service: MarketSnapshotService = Depends(get_market_snapshot_service)):
+    return snapshot_service.get_status()
+
+
+@app.post("/market/snapshot/refresh")
+@limiter.limit("2/minute")
+async def market_snapshot_refresh(request: Request, snapshot_service: MarketSnapshotService = Depends(get_market_snapshot_service),
+                                  alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
+    """Materialize a new market snapshot now, unless another worker is already building one"""
+    try:
+        return await snapshot_service.refresh(alpaca_service, await ticker_db_object(), force=True)
+    except Exception as e:
+        logger.error(f"Error materializing market snapshot: {str(e)}")
+        raise upstream_error(e)
+
+# ---------------------------------------------------- #
+
+
+
+
+
+
+
+
+
+
+# Retrieval Routes
 # ---------------------------------------------------- #
+@app.get("/retrieval/search")
+async def retrieval_search(request: Request, query: str, k: int = 5, retrieval_service: RetrievalService = Depends(get_retrieval_service)):
+    return {"results": await asyncio.to_thread(retrieval_service.retrieve, query, k)}
 
 
+@app.get("/retrieval/status")
+async def retrieval_status(request: Request, retrieval_service: RetrievalService = Depends(get_retrieval_service)):
+    return retrieval_service.get_status()
 
 
+@app.post("/retrieval/rebuild")
+async def retrieval_rebuild(request: Request, retrieval_service: RetrievalService = Depends(get_retrieval_service)):
+    """Re-embed the ticker catalog into the retrieval index"""
+    try:
+        count = await asyncio.to_thread(rebuild_retrieval_index, retrieval_service, await ticker_db_object())
+        return {"message": "Retrieval index rebuilt", "indexed_tickers": count, "status": retrieval_service.get_status()}
+    except Exception as e:
+        logger.error(f"Error rebuilding retrieval index: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 
+@app.post("/retrieval/index_bars")
+async def retrieval_index_bars(request: Request, symbol: str, days: int = 30, retrieval_service: RetrievalService = Depends(get_retrieval_service),
+                               alpaca_service: AlpacaMarketService = Depends(get_alpaca_service)):
+    """Summarize recent daily bars for a symbol into the retrieval index"""
+    symbol = symbol.upper().strip()
+    try:
+        end = datetime.now()
+        bars = await alpaca_service.get_historical_bars(symbol, start=end - timedelta(days=days), end=end)
+        rows = [alpaca_service.bar_to_dict(bar) for bar in bars.data.get(symbol, [])] if bars else []
+        indexed = await asyncio.to_thread(retrieval_service.add_bar_summary, symbol, rows)
+        await asyncio.to_thread(retrieval_service.save)
+        return {"symbol": symbol, "indexed": indexed, "sessions": len(rows)}
+    except Exception as e:
+        logger.error(f"Error indexing bars for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
+# ---------------------------------------------------- #
 
 
 
 
 # News Routes
 # ---------------------------------------------------- #
+def news_error(e: Exception) -> HTTPException:
+    # Upstream 4xx/5xx (bad params, NewsAPI rate limit) surfaces as a gateway error with NewsAPI's own message
+    if isinstance(e, httpx.HTTPStatusError):
+        try:
+            message = e.response.json().get("message", str(e))
+        except ValueError:
+            message = str(e)
+        status_code = 429 if e.response.status_code == 429 else 502
+        return HTTPException(status_code=status_code, detail=message)
+    return HTTPException(status_code=502, detail=str(e))
+
+
+@app.get("/news/everything")
+@limiter.limit("30/minute")
+async def news_everything(request: Request, query: str = "news", from_date: Optional[date] = None, sort_by: str = "popularity",
+                          page_size: int = 10, page: Optional[int] = None, news_service: NewsAPIService = Depends(get_news_service)):
+    try:
+        params = news_service.create_params(keywords=query, from_date=from_date, sortBy=sort_by, pageSize=page_size, page=page)
+        return await news_service.fetch_everything(params)
+    except Exception as e:
+        logger.error(f"Error in news_everything: {str(e)}")
+        raise news_error(e)
+
 
+@app.get("/news/headlines")
+@limiter.limit("30/minute")
+async def news_headlines(request: Request, query: Optional[str] = None, country: Optional[str] = "us", category: Optional[str] = None,
+                         page_size: int = 10, page: Optional[int] = None, news_service: NewsAPIService = Depends(get_news_service)):
+    try:
+        params = news_service.create_headline_params(keywords=query, country=country, category=category, pageSize=page_size, page=page)
+        return await news_service.fetch_headlines(params)
+    except Exception as e:
+        logger.error(f"Error in news_headlines: {str(e)}")
+        raise news_error(e)
+
+
+# Served from the local store, upstream is only asked for articles newer than the watermark once the query is stale
+@app.get("/news/articles")
+@limiter.limit("60/minute")
+async def news_articles(request: Request, query: Optional[str] = None, limit: int = 20, before: Optional[str] = None, refresh: bool = True,
+                        news_service: NewsAPIService = Depends(get_news_service), article_store: ArticleStore = Depends(get_article_store)):
+    refreshed = None
+    if query and refresh and await asyncio.to_thread(article_store.needs_refresh, query):
+        try:
+            refreshed = await ingest_news(query, news_service, article_store)
+        except Exception as e:
+            # Stale local results beat no results
+            logger.error(f"Error refreshing articles for {query}: {str(e)}")
+
+    articles = await asyncio.to_thread(article_store.list_articles, query, limit, before)
+    return {"results": articles, "next_before": articles[-1]["published_at"] if len(articles) == limit else None, "refreshed": refreshed}
 
 
+# Pages through the ticker -> article index newest first, never calls upstream
+@app.get("/news/by_ticker")
+@limiter.limit("60/minute")
+async def news_by_ticker(request: Request, ticker: str, limit: int = 20, cursor: Optional[str] = None,
+                         article_store: ArticleStore = Depends(get_article_store)):
+    try:
+        return await asyncio.to_thread(article_store.list_articles_by_ticker, ticker, min(max(limit, 1), 100), cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.post("/news/by_ticker/reindex")
+@limiter.limit("2/minute")
+async def news_by_ticker_reindex(request: Request, article_store: ArticleStore = Depends(get_article_store)):
+    """Re-tag every stored article, e.g. after the tickers catalog changed"""
+    await asyncio.to_thread(MentionExtractor().refresh, True)
+    return {"tags": await asyncio.to_thread(article_store.reindex_tickers)}
+
 
+@app.post("/news/refresh")
+@limiter.limit("10/minute")
+async def news_refresh(request: Request, query: str, news_service: NewsAPIService = Depends(get_news_service),
+                       article_store: ArticleStore = Depends(get_article_store)):
+    """Fetch articles newer than the stored watermark for a query"""
+    try:
+        return await ingest_news(query, news_service, article_store)
+    except Exception as e:
+        logger.error(f"Error in news_refresh: {str(e)}")
+        raise news_error(e)
+
+
+@app.get("/news/store/status")
+async def news_store_status(request: Request, article_store: ArticleStore = Depends(get_article_store)):
+    return await asyncio.to_thread(article_store.get_status)
+
+
+@app.get("/news/cache/status")
+async def news_cache_status(request: Request, news_service: NewsAPIService = Depends(get_news_service)):
+    """Get hit/miss/revalidation counts for the NewsAPI response cache"""
+    return news_service.get_cache_status()
+
+# ---------------------------------------------------- #
+
+
+
+
+# Reddit Routes
+# ---------------------------------------------------- #
+
+# Runs the fetch -> normalize -> extract -> dedupe -> store pipeline once and returns per stage throughput
+@app.post("/reddit/ingest")
+@limiter.limit("2/minute")
+async def reddit_ingest(request: Request, subreddits: Optional[str] = None, max_pages: Optional[int] = None,
+                        reddit_service: RedditService = Depends(get_reddit_service)):
+    if reddit_service.running:
+        raise HTTPException(status_code=409, detail="Reddit ingestion is already running")
+    try:
+        source = reddit_service.create_source(subreddits.split(",") if subreddits else None)
+        return await reddit_service.run(source, max_pages=max_pages)
+    except Exception as e:
+        logger.error(f"Error in reddit_ingest: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/reddit/status")
+async def reddit_status(request: Request, reddit_service: RedditService = Depends(get_reddit_service)):
+    """Get live queue depths and stage throughput plus the last run's totals"""
+    return await asyncio.to_thread(reddit_service.get_status)
+
+
+@app.get("/reddit/by_ticker")
+@limiter.limit("60/minute")
+async def reddit_by_ticker(request: Request, ticker: str, limit: int = 20, cursor: Optional[str] = None,
+                           reddit_service: RedditService = Depends(get_reddit_service)):
+    try:
+        return await asyncio.to_thread(reddit_service.store.list_by_ticker, ticker, min(max(limit, 1), 100), cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# ---------------------------------------------------- #
+
+
+
+
+# Mention Routes
+# ---------------------------------------------------- #
+
+def check_resolution(window: str):
+    if window not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {', '.join(RESOLUTIONS)}")
+
+
+# Top tickers by mention velocity, read from the rolling counters rather than the raw text
+@app.get("/mentions/trending")
+@limiter.limit("60/minute")
+async def mentions_trending(request: Request, window: str = "5m", k: int = 10, baseline: int = 12, min_mentions: int = 3,
+                            aggregator: MentionAggregator = Depends(get_mention_aggregator)):
+    check_resolution(window)
+    return {"window": window, "results": aggregator.trending(window, min(max(k, 1), 100), baseline, min_mentions)}
+
+
+@app.get("/mentions/series")
+@limiter.limit("60/minute")
+async def mentions_series(request: Request, ticker: str, window: str = "5m", points: int = 12,
+                          aggregator: MentionAggregator = Depends(get_mention_aggregator)):
+    """Get mention counts and average sentiment per bucket for one ticker"""
+    check_resolution(window)
+    return {"ticker": ticker.upper(), "window": window, "series": aggregator.series(ticker, window, max(points, 1))}
+
+
+@app.get("/mentions/status")
+async def mentions_status(request: Request, aggregator: MentionAggregator = Depends(get_mention_aggregator)):
+    return aggregator.get_status()
 
 # ---------------------------------------------------- #
 
@@ -287,28 +941,219 @@ async def fetch_company_historical_bars(request: Request):
 # Misc Routes
 # ---------------------------------------------------- #
 
-# Design an endpoint to get ticker symbols when using the search bar feature in the front end
+# Design an endpoint to get ticker symbols when using the search bar feature in the front end. Every keystroke is a
+# request, answers are kept encoded per (query, limit) so repeated prefixes skip the table scan and serialization,
+# and clients holding the answer for the current catalog version get a 304
 @app.get("/tickers/search")
 async def search_tickers(request: Request, query: str, limit: int = 10):
     if not query:
         return {"results": []}
         
     query = query.upper().strip()
-    
-    # Use the helper function instead of dependency
-    ticker_db = await ticker_db_object()
-    rows = ticker_db.search_tickers_db(query=query, limit=limit)
-    
-    results = []
-    for row in rows:
-        results.append({
-            "ticker": row["ticker"],
-            "company_name": row["company_name"],
-            "exchange": row["exchange"]
-        })
-    
+    headers = None
+    if app.state.catalog_version is not None:
+        headers = cache_headers(strong_etag("search", app.state.catalog_version, query, limit), settings.http_cache_search_max_age)
+        cached = not_modified(request, headers)
+        if cached is not None:
+            return cached
+
+    return TracedJSONResponse(await ticker_search_body(query, limit), headers=headers)
+
+
+# Encoded {"results": [...]} for an upper cased query, shared by the HTTP route and the WebSocket channel. A miss is
+# a LIKE '%query%' scan of the whole tickers table, no index serves it. The HTTP route runs it inline, a hop through
+# the executor cost more than the scan itself under load (bench_load search p95), offload runs it in a thread
+async def ticker_search_body(query: str, limit: int, offload: bool = False) -> bytes:
+    encoded = search_cache.get((query, limit))
+    if encoded is None:
+        # Use the helper function instead of dependency
+        ticker_db = await ticker_db_object()
+        if offload:
+            rows = await asyncio.to_thread(ticker_db.search_tickers_db, query=query, limit=limit)
+        else:
+            rows = ticker_db.search_tickers_db(query=query, limit=limit)
+        results = [{"ticker": row["ticker"], "company_name": row["company_name"], "exchange": row["exchange"]} for row in rows]
+        encoded = search_cache.set((query, limit), {"results": results})
+    return encoded
+
+
+# Search-as-you-type over one connection per search box: send each keystroke's query, get pushed the results of the
+# latest one only. Queries are debounced server side, and a newer query cancels the one before, whether it is still
+# waiting out the debounce or waiting on its table scan in a thread. Results of a superseded query are dropped
+@app.websocket("/tickers/search/ws")
+async def search_tickers_ws(websocket: WebSocket):
+    await websocket.accept()
+    channel = SearchChannel(lambda query, limit: ticker_search_body(query, limit, offload=True), websocket.send_text)
+    try:
+        while True:
+            await channel.receive(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await channel.close()
+
+
+# Tags a batch of texts (headlines, posts) with the tickers they mention
+@app.post("/tickers/mentions")
+@limiter.limit("60/minute")
+async def extract_mentions(request: Request, mention_request: MentionRequest, extractor: MentionExtractor = Depends(get_mention_extractor)):
+    if mention_request.with_spans:
+        results = await asyncio.to_thread(lambda: [extractor.extract_mentions(text) for text in mention_request.texts])
+    else:
+        results = await asyncio.to_thread(extractor.extract_batch, mention_request.texts)
     return {"results": results}
 
+
+@app.get("/tickers/mentions/status")
+async def mention_status(request: Request, extractor: MentionExtractor = Depends(get_mention_extractor)):
+    return extractor.get_status()
+
+
+# Cache and pool statistics the services already keep, read when /metrics is scraped. Services that were never
+# used in this worker are skipped rather than created
+def cache_and_pool_metrics():
+    cache_samples = []
+    if SharedCache._instance is not None:
+        stats = SharedCache._instance.stats
+        cache_samples += [
+            ({"cache": "shared", "result": "local_hit"}, stats["local_hits"]),
+            ({"cache": "shared", "result": "shared_hit"}, stats["shared_hits"]),
+            ({"cache": "shared", "result": "miss"}, stats["misses"]),
+        ]
+    cache_samples += [
+        ({"cache": "search", "result": "hit"}, search_cache.hits),
+        ({"cache": "search", "result": "miss"}, search_cache.misses),
+        ({"cache": "compressed", "result": "hit"}, compressed_variants.hits),
+        ({"cache": "compressed", "result": "miss"}, compressed_variants.misses),
+    ]
+    client_samples = []
+    if NewsAPIService._instance is not None:
+        news = NewsAPIService._instance
+        cache_samples += [
+            ({"cache": "newsapi", "result": "hit"}, news.cache_hits),
+            ({"cache": "newsapi", "result": "revalidated"}, news.cache_revalidations),
+            ({"cache": "newsapi", "result": "miss"}, news.cache_misses),
+        ]
+        pool = news.get_pool_status()
+        client_samples += [
+            ({"upstream": "newsapi", "state": "idle"}, pool["idle"]),
+            ({"upstream": "newsapi", "state": "active"}, pool["connections"] - pool["idle"]),
+        ]
+
+    connection_samples, opened_samples, checkout_samples = [], [], []
+    for pool in list(SQLitePool.pools):
+        status = pool.get_status()
+        connection_samples += [({"db": pool.db_file, "state": "idle"}, status["idle"]), ({"db": pool.db_file, "state": "in_use"}, status["in_use"])]
+        opened_samples.append(({"db": pool.db_file}, status["opened"]))
+        checkout_samples.append(({"db": pool.db_file}, status["checkouts"]))
+
+    return [
+        ("cache_requests_total", "counter", "Cache lookups by cache and result", cache_samples),
+        ("http_client_connections", "gauge", "Connections held by upstream HTTP client pools", client_samples),
+        ("sqlite_pool_connections", "gauge", "SQLite pool connections by state", connection_samples),
+        ("sqlite_pool_opened_total", "counter", "SQLite connections opened by each pool", opened_samples),
+        ("sqlite_pool_checkouts_total", "counter", "SQLite connections handed out by each pool", checkout_samples),
+    ]
+
+metrics_registry.register_collector(cache_and_pool_metrics)
+metrics_registry.register_collector(startup_tracker.metrics)
+metrics_registry.register_collector(admission_controller.metrics)
+metrics_registry.register_collector(resilience_metrics)
+
+
+# Prometheus text format for this worker
+@app.get("/metrics")
+async def metrics(request: Request):
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+# Slowest kept traces of this worker with their span breakdown, optionally for one route template
+@app.get("/traces/slowest")
+async def traces_slowest(request: Request, limit: int = 10, route: Optional[str] = None, minutes: Optional[float] = None):
+    since = time.time() - minutes * 60 if minutes else None
+    return {"traces": TraceRecorder().slowest(min(max(limit, 1), 100), route, since)}
+
+
+# Breaker state, timeouts, hedges and recent p95 per upstream of this worker
+@app.get("/upstreams/status")
+async def upstream_status(request: Request):
+    return upstreams_status()
+
+
+@app.get("/traces/status")
+async def traces_status(request: Request):
+    return TraceRecorder().get_status()
+
+
+@app.get("/traces/{trace_id}")
+async def trace_detail(request: Request, trace_id: str):
+    record = TraceRecorder().get(trace_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found")
+    return record
+
+# ---------------------------------------------------- #
+
+
+
+
+# Admin Routes
+# ---------------------------------------------------- #
+profile_sampling = asyncio.Lock()
+
+# Samples every thread of this worker for `seconds` and returns collapsed stacks ("frame;frame;frame count"),
+# ready for flamegraph.pl or speedscope
+@app.post("/admin/profile/sample", dependencies=[Depends(require_admin)])
+async def profile_sample(request: Request, seconds: float = 10.0, interval_ms: Optional[float] = None):
+    if not 0 < seconds <= settings.profile_max_seconds:
+        raise HTTPException(status_code=422, detail=f"seconds must be in (0, {settings.profile_max_seconds}]")
+    # An interval longer than the run would take a single sample
+    if interval_ms is not None and not 0 < interval_ms <= seconds * 1000:
+        raise HTTPException(status_code=422, detail=f"interval_ms must be in (0, {seconds * 1000:g}]")
+    if profile_sampling.locked():
+        raise HTTPException(status_code=409, detail="A sampling profile is already running in this worker")
+    async with profile_sampling:
+        profiler = SamplingProfiler(interval=interval_ms / 1000 if interval_ms is not None else None)
+        stacks = await asyncio.to_thread(profiler.run, seconds)
+    return PlainTextResponse(SamplingProfiler.render(stacks), headers={"X-Profile-Samples": str(profiler.samples)})
+
+
+# cProfile a share of the requests to one route until max_requests were measured, takes effect immediately
+@app.post("/admin/profile/routes", dependencies=[Depends(require_admin)])
+async def profile_route_enable(request: Request, route: str, sample_rate: float = 1.0, max_requests: int = 100,
+                               route_profiler: RouteProfiler = Depends(get_route_profiler)):
+    if not 0 < sample_rate <= 1:
+        raise HTTPException(status_code=422, detail="sample_rate must be in (0, 1]")
+    try:
+        return route_profiler.enable(app, route, sample_rate, max(max_requests, 1))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Route {route} not found")
+
+
+@app.get("/admin/profile/routes", dependencies=[Depends(require_admin)])
+async def profile_route_status(request: Request, route_profiler: RouteProfiler = Depends(get_route_profiler)):
+    return {"routes": route_profiler.get_status()}
+
+
+@app.get("/admin/profile/routes/report", dependencies=[Depends(require_admin)])
+async def profile_route_report(request: Request, route: str, sort: str = "cumulative", limit: int = 40,
+                               route_profiler: RouteProfiler = Depends(get_route_profiler)):
+    try:
+        report = route_profiler.report(route, sort, min(max(limit, 1), 500))
+    except KeyError:
+        raise HTTPException(status_code=422, detail=f"Unknown sort key {sort}")
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Route {route} is not being profiled")
+    return PlainTextResponse(report)
+
+
+# Puts the route's original handler back and drops its collected stats
+@app.delete("/admin/profile/routes", dependencies=[Depends(require_admin)])
+async def profile_route_disable(request: Request, route: str, route_profiler: RouteProfiler = Depends(get_route_profiler)):
+    if not route_profiler.clear(route):
+        raise HTTPException(status_code=404, detail=f"Route {route} is not being profiled")
+    return {"route": route, "enabled": False}
+
 # ---------------------------------------------------- #
 
 
@@ -324,11 +1169,12 @@ async def search_tickers(request: Request, query: str, limit: int = 10):
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {"error": "Not Found", "detail": f"Route {request.url.path} not found"}
+    detail = getattr(exc, "detail", None) or f"Route {request.url.path} not found"
+    return JSONResponse(status_code=404, content={"error": "Not Found", "detail": detail})
 
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"Global exception: {str(exc)}")
-    return {"error": "Internal server error", "detail": str(exc)}
+    return JSONResponse(status_code=500, content={"error": "Internal server error", "detail": str(exc)})
 
@@ -0,0 +1,301 @@
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from app.tracing import Span, current_trace
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (metric name, type, help, [(labels, value), ...]) produced at scrape time
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+# Every thread writes into its own dict, so recording is a plain dict update without a lock. Shards are only
+# merged when /metrics is scraped, and a thread's shard is kept after it exits so counters never go backwards
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple, Any]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[Tuple, Any]:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(values)
+            return values
+
+    def _snapshot(self) -> List[Dict[Tuple, Any]]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        return [dict(shard) for shard in shards]
+
+    def _labels(self, values: Tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> List[Family]:
+        totals: Dict[Tuple, float] = {}
+        for shard in self._snapshot():
+            for labels, value in shard.items():
+                totals[labels] = totals.get(labels, 0) + value
+        return [(self.name, self.kind, self.help, [(self._labels(labels), value) for labels, value in sorted(totals.items())])]
+
+
+# Gauges are sums of per thread deltas, which is what in-flight style inc/dec gauges need
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+# Per label set: one count per bucket (not cumulative until scraped), then sum and count
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        shard = self._shard()
+        counts = shard.get(labels)
+        if counts is None:
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def collect(self) -> List[Family]:
+        totals: Dict[Tuple, List[float]] = {}
+        for shard in self._snapshot():
+            for labels, counts in shard.items():
+                merged = totals.get(labels)
+                if merged is None:
+                    totals[labels] = list(counts)
+                else:
+                    for i, count in enumerate(counts):
+                        merged[i] += count
+
+        samples = []
+        for labels, counts in sorted(totals.items()):
+            base = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append(({**base, "le": format_value(float(bound))}, cumulative))
+            samples.append(({**base, "__suffix__": "_sum"}, counts[-2]))
+            samples.append(({**base, "__suffix__": "_count"}, counts[-1]))
+        return [(self.name, self.kind, self.help, samples)]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+        self.lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    # Callbacks read existing stats (cache hit counters, pool sizes) at scrape time, so they cost nothing per request
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        with self.lock:
+            self.collectors.append(collector)
+
+    def collect(self) -> List[Family]:
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        families = []
+        for metric in metrics:
+            families.extend(metric.collect())
+        for collector in collectors:
+            families.extend(collector())
+        return families
+
+    def render(self) -> str:
+        lines = []
+        for name, kind, help, samples in self.collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                suffix = labels.pop("__suffix__", "_bucket" if kind == "histogram" else "")
+                lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests by route and status code", ("method", "route", "status"))
+http_latency = registry.histogram("http_request_duration_seconds", "HTTP request latency until the response is sent", ("method", "route"))
+http_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being handled")
+upstream_latency = registry.histogram("upstream_request_duration_seconds", "Latency of upstream service calls and SQLite queries", ("upstream", "method"))
+upstream_errors = registry.counter("upstream_errors_total", "Upstream service calls and SQLite queries that raised", ("upstream", "method"))
+
+
+# Times every public method of a service class under upstream_request_duration_seconds{upstream, method}, and
+# as a "{upstream}.{method}" span when the request is traced. Async generators (streams) are timed from the
+# first item to the last
+def instrument(upstream: str):
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.isfunction(attr) or inspect.isgeneratorfunction(attr):
+                continue
+            setattr(cls, name, timed(upstream, name)(attr))
+        return cls
+    return decorate
+
+
+def timed(upstream: str, method: str):
+    span_name = f"{upstream}.{method}"
+
+    def decorate(fn):
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def stream_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                stream = fn(*args, **kwargs)
+                error = None
+                try:
+                    async for item in stream:
+                        yield item
+                except Exception as e:
+                    error = type(e).__name__
+                    upstream_errors.inc(upstream, method)
+                    raise
+                finally:
+                    await stream.aclose()
+                    finished = time.perf_counter()
+                    upstream_latency.observe(finished - started, upstream, method)
+                    # Items may be pulled from different tasks, so the span is recorded without becoming current
+                    trace = current_trace()
+                    if trace is not None:
+                        trace.add_span(span_name, started, finished, error=error)
+            return stream_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    with Span(span_name):
+                        return await fn(*args, **kwargs)
+                except Exception:
+                    upstream_errors.inc(upstream, method)
+                    raise
+                finally:
+                    upstream_latency.observe(time.perf_counter() - started, upstream, method)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with Span(span_name):
+                    return fn(*args, **kwargs)
+            except Exception:
+                upstream_errors.inc(upstream, method)
+                raise
+            finally:
+                upstream_latency.observe(time.perf_counter() - started, upstream, method)
+        return wrapper
+    return decorate
+
+
+_route_paths: Dict[Any, str] = {}
+
+
+# Route template ("/news/by_ticker") of a request once the router has matched it, never the raw path, so label
+# cardinality stays bounded. Endpoint -> path is rebuilt from the router the first time an endpoint is seen
+def route_template(scope) -> str:
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        router = scope.get("router")
+        routes = getattr(router, "routes", None) or getattr(scope.get("app"), "routes", [])
+        _route_paths.update({route.endpoint: route.path for route in routes if hasattr(route, "path") and hasattr(route, "endpoint")})
+        path = _route_paths.setdefault(endpoint, "unmatched")
+    return path
+
+
+# Pure ASGI middleware, unlike BaseHTTPMiddleware it does not buffer or re-wrap streaming responses
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            method = scope["method"]
+            route = route_template(scope)
+            http_requests.inc(method, route, str(status[0]))
+            http_latency.observe(time.perf_counter() - started, method, route)
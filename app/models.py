@@ -1,7 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from enum import Enum
-from app.config import settings
 
 # Privilages
 class MessageRole(str, Enum):
@@ -21,20 +20,39 @@ class ChatRequest(BaseModel):
     message: str
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 150
-    model: Optional[str] = settings.gemini_model
+    # None (or a non Gemini name) means settings.gemini_model, resolved by GeminiService
+    model: Optional[str] = None
 
 
 class ConversationRequest(BaseModel):
     messages: List[ChatMessage]
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 150
-    model: Optional[str] = settings.gemini_model
+    model: Optional[str] = None
+    # With a session_id, messages only holds the new turn(s), earlier history lives server side
+    session_id: Optional[str] = None
+    # Opt-in: adds top-k snippets from our own market data index to the prompt
+    use_retrieval: Optional[bool] = False
+
+
+class BatchPrompt(BaseModel):
+    message: str
+    id: Optional[str] = None
+
+
+class BatchChatRequest(BaseModel):
+    prompts: List[BatchPrompt]
+    temperature: Optional[float] = 0.7
+    max_tokens: Optional[int] = 150
+    model: Optional[str] = None
+    concurrency: Optional[int] = None
 
 
 class ChatResponse(BaseModel):
     response: str
     usage: Optional[dict] = None
     model: str
+    session_id: Optional[str] = None
 
 
 # Alpaca Req and Res
@@ -42,6 +60,12 @@ class AlpacaRequest(BaseModel):
     query : str
 
 
+# Ticker mention extraction
+class MentionRequest(BaseModel):
+    texts: List[str] = Field(..., max_length=1000)
+    with_spans: Optional[bool] = False
+
+
 
 # Logging token usage
 class UsageInfo(BaseModel):
@@ -0,0 +1,166 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+
+
+# Statistical profiler: a background thread snapshots every thread's stack with sys._current_frames() every
+# `interval` seconds. Nothing is hooked into the interpreter, so the cost is only paid while it runs
+class SamplingProfiler:
+    def __init__(self, interval: Optional[float] = None, max_depth: int = 128):
+        self.interval = interval or settings.profile_sample_interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._labels: Dict[Any, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    # Root first and ';' separated, the format flamegraph.pl and speedscope read
+    def collapse(self, frame, thread_name: str) -> str:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.append(thread_name.replace(";", ":"))
+        return ";".join(reversed(labels))
+
+    def run(self, seconds: float) -> Counter:
+        own = threading.get_ident()
+        stacks = Counter()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    stacks[self.collapse(frame, names.get(ident, str(ident)))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        return stacks
+
+    @staticmethod
+    def render(stacks: Counter) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# Deterministic cProfile runs for a sample of requests on chosen routes. Enabling swaps the route's ASGI app
+# for a profiling wrapper and disabling puts the original back, so routes that are not being profiled (and all
+# routes while nothing is) run exactly the code they ran before
+class RouteProfiler:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            # route path -> {"routes", "original", "sample_rate", "max_requests", "profiled", "seen", "stats", "enabled_at"}
+            self.sessions: Dict[str, Dict[str, Any]] = {}
+            # cProfile hooks the whole thread, only one request can be measured at a time
+            self._active = False
+            self.lock = threading.Lock()
+
+    def enable(self, app, path: str, sample_rate: float = 1.0, max_requests: int = 100) -> Dict[str, Any]:
+        routes = [route for route in app.routes if getattr(route, "path", None) == path and hasattr(route, "endpoint")]
+        if not routes:
+            raise KeyError(path)
+        self.disable(path)
+        session = {
+            "routes": routes,
+            "original": [route.app for route in routes],
+            "sample_rate": sample_rate,
+            "max_requests": max_requests,
+            "profiled": 0,
+            "seen": 0,
+            "stats": None,
+            "enabled_at": time.time()
+        }
+        for route, original in zip(routes, session["original"]):
+            route.app = self._wrap(path, session, original)
+        self.sessions[path] = session
+        return self.describe(path)
+
+    def disable(self, path: str) -> bool:
+        session = self.sessions.get(path)
+        if session is None or session["routes"] is None:
+            return False
+        for route, original in zip(session["routes"], session["original"]):
+            route.app = original
+        session["routes"] = None
+        return True
+
+    def _wrap(self, path: str, session: Dict[str, Any], original):
+        async def profiled_app(scope, receive, send):
+            session["seen"] += 1
+            if self._active or session["profiled"] >= session["max_requests"] or random.random() >= session["sample_rate"]:
+                await original(scope, receive, send)
+                return
+
+            # Other coroutines that run on the loop while this request awaits are measured too
+            self._active = True
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                await original(scope, receive, send)
+            finally:
+                profile.disable()
+                self._active = False
+                self._merge(session, profile)
+                if session["profiled"] >= session["max_requests"]:
+                    self.disable(path)
+        return profiled_app
+
+    def _merge(self, session: Dict[str, Any], profile: cProfile.Profile):
+        with self.lock:
+            if session["stats"] is None:
+                session["stats"] = pstats.Stats(profile)
+            else:
+                session["stats"].add(profile)
+            session["profiled"] += 1
+
+    def describe(self, path: str) -> Dict[str, Any]:
+        session = self.sessions[path]
+        return {
+            "route": path,
+            "enabled": session["routes"] is not None,
+            "sample_rate": session["sample_rate"],
+            "max_requests": session["max_requests"],
+            "requests_seen": session["seen"],
+            "requests_profiled": session["profiled"],
+            "enabled_at": session["enabled_at"]
+        }
+
+    # pstats text report of everything profiled for the route so far
+    def report(self, path: str, sort: str = "cumulative", limit: int = 40) -> Optional[str]:
+        session = self.sessions.get(path)
+        if session is None:
+            return None
+        with self.lock:
+            if session["stats"] is None:
+                return ""
+            output = io.StringIO()
+            session["stats"].stream = output
+            session["stats"].sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def clear(self, path: str) -> bool:
+        self.disable(path)
+        return self.sessions.pop(path, None) is not None
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        return [self.describe(path) for path in self.sessions]
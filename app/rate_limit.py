@@ -0,0 +1,259 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+
+from fastapi import Request
+from limits import parse_many
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+from app.config import settings
+from app.metrics import registry
+
+
+API_KEY_HEADER = "X-API-Key"
+
+rate_limit_fail_open = registry.counter("rate_limit_fail_open_total", "Rate limit checks let through because the SQLite write lock stayed busy")
+
+
+# Rate limit counters shared by every uvicorn worker on the host through one SQLite WAL file, selected with
+# storage_uri "sqlite:///relative/path.db" (four slashes for an absolute path). Sliding window counters keep
+# one row per key holding the current and previous window, so a check is one indexed read and one write.
+# slowapi checks limits on the event loop, so a write lock held longer than busy_timeout lets the request
+# through instead of stalling the worker
+class SQLiteStorage(Storage, SlidingWindowCounterSupport):
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.db_file = Path(uri[len("sqlite:///"):])
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        self.busy_timeout = float(options.get("busy_timeout", settings.rate_limit_busy_timeout))
+        self.init_rate_limit_db()
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    # One connection per thread in autocommit mode, every check is on the request path so the pool's
+    # validity queries are skipped. Connections are reopened after a fork
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(str(self.db_file), timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def init_rate_limit_db(self):
+        conn = self._connection()
+        conn.executescript("""
+        CREATE TABLE IF NOT EXISTS rate_windows (
+            key TEXT PRIMARY KEY,
+            bucket INTEGER NOT NULL,
+            previous INTEGER NOT NULL,
+            current INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS rate_counters (
+            key TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        """)
+
+    # Expired rows are swept every few thousand writes instead of by a separate job
+    def _sweep(self, conn: sqlite3.Connection, now: float):
+        self._writes += 1
+        if self._writes % 5000 == 0:
+            conn.execute("DELETE FROM rate_windows WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM rate_counters WHERE expires_at <= ?", (now,))
+
+    # (previous, current) counts as seen from `window`, a row two or more windows old counts as empty
+    @staticmethod
+    def _roll(row, window: int) -> Tuple[int, int]:
+        if row is None:
+            return 0, 0
+        if row[0] == window:
+            return row[1], row[2]
+        if row[0] == window - 1:
+            return row[2], 0
+        return 0, 0
+
+    # Starts a write transaction, False when another writer kept the lock past busy_timeout
+    def _begin_write(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return True
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            rate_limit_fail_open.inc()
+            return False
+
+    # Same (previous count, previous ttl, current count, current ttl) shape as limits' own storages
+    @staticmethod
+    def _window_info(previous: int, current: int, expiry: int, now: float) -> Tuple[int, float, int, float]:
+        remaining = (1 - (now / expiry) % 1) * expiry
+        return previous, remaining if previous else 0.0, current, remaining + expiry
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        window = int(now // expiry)
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front so two workers cannot both admit the last request
+        if not self._begin_write(conn):
+            return True
+        try:
+            row = conn.execute("SELECT bucket, previous, current FROM rate_windows WHERE key = ?", (key,)).fetchone()
+            previous, current = self._roll(row, window)
+            _, previous_ttl, _, _ = self._window_info(previous, current, expiry, now)
+            if math.floor(previous * previous_ttl / expiry + current) + amount > limit:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_windows (key, bucket, previous, current, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, window, previous, current + amount, (window + 2) * expiry)
+            )
+            self._sweep(conn, now)
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        now = time.time()
+        row = self._connection().execute("SELECT bucket, previous, current FROM rate_windows WHERE key = ?", (key,)).fetchone()
+        previous, current = self._roll(row, int(now // expiry))
+        return self._window_info(previous, current, expiry, now)
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        self._connection().execute("DELETE FROM rate_windows WHERE key = ?", (key,))
+
+    # Fixed window counters, only used when rate_limit_strategy is "fixed-window"
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        conn = self._connection()
+        if not self._begin_write(conn):
+            return amount
+        try:
+            row = conn.execute("""
+                INSERT INTO rate_counters (key, count, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    count = CASE WHEN expires_at <= ? THEN excluded.count ELSE count + excluded.count END,
+                    expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END
+                RETURNING count
+            """, (key, amount, now + expiry, now, now)).fetchone()
+            self._sweep(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row[0]
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT count FROM rate_counters WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._connection().execute("SELECT expires_at FROM rate_counters WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        conn = self._connection()
+        removed = conn.execute("DELETE FROM rate_windows").rowcount
+        removed += conn.execute("DELETE FROM rate_counters").rowcount
+        return removed
+
+    def clear(self, key: str) -> None:
+        conn = self._connection()
+        conn.execute("DELETE FROM rate_windows WHERE key = ?", (key,))
+        conn.execute("DELETE FROM rate_counters WHERE key = ?", (key,))
+
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+@lru_cache(maxsize=8)
+def _api_key_scales(configured: FrozenSet[Tuple[str, float]]) -> Dict[str, float]:
+    return {hash_api_key(api_key): scale for api_key, scale in configured}
+
+
+# Configured API keys are limited per key, everything else per client IP. Unknown keys fall back to the IP
+# so a client cannot get a fresh bucket by sending random keys. Raw keys never reach the storage
+def rate_limit_key(request: Request) -> str:
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key and api_key in settings.rate_limit_api_keys:
+        return f"key:{hash_api_key(api_key)}"
+    return f"ip:{get_remote_address(request)}"
+
+
+# Multiplier applied to every route limit for this rate limit key
+def limit_scale(key: str) -> float:
+    kind, _, value = key.partition(":")
+    if kind == "key":
+        return _api_key_scales(frozenset(settings.rate_limit_api_keys.items())).get(value, 1.0)
+    return settings.rate_limit_ips.get(value, 1.0)
+
+
+# "3/minute" scaled by 10 -> "30 per 1 minute", never below one request per window
+@lru_cache(maxsize=256)
+def scale_limit(limit: str, scale: float) -> str:
+    if scale == 1.0:
+        return limit
+    return "; ".join(
+        f"{max(1, int(item.amount * scale))} per {item.multiples} {item.GRANULARITY.name}"
+        for item in parse_many(limit)
+    )
+
+
+def scaled(limit: str) -> Callable[[str], str]:
+    def provider(key: str) -> str:
+        return scale_limit(limit, limit_scale(key))
+    return provider
+
+
+# Route limits written as plain strings ("3/minute") are resolved per key, so API keys and IPs listed in
+# settings get their multiplier on every route without touching the decorators
+class ScaledLimiter(Limiter):
+
+    def limit(self, limit_value, *args, **kwargs):
+        if isinstance(limit_value, str):
+            limit_value = scaled(limit_value)
+        return super().limit(limit_value, *args, **kwargs)
+
+
+def create_limiter(storage_uri: Optional[str] = None, strategy: Optional[str] = None) -> ScaledLimiter:
+    return ScaledLimiter(
+        key_func=rate_limit_key,
+        storage_uri=storage_uri or settings.rate_limit_storage_uri,
+        strategy=strategy or settings.rate_limit_strategy,
+        # A locked or missing database degrades to per-process limits instead of failing requests
+        in_memory_fallback_enabled=True,
+    )
@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from app.config import settings
+from app.cancellation import OperationCancelled
+from app.metrics import registry
+from app.shared_cache import SharedCache
+from app.tracing import span, to_thread
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+breaker_transitions = registry.counter("circuit_breaker_transitions_total", "Circuit breaker state changes by upstream", ("upstream", "state"))
+hedged_requests = registry.counter("hedged_requests_total", "Duplicate reads sent past the latency threshold, by which copy answered first", ("upstream", "winner"))
+stale_responses = registry.counter("stale_responses_total", "Last known good values served because the upstream load failed", ("key_prefix",))
+
+# Suffix of the shared cache key holding a value's last known good copy
+STALE_SUFFIX = "|stale"
+
+
+# The upstream is not being called: its breaker is open, or the call did not finish within the upstream's timeout.
+# retry_after is when the breaker lets the next probe through
+class UpstreamUnavailable(Exception):
+    def __init__(self, upstream: str, reason: str, retry_after: float = 0.0):
+        super().__init__(f"{upstream} unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+# Client errors (bad symbol, bad request) say nothing about the upstream's health, rate limiting and server errors do
+def is_failure(e: BaseException) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+# closed -> open after failure_threshold consecutive failures, open -> half_open once reset_timeout passed, then up
+# to half_open_calls probes decide: a success closes it, a failure opens it again. Only used from the event loop
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+            self.state = state
+            breaker_transitions.inc(self.name, state)
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._transition(self.HALF_OPEN)
+            self.probes = 0
+        if self.state == self.HALF_OPEN:
+            if self.probes >= self.half_open_calls:
+                return False
+            self.probes += 1
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+    # A probe whose caller went away decides nothing, its slot goes to the next caller
+    def record_abandoned(self):
+        if self.state == self.HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def get_status(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.failures, "retry_after": round(self.retry_after(), 3)}
+
+
+# Latencies of the last `size` successful calls, the percentile is recomputed every 16 samples
+class LatencyWindow:
+    def __init__(self, size: int = 256):
+        self.samples: "deque[float]" = deque(maxlen=size)
+        self._added = 0
+        self._cached: Dict[float, float] = {}
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self._added += 1
+        if self._added % 16 == 0:
+            self._cached.clear()
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        value = self._cached.get(q)
+        if value is None:
+            ordered = sorted(self.samples)
+            value = self._cached[q] = ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)]
+        return value
+
+
+# Guard in front of one upstream client: circuit breaker, call timeout and, for idempotent reads, a hedged duplicate
+# once the first attempt runs longer than the recent p95 latency. Whichever attempt answers first wins
+class Upstream:
+    def __init__(self, name: str, timeout: Optional[float] = None, failure_threshold: Optional[int] = None,
+                 reset_timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout if timeout is not None else settings.resilience_timeouts.get(name, settings.resilience_default_timeout)
+        self.breaker = CircuitBreaker(name, failure_threshold or settings.resilience_failure_threshold,
+                                      settings.resilience_reset_timeout if reset_timeout is None else reset_timeout,
+                                      settings.resilience_half_open_calls)
+        self.latency = LatencyWindow()
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hedges = 0
+
+    # None while there are too few samples to know what slow means, or while the breaker is not closed
+    def hedge_delay(self) -> Optional[float]:
+        if not settings.resilience_hedge_enabled or self.breaker.state != CircuitBreaker.CLOSED:
+            return None
+        if len(self.latency.samples) < settings.resilience_hedge_min_samples:
+            return None
+        return max(self.latency.percentile(settings.resilience_hedge_percentile), settings.resilience_hedge_min_delay)
+
+    # make_call starts one attempt (e.g. lambda: to_thread(client.get_stock_bars, request)), it is called again for
+    # the hedge, so only pass hedge=True for reads that are safe to send twice
+    async def call(self, make_call: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise UpstreamUnavailable(self.name, "circuit open", self.breaker.retry_after())
+
+        self.calls += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self._attempts(make_call, self.hedge_delay() if hedge else None), self.timeout)
+        except (asyncio.CancelledError, OperationCancelled):
+            self.breaker.record_abandoned()
+            raise
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.breaker.record_failure()
+            raise UpstreamUnavailable(self.name, f"no answer within {self.timeout:g}s", self.breaker.retry_after())
+        except Exception as e:
+            if is_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.latency.add(time.perf_counter() - started)
+        self.breaker.record_success()
+        return result
+
+    async def _attempts(self, make_call: Callable[[], Awaitable[T]], hedge_delay: Optional[float]) -> T:
+        if hedge_delay is None:
+            return await make_call()
+
+        primary = asyncio.ensure_future(make_call())
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if done:
+                return primary.result()
+
+            self.hedges += 1
+            with span("upstream.hedge", upstream=self.name, delay_ms=round(hedge_delay * 1000, 1)):
+                pending.add(asyncio.ensure_future(make_call()))
+                error = None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for attempt in done:
+                        if attempt.exception() is None:
+                            hedged_requests.inc(self.name, "primary" if attempt is primary else "hedge")
+                            return attempt.result()
+                        error = attempt.exception()
+                raise error
+        finally:
+            # The loser keeps its worker thread until the SDK call returns, its result is dropped
+            for attempt in pending:
+                attempt.cancel()
+                attempt.add_done_callback(lambda task: task.cancelled() or task.exception())
+
+    def get_status(self) -> Dict[str, Any]:
+        p95 = self.latency.percentile(0.95)
+        return {
+            **self.breaker.get_status(),
+            "timeout": self.timeout,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1) if self.hedge_delay() is not None else None
+        }
+
+
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+# One guard per upstream name for the whole worker, shared by every service that talks to it
+def get_upstream(name: str) -> Upstream:
+    guard = _upstreams.get(name)
+    if guard is None:
+        with _upstreams_lock:
+            guard = _upstreams.setdefault(name, Upstream(name))
+    return guard
+
+
+def upstreams_status() -> Dict[str, Dict[str, Any]]:
+    return {name: guard.get_status() for name, guard in list(_upstreams.items())}
+
+
+# Ready unless a breaker of an upstream listed in settings.resilience_required_upstreams is open. Other upstreams only
+# report their state, a worker that cannot reach Gemini can still serve search and cached bars
+def breaker_readiness() -> Tuple[bool, Dict[str, Any]]:
+    status = upstreams_status()
+    open_required = [name for name in settings.resilience_required_upstreams
+                     if status.get(name, {}).get("state") == CircuitBreaker.OPEN]
+    return not open_required, {"upstreams": {name: upstream["state"] for name, upstream in status.items()}, "open_required": open_required}
+
+
+def metrics():
+    states = (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN)
+    return [("circuit_breaker_state", "gauge", "1 for the current breaker state of each upstream",
+             [({"upstream": name, "state": state}, int(guard.breaker.state == state)) for name, guard in list(_upstreams.items()) for state in states])]
+
+
+# SharedCache.get_or_load that also keeps a last known good copy for resilience_stale_ttl seconds past the entry's
+# ttl. When a load raises, or returns a value `cacheable` rejects, that copy is returned instead and the second
+# item is True. Without a copy the failure goes to the caller as it is. Keys that change over time (a time window)
+# pass a stable stale_key so the previous window's data is found
+async def get_or_load_with_fallback(key: str, ttl: float, loader: Callable[[], Awaitable[Any]],
+                                    cacheable: Callable[[Any], bool] = lambda value: value is not None,
+                                    encoded: bool = False, stale_key: Optional[str] = None) -> Tuple[Any, bool]:
+    cache = SharedCache()
+    stale_key = stale_key or key + STALE_SUFFIX
+
+    async def load_and_keep():
+        value = await loader()
+        if cacheable(value):
+            await to_thread(cache.set, stale_key, value, ttl + settings.resilience_stale_ttl)
+        return value
+
+    try:
+        value = await cache.get_or_load(key, ttl, load_and_keep, cacheable, encoded)
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        stale = await to_thread(cache.get, stale_key, False, encoded)
+        if stale is None:
+            raise
+        logger.warning(f"Serving last known good {key}: {str(e)}")
+        stale_responses.inc(_key_prefix(key))
+        return stale, True
+
+    # Encoded results were only stored when cacheable, decoded ones are checked here
+    if not encoded and not cacheable(value):
+        stale = await to_thread(cache.get, stale_key, False, encoded)
+        if stale is not None:
+            stale_responses.inc(_key_prefix(key))
+            return stale, True
+    return value, False
+
+
+# "alpaca:bars" for "alpaca:bars:AAPL:day:30:123", keeps the metric label bounded
+def _key_prefix(key: str) -> str:
+    return ":".join(key.split(":")[:2])
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.metrics import registry
+from app.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+search_channel_queries = registry.counter("search_channel_queries_total", "Search-as-you-type WebSocket queries by outcome", ("outcome",))
+
+
+# One search box over a WebSocket. Every incoming query supersedes the previous one: its debounce wait or in-flight
+# lookup is cancelled, and a result is only pushed while its query is still the latest. lookup(query, limit) returns
+# the encoded {"results": [...]} body shared with GET /tickers/search
+class SearchChannel:
+    def __init__(self, lookup: Callable[[str, int], Awaitable[bytes]], send_text: Callable[[str], Awaitable[None]],
+                 debounce: Optional[float] = None):
+        self.lookup = lookup
+        self.send_text = send_text
+        self.debounce = settings.search_channel_debounce if debounce is None else debounce
+        self.latest = 0
+        self.task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.superseded = 0
+        self.sent = 0
+
+    # Message is {"query": "aap", "limit": 10, "id": 7} (id optional, echoed back) or the bare query text
+    async def receive(self, message: str):
+        self.received += 1
+        try:
+            request = loads(message) if message.lstrip().startswith("{") else {"query": message}
+            query = str(request.get("query") or "").upper().strip()
+            limit = min(max(int(request.get("limit") or 10), 1), settings.search_channel_max_limit)
+        except (ValueError, TypeError, AttributeError) as e:
+            search_channel_queries.inc("invalid")
+            await self.send_text(dumps({"error": f"Invalid search message: {str(e)}"}).decode())
+            return
+
+        self.latest += 1
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            self.superseded += 1
+            search_channel_queries.inc("superseded")
+        self.task = asyncio.create_task(self._answer(self.latest, request.get("id"), query, limit))
+
+    async def _answer(self, seq: int, request_id: Any, query: str, limit: int):
+        try:
+            if not query:
+                body = b'{"results":[]}'
+            else:
+                await asyncio.sleep(self.debounce)
+                body = await self.lookup(query, limit)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in search channel lookup for {query}: {str(e)}")
+            search_channel_queries.inc("error")
+            body = None
+        if seq != self.latest:
+            return
+
+        # The cached body is spliced in as it is: {"id": .., "query": .., "limit": .., "results": [...]}
+        header = dumps({"id": request_id, "query": query, "limit": limit})
+        message = header[:-1] + b"," + body[1:] if body is not None else dumps({"id": request_id, "query": query, "error": "Search failed"})
+        # A newer query cancels this task, not a frame that is half written
+        await asyncio.shield(self.send_text(message.decode()))
+        self.sent += 1
+        search_channel_queries.inc("sent")
+
+    async def close(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def get_status(self) -> Dict[str, Any]:
+        return {"received": self.received, "superseded": self.superseded, "sent": self.sent}
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Types orjson and json do not know, rendered the way jsonable_encoder would
+def encode_default(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    # numpy scalars and arrays
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, default=encode_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _orjson_dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=encode_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+# name -> function returning the UTF-8 JSON document for a value, picked with settings.json_encoder
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {"json": _json_dumps}
+if orjson is not None:
+    ENCODERS["orjson"] = _orjson_dumps
+
+_dumps: Optional[Callable[[Any], bytes]] = None
+
+
+def register_encoder(name: str, encoder: Callable[[Any], bytes]):
+    global _dumps
+    ENCODERS[name] = encoder
+    _dumps = None
+
+
+def get_encoder() -> Callable[[Any], bytes]:
+    global _dumps
+    if _dumps is None:
+        name = settings.json_encoder
+        if name == "auto":
+            name = "orjson" if "orjson" in ENCODERS else "json"
+        if name not in ENCODERS:
+            raise ValueError(f"Unknown JSON encoder {name}, expected one of {sorted(ENCODERS)}")
+        _dumps = ENCODERS[name]
+    return _dumps
+
+
+# Name of the encoder get_encoder() picked, "orjson" or "json" rather than the "auto" setting
+def get_encoder_name() -> str:
+    encoder = get_encoder()
+    return next(name for name, candidate in ENCODERS.items() if candidate is encoder)
+
+
+def dumps(value: Any) -> bytes:
+    return get_encoder()(value)
+
+
+def loads(data) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+# App-wide response class. Content is encoded with the configured encoder directly, and bytes are taken as an
+# already encoded JSON document (a cache hit) and sent as they are
+class FastJSONResponse(JSONResponse):
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+# Small per-process LRU of encoded JSON documents with a TTL, for hot lookups (search-as-you-type) that are cheaper
+# to answer from memory than from the shared SQLite cache
+class EncodedCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expires_at, encoded)
+        self._entries: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> bytes:
+        encoded = value if isinstance(value, bytes) else dumps(value)
+        if self.ttl > 0 and self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (time.monotonic() + self.ttl, encoded)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return encoded
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
@@ -1,11 +1,36 @@
-from .gemini_service import GeminiService
-from .alpaca_service import AlpacaMarketService
-from .news_api_service import NewsAPIService
-from .reddit_service import RedditService
+import importlib
+
+# Exported name -> submodule, imported on first access so the Gemini and Alpaca SDKs only load when used
+_exports = {
+    "GeminiService": "gemini_service",
+    "AlpacaMarketService": "alpaca_service",
+    "NewsAPIService": "news_api_service",
+    "RedditService": "reddit_service",
+    "RedditStore": "reddit_service",
+    "ConversationSessionStore": "session_store",
+    "RetrievalService": "retrieval_service",
+    "ArticleStore": "article_store",
+    "MentionExtractor": "mention_extractor",
+    "MentionAggregator": "mention_aggregator",
+    "MarketSnapshotService": "market_snapshot"
+}
 
 __all__ = [
     "GeminiService",
     "AlpacaMarketService", 
     "NewsAPIService",
-    "RedditService"
+    "RedditService",
+    "RedditStore",
+    "ConversationSessionStore",
+    "RetrievalService",
+    "ArticleStore",
+    "MentionExtractor",
+    "MentionAggregator",
+    "MarketSnapshotService"
 ]
+
+
+def __getattr__(name):
+    if name in _exports:
+        return getattr(importlib.import_module(f".{_exports[name]}", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,20 +1,51 @@
-from typing import List, Optional, Union
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Union
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
-try:
-    from app.config import settings
-except ImportError:
-    from config import settings
-    
+from app.config import settings
+from app.cancellation import CancellationToken, OperationCancelled
+from app.shared_cache import SharedCache
+from app.metrics import instrument
+from app.tracing import to_thread
+from app.resilience import STALE_SUFFIX, get_or_load_with_fallback, get_upstream
+
+_sdk = None
+_sdk_lock = threading.Lock()
+
+# Timeframe names accepted by get_historical_bars, mapped to alpaca TimeFrame attributes once the SDK is loaded
+TIMEFRAMES = ("minute", "hour", "day")
+
+
+# `points` evenly spaced samples of `values`, first and last included, so every sparkline has the same length
+def downsample(values: List[float], points: int) -> List[float]:
+    if len(values) <= points:
+        return list(values)
+    if points < 2:
+        return values[-points:] if points > 0 else []
+    step = (len(values) - 1) / (points - 1)
+    return [values[round(i * step)] for i in range(points)]
+
 
-from alpaca.data import StockHistoricalDataClient
-from alpaca.data.requests import StockBarsRequest
-from alpaca.data.timeframe import TimeFrame
-from alpaca.trading.client import TradingClient
+# alpaca-py pulls in pandas and friends, it is imported on first use (or by the startup warm-up) rather than when
+# this module is imported
+def load_alpaca_sdk() -> SimpleNamespace:
+    global _sdk
+    if _sdk is None:
+        with _sdk_lock:
+            if _sdk is None:
+                from alpaca.data import StockHistoricalDataClient
+                from alpaca.data.requests import StockBarsRequest
+                from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
+                from alpaca.trading.client import TradingClient
+                _sdk = SimpleNamespace(StockHistoricalDataClient=StockHistoricalDataClient, StockBarsRequest=StockBarsRequest,
+                                       TimeFrame=TimeFrame, TimeFrameUnit=TimeFrameUnit, TradingClient=TradingClient)
+    return _sdk
 
 
 
+@instrument("alpaca")
 class AlpacaMarketService:
     _instance = None
 
@@ -31,62 +62,91 @@ class AlpacaMarketService:
         
             self.alpaca_api_key = settings.alpaca_api_key
             self.alpaca_secret_key = settings.alpaca_secret_key
-            self.historical_client = StockHistoricalDataClient(self.alpaca_api_key, self.alpaca_secret_key)
-            self.trading_client = TradingClient(self.alpaca_api_key, self.alpaca_secret_key)
+            # SDK clients are created on first use, see the properties below
+            self._historical_client = None
+            self._trading_client = None
+            self.shared_cache = SharedCache()
+            # Breaker, timeout and hedging for every SDK call, shared with other users of the Alpaca API in this worker
+            self.upstream = get_upstream("alpaca")
 
             # # Cache for popular stocks to avoid repeated API calls
             # self._popular_stocks_cache = None
             # self._cache_timestamp = None
             # self._cache_duration = 3600
+
+    @property
+    def historical_client(self):
+        if self._historical_client is None:
+            self._historical_client = load_alpaca_sdk().StockHistoricalDataClient(self.alpaca_api_key, self.alpaca_secret_key)
+        return self._historical_client
+
+    @historical_client.setter
+    def historical_client(self, client):
+        self._historical_client = client
+
+    @property
+    def trading_client(self):
+        if self._trading_client is None:
+            self._trading_client = load_alpaca_sdk().TradingClient(self.alpaca_api_key, self.alpaca_secret_key)
+        return self._trading_client
+
+    @trading_client.setter
+    def trading_client(self, client):
+        self._trading_client = client
     
 
+    # The asset catalog is a multi-megabyte call, fetched once per host per day and shared by every worker. While
+    # Alpaca is unavailable the last catalog that loaded is used, flagged stale
     async def fetch_all_tickers(self):
-        matches = []
         try:
-            assets = self.trading_client.get_all_assets()
-            for asset in assets:
-                    if asset.symbol and asset.name and asset.exchange.value:
-                        matches.append({
-                            'ticker': asset.symbol,
-                            'company_name': asset.name,
-                            'exchange': asset.exchange.value if hasattr(asset.exchange, 'value') else str(asset.exchange),
-                        })
-            return {"results": matches}
+            matches, stale = await self._load_assets()
+            return {"results": matches, "stale": True} if stale else {"results": matches}
             
         except Exception as e:
             print(f"Error fetching from Alpaca: {e}")
             return {"results": [], "error": str(e)}
 
+    async def _load_assets(self):
+        return await get_or_load_with_fallback("alpaca:assets", settings.alpaca_catalog_ttl, self._fetch_all_assets)
+
+    async def _fetch_all_assets(self):
+        matches = []
+        assets = await self.upstream.call(lambda: to_thread(self.trading_client.get_all_assets))
+        for asset in assets:
+                if asset.symbol and asset.name and asset.exchange.value:
+                    matches.append({
+                        'ticker': asset.symbol,
+                        'company_name': asset.name,
+                        'exchange': asset.exchange.value if hasattr(asset.exchange, 'value') else str(asset.exchange),
+                    })
+        return matches
+
 
-    # TODO: Cache feature so that I can limit API usage this when users are typing in search bar
+    # Matches from the cached asset catalog. A catalog that cannot be loaded at all raises (UpstreamUnavailable while
+    # the breaker is open) instead of looking like an empty result
     async def get_bundle_of_tickers(self, query: str, limit_payload : int = 10):
         if not query:
             return {"results": []}
 
         query = query.upper().strip()
         
-        try:
-            assets = self.trading_client.get_all_assets() # BAD FIX THIS
-            matches = []
+        assets, stale = await self._load_assets()
+        matches = []
 
-            for asset in assets:
-                if (query in asset.symbol.upper() or 
-                    (asset.name and query in asset.name.upper())):
-                    
-                    matches.append({
-                        'name': asset.name,
-                        'ticker': asset.symbol,
-                        'exchange': asset.exchange.value if hasattr(asset.exchange, 'value') else str(asset.exchange),
-                    })
-                    
-                    if len(matches) >= limit_payload:
-                        break
-            
-            return {"results": matches}
-            
-        except Exception as e:
-            print(f"Error fetching from Alpaca: {e}")
-            return {"results": [], "error": str(e)}
+        for asset in assets:
+            if (query in asset['ticker'].upper() or 
+                (asset['company_name'] and query in asset['company_name'].upper())):
+                
+                matches.append({
+                    'name': asset['company_name'],
+                    'ticker': asset['ticker'],
+                    'exchange': asset['exchange'],
+                })
+                
+                if len(matches) >= limit_payload:
+                    break
+        
+        return {"results": matches, "stale": True} if stale else {"results": matches}
 
     
 
@@ -164,51 +224,177 @@ class AlpacaMarketService:
 
 
 
-    async def get_historical_bars(self, symbol: str,
-                            timeframe: TimeFrame = TimeFrame.Day, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    # Entries live in the host wide shared cache, so clearing them refetches for every worker
+    def get_cache_status(self):
+        return self.shared_cache.get_status()
+
+    def clear_cache(self) -> int:
+        return self.shared_cache.delete_prefix("alpaca:")
+
+
+    @staticmethod
+    def bar_to_dict(bar):
+        return {
+            'timestamp': bar.timestamp,
+            'open': float(bar.open),
+            'high': float(bar.high),
+            'low': float(bar.low),
+            'close': float(bar.close),
+            'volume': int(bar.volume)
+        }
+
+
+    # Intraday ranges are pulled window by window on a worker thread so a disconnected client stops the pull between windows
+    # timeframe is one of TIMEFRAMES or an alpaca TimeFrame, symbol may be a list to get several symbols in one request
+    async def get_historical_bars(self, symbol: Union[str, List[str]],
+                            timeframe: Union[str, Any] = "day", start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            cancel_token: Optional[CancellationToken] = None):
+        sdk = load_alpaca_sdk()
+        if isinstance(timeframe, str):
+            timeframe = getattr(sdk.TimeFrame, timeframe.capitalize())
         if not start:
             start = datetime.now() - timedelta(days=30)
         if not end:
             end = datetime.now()
-        
-        request = StockBarsRequest(
-            symbol_or_symbols=symbol, 
-            timeframe=timeframe, 
-            start=start, 
-            end=end
-        )
-        
-        return self.historical_client.get_stock_bars(request)
 
+        if timeframe.unit in (sdk.TimeFrameUnit.Minute, sdk.TimeFrameUnit.Hour):
+            window = timedelta(days=max(1, settings.alpaca_bars_chunk_days))
+        else:
+            window = end - start
+
+        bars = None
+        window_start = start
+        while window_start < end:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+
+            window_end = min(window_start + window, end)
+            request = sdk.StockBarsRequest(
+                symbol_or_symbols=symbol, 
+                timeframe=timeframe, 
+                start=window_start, 
+                end=window_end
+            )
+            # Bar reads are idempotent, a window slower than the recent p95 is requested a second time
+            chunk = await self.upstream.call(lambda: to_thread(self.historical_client.get_stock_bars, request), hedge=True)
+
+            if bars is None:
+                bars = chunk
+            else:
+                for chunk_symbol, rows in chunk.data.items():
+                    bars.data.setdefault(chunk_symbol, []).extend(rows)
+            window_start = window_end
+
+        return bars
+
+
+    # Last price, change against the previous close and a close sparkline from daily bars
+    @staticmethod
+    def _snapshot(symbol: str, bars: List[Any], points: int) -> Dict[str, Any]:
+        closes = [float(bar.close) for bar in bars]
+        previous = closes[-2] if len(closes) > 1 else None
+        change = closes[-1] - previous if previous else None
+        timestamp = bars[-1].timestamp
+        return {
+            'symbol': symbol,
+            'price': closes[-1],
+            'previous_close': previous,
+            'change': round(change, 4) if change is not None else None,
+            'change_pct': round(change / previous * 100, 3) if change is not None else None,
+            'volume': int(bars[-1].volume),
+            'timestamp': timestamp.isoformat() if hasattr(timestamp, 'isoformat') else timestamp,
+            'sparkline': [round(close, 4) for close in downsample(closes, points)]
+        }
+
+    # Snapshots for a watchlist in request order. Symbols cached in the last watchlist_ttl seconds are read with one
+    # shared cache query, the rest come from one batched bars request instead of a round trip per symbol. If that
+    # request fails, symbols with a last known good snapshot get it, flagged stale
+    async def get_watchlist_snapshot(self, symbols: List[str], days: int = 30, points: int = 32,
+                                     cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        keys = {symbol: f"alpaca:snapshot:{symbol}:{days}:{points}" for symbol in symbols}
+        cached = await to_thread(self.shared_cache.get_many, list(keys.values()))
+        snapshots = {symbol: cached[key] for symbol, key in keys.items() if key in cached}
+        missing = [symbol for symbol in symbols if symbol not in snapshots]
+
+        fetched = {}
+        if missing:
+            end = datetime.now()
+            try:
+                bars = await self.get_historical_bars(missing, timeframe="day", start=end - timedelta(days=days), end=end,
+                                                      cancel_token=cancel_token)
+            except OperationCancelled:
+                raise
+            except Exception:
+                fallback = await to_thread(self.shared_cache.get_many, [keys[symbol] + STALE_SUFFIX for symbol in missing])
+                if not fallback:
+                    raise
+                snapshots.update({symbol: {**fallback[keys[symbol] + STALE_SUFFIX], 'stale': True}
+                                  for symbol in missing if keys[symbol] + STALE_SUFFIX in fallback})
+            else:
+                fetched = {symbol: self._snapshot(symbol, rows, points)
+                           for symbol, rows in (bars.data.items() if bars else ()) if rows and symbol in keys}
+                await to_thread(self.shared_cache.set_many, {keys[symbol]: value for symbol, value in fetched.items()}, settings.watchlist_ttl)
+                await to_thread(self.shared_cache.set_many, {keys[symbol] + STALE_SUFFIX: value for symbol, value in fetched.items()},
+                                settings.watchlist_ttl + settings.resilience_stale_ttl)
+                snapshots.update(fetched)
+
+        return {
+            'results': [snapshots[symbol] for symbol in symbols if symbol in snapshots],
+            'missing': [symbol for symbol in symbols if symbol not in snapshots],
+            'cached': len(symbols) - len(missing),
+            'fetched': len(fetched)
+        }
+
+
+    # Finished days never change so they are shared across workers for a day, the current day only briefly. A failed
+    # pull falls back to the last successful one, flagged stale
+    async def get_minute_prices_for_day(self, symbol: str, target_date : datetime, cancel_token: Optional[CancellationToken] = None):
+        if (type(target_date) == str):
+            try:
+                target_date = datetime.strptime(target_date, "%Y-%m-%d")
+            except ValueError as e:
+                return self._minute_prices_error(e)
+
+        ttl = settings.alpaca_closed_bars_ttl if target_date.date() < datetime.now().date() else settings.alpaca_bars_ttl
+        result, stale = await get_or_load_with_fallback(
+            f"alpaca:minute:{symbol}:{target_date.strftime('%Y-%m-%d')}", ttl,
+            lambda: self._get_minute_prices_for_day(symbol, target_date, cancel_token),
+            cacheable=lambda result: result['status'] == 'success'
+        )
+        return {**result, "stale": True} if stale else result
+
+    @staticmethod
+    def _minute_prices_error(e: Exception):
+        return {
+            'symbol': None,
+            'date': None,
+            'total_samples': 0,
+            'data': [],
+            'status': 'error',
+            'error': str(e)
+        }
 
     # TODO : a method that fetches share price of some company at some particular day for every minute (60 * 24 samples per company)
-    async def get_minute_prices_for_day(self, symbol: str, target_date : datetime):
+    async def _get_minute_prices_for_day(self, symbol: str, target_date : datetime, cancel_token: Optional[CancellationToken] = None):
         try:
-            if (type(target_date) == str):
-                target_date = datetime.strptime(target_date, "%Y-%m-%d")
-
             start_time = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
             end_time = target_date.replace(hour=23, minute=59, second=59, microsecond=999999)
             
-            request = StockBarsRequest(
+            sdk = load_alpaca_sdk()
+            request = sdk.StockBarsRequest(
                 symbol_or_symbols=symbol,
-                timeframe=TimeFrame.Minute,
+                timeframe=sdk.TimeFrame.Minute,
                 start=start_time,
                 end=end_time
             )
             
-            bars = self.historical_client.get_stock_bars(request)
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            bars = await self.upstream.call(lambda: to_thread(self.historical_client.get_stock_bars, request), hedge=True)
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
             
-            minute_data = []
-            for bar in bars[symbol]:
-                minute_data.append({
-                    'timestamp': bar.timestamp,
-                    'open': float(bar.open),
-                    'high': float(bar.high),
-                    'low': float(bar.low),
-                    'close': float(bar.close),
-                    'volume': int(bar.volume)
-                })
+            minute_data = [self.bar_to_dict(bar) for bar in bars.data.get(symbol, [])]
             
             
             return {
@@ -219,13 +405,8 @@ class AlpacaMarketService:
                 'status': 'success'
             }
             
+        except OperationCancelled:
+            raise
         except Exception as e:
             print(f"Unexpected error : {e}")
-            return {
-                'symbol': None,
-                'date': None,
-                'total_samples': 0,
-                'data': [],
-                'status': 'error',
-                'error': str(e)
-            }
\ No newline at end of file
+            return self._minute_prices_error(e)
\ No newline at end of file
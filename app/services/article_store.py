@@ -0,0 +1,352 @@
+import asyncio
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from app.config import settings
+from app.db import SQLitePool
+from app.services.mention_extractor import MentionExtractor
+
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "cmpid", "ref", "src", "ncid", "guccounter")
+# 8 bands of 8 bits: two hashes within 7 bits always share a band
+SIMHASH_BANDS = 8
+BAND_COLUMNS = [f"band{band}" for band in range(SIMHASH_BANDS)]
+
+
+# Same story behind different tracking params, fragments, hosts with www. or trailing slashes maps to one URL
+def canonicalize_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.lower().startswith(TRACKING_PARAMS))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower() or "https", host, path, urlencode(query), ""))
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha1(canonicalize_url(url).encode("utf-8")).hexdigest()
+
+
+# 64 bit SimHash over word 2-shingles, syndicated copies with small edits land within a few bits of each other
+def simhash(text: str) -> int:
+    tokens = TOKEN_RE.findall(text.lower())
+    shingles = [f"{a} {b}" for a, b in zip(tokens, tokens[1:])] or tokens
+    weights = [0] * 64
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def simhash_bands(value: int) -> List[int]:
+    width = 64 // SIMHASH_BANDS
+    return [(value >> (width * band)) & ((1 << width) - 1) for band in range(SIMHASH_BANDS)]
+
+
+# SQLite stores signed 64 bit integers
+def to_signed64(value: int) -> int:
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned64(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+# Local copy of NewsAPI articles, ingested incrementally and deduplicated so UI reads never go upstream
+class ArticleStore:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, db_file: Optional[str] = None, extractor=None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            # Anything with extract(text) -> [symbols], the shared catalog extractor unless a test passes its own
+            self.extractor = extractor or MentionExtractor()
+            self.db_file = Path(db_file or settings.news_db_file)
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            self.db_pool = SQLitePool(str(self.db_file))
+            self.max_distance = settings.news_simhash_distance
+            self.init_article_db()
+
+    def init_article_db(self):
+        with self.db_pool.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS articles (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url_hash TEXT NOT NULL UNIQUE,
+                url TEXT NOT NULL,
+                title TEXT,
+                description TEXT,
+                content TEXT,
+                author TEXT,
+                source TEXT,
+                image_url TEXT,
+                published_at TEXT,
+                ingested_at TEXT NOT NULL,
+                simhash INTEGER NOT NULL,
+                {" ".join(f"{column} INTEGER NOT NULL," for column in BAND_COLUMNS)}
+                duplicate_count INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_articles_published ON articles (published_at);
+            {" ".join(f"CREATE INDEX IF NOT EXISTS idx_articles_{column} ON articles ({column});" for column in BAND_COLUMNS)}
+
+            CREATE TABLE IF NOT EXISTS article_queries (
+                query TEXT NOT NULL,
+                article_id INTEGER NOT NULL,
+                PRIMARY KEY (query, article_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS article_tickers (
+                ticker TEXT NOT NULL,
+                published_at TEXT NOT NULL,
+                article_id INTEGER NOT NULL,
+                PRIMARY KEY (ticker, published_at, article_id)
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS ingest_state (
+                query TEXT PRIMARY KEY,
+                watermark TEXT,
+                refreshed_at TEXT,
+                resume_before TEXT,
+                pending_watermark TEXT
+            );
+            """)
+            # Stores created before the resume columns existed
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(ingest_state)")}
+            for column in ("resume_before", "pending_watermark"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE ingest_state ADD COLUMN {column} TEXT")
+            conn.commit()
+
+    @staticmethod
+    def _tag_article(conn, article_id: int, published_at: Optional[str], tickers: List[str]):
+        conn.executemany(
+            "INSERT OR IGNORE INTO article_tickers (ticker, published_at, article_id) VALUES (?, ?, ?)",
+            [(ticker, published_at or "", article_id) for ticker in tickers]
+        )
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    # Id of an already stored near-duplicate. Candidates share at least one band and were published close in time,
+    # syndicated copies of a story go out within a few days of each other
+    def _find_near_duplicate(self, conn, value: int, published_at: Optional[str]) -> Optional[int]:
+        sql = "SELECT id, simhash FROM articles WHERE (" + " OR ".join(f"{column} = ?" for column in BAND_COLUMNS) + ")"
+        args: List[Any] = simhash_bands(value)
+        if published_at:
+            published = datetime.fromisoformat(published_at.replace("Z", "+00:00"))
+            window = timedelta(days=settings.news_dedup_window_days)
+            sql += " AND published_at BETWEEN ? AND ?"
+            args += [(published - window).strftime("%Y-%m-%dT%H:%M:%SZ"), (published + window).strftime("%Y-%m-%dT%H:%M:%SZ")]
+        rows = conn.execute(sql, args).fetchall()
+        for row in rows:
+            if hamming_distance(value, to_unsigned64(row["simhash"])) <= self.max_distance:
+                return row["id"]
+        return None
+
+    def ingest(self, articles: Iterable[Dict[str, Any]], query: Optional[str] = None) -> Dict[str, Any]:
+        stats = {"inserted": 0, "url_duplicates": 0, "near_duplicates": 0, "articles": []}
+        query = self.normalize_query(query) if query else None
+        now = datetime.now(timezone.utc).isoformat()
+
+        with self.db_pool.get_connection() as conn:
+            for article in articles:
+                url = article.get("url")
+                if not url or article.get("title") == "[Removed]":
+                    continue
+
+                digest = url_hash(url)
+                existing = conn.execute("SELECT id FROM articles WHERE url_hash = ?", (digest,)).fetchone()
+                if existing is not None:
+                    stats["url_duplicates"] += 1
+                    article_id = existing["id"]
+                else:
+                    value = simhash(f"{article.get('title') or ''} {article.get('description') or ''}")
+                    article_id = self._find_near_duplicate(conn, value, article.get("publishedAt"))
+                    tickers = self.extractor.extract(f"{article.get('title') or ''}\n{article.get('description') or ''}")
+                    if article_id is not None:
+                        stats["near_duplicates"] += 1
+                        conn.execute("UPDATE articles SET duplicate_count = duplicate_count + 1 WHERE id = ?", (article_id,))
+                        # A syndicated copy may name tickers the original did not
+                        original = conn.execute("SELECT published_at FROM articles WHERE id = ?", (article_id,)).fetchone()
+                        self._tag_article(conn, article_id, original["published_at"], tickers)
+                    else:
+                        cursor = conn.execute(
+                            f"""INSERT INTO articles (url_hash, url, title, description, content, author, source, image_url, published_at,
+                                                      ingested_at, simhash, {", ".join(BAND_COLUMNS)})
+                                VALUES ({", ".join("?" * (11 + SIMHASH_BANDS))})""",
+                            (digest, url, article.get("title"), article.get("description"), article.get("content"), article.get("author"),
+                             (article.get("source") or {}).get("name"), article.get("urlToImage"), article.get("publishedAt"),
+                             now, to_signed64(value), *simhash_bands(value))
+                        )
+                        article_id = cursor.lastrowid
+                        self._tag_article(conn, article_id, article.get("publishedAt"), tickers)
+                        stats["inserted"] += 1
+                        stats["articles"].append({**article, "id": article_id, "tickers": tickers})
+
+                if query:
+                    conn.execute("INSERT OR IGNORE INTO article_queries (query, article_id) VALUES (?, ?)", (query, article_id))
+            conn.commit()
+        return stats
+
+    def get_watermark(self, query: str) -> Optional[Dict[str, Any]]:
+        with self.db_pool.get_connection() as conn:
+            row = conn.execute("SELECT watermark, refreshed_at, resume_before, pending_watermark FROM ingest_state WHERE query = ?",
+                               (self.normalize_query(query),)).fetchone()
+        return dict(row) if row else None
+
+    # resume_before and pending_watermark are set while a refresh stopped at max_pages with older articles left, and
+    # cleared once that gap is fetched
+    def set_watermark(self, query: str, watermark: Optional[str], resume_before: Optional[str] = None,
+                      pending_watermark: Optional[str] = None):
+        with self.db_pool.get_connection() as conn:
+            conn.execute(
+                """INSERT INTO ingest_state (query, watermark, refreshed_at, resume_before, pending_watermark) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(query) DO UPDATE SET watermark = COALESCE(excluded.watermark, watermark), refreshed_at = excluded.refreshed_at,
+                   resume_before = excluded.resume_before, pending_watermark = excluded.pending_watermark""",
+                (self.normalize_query(query), watermark, datetime.now(timezone.utc).isoformat(), resume_before, pending_watermark)
+            )
+            conn.commit()
+
+    def needs_refresh(self, query: str, max_age_seconds: Optional[int] = None) -> bool:
+        max_age_seconds = settings.news_cache_ttl if max_age_seconds is None else max_age_seconds
+        state = self.get_watermark(query)
+        if not state or not state["refreshed_at"]:
+            return True
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(state["refreshed_at"])
+        return age.total_seconds() > max_age_seconds
+
+    # Pulls only articles published since the stored watermark (NewsAPI `from` is inclusive, boundary items dedupe by URL).
+    # The watermark only moves once the pages ran out. A run cut off by max_pages keeps it and records the oldest
+    # article it saw, the next runs fill the gap between the two (up to `to`) before moving on to newer articles
+    async def refresh(self, news_service, query: str, page_size: Optional[int] = None, max_pages: Optional[int] = None) -> Dict[str, Any]:
+        page_size = page_size or settings.news_ingest_page_size
+        max_pages = max_pages or settings.news_ingest_max_pages
+
+        state = await asyncio.to_thread(self.get_watermark, query) or {}
+        watermark = state.get("watermark")
+        resume_before = state.get("resume_before")
+        from_date = datetime.fromisoformat(watermark.replace("Z", "+00:00")) if watermark else None
+        to_date = datetime.fromisoformat(resume_before.replace("Z", "+00:00")) if resume_before else None
+
+        totals = {"query": query, "pages": 0, "fetched": 0, "inserted": 0, "url_duplicates": 0, "near_duplicates": 0, "articles": []}
+        newest = state.get("pending_watermark") or watermark
+        oldest = None
+        caught_up = False
+        for page in range(1, max_pages + 1):
+            params = news_service.create_params(keywords=query, from_date=from_date, to_date=to_date, sortBy="publishedAt",
+                                                pageSize=page_size, page=page)
+            data = await news_service.fetch_everything(params)
+            articles = data.get("articles", [])
+            totals["pages"] += 1
+            totals["fetched"] += len(articles)
+            if not articles:
+                caught_up = True
+                break
+
+            stats = await asyncio.to_thread(self.ingest, articles, query)
+            for key in ("inserted", "url_duplicates", "near_duplicates"):
+                totals[key] += stats[key]
+            totals["articles"].extend(stats["articles"])
+
+            published = [a["publishedAt"] for a in articles if a.get("publishedAt")]
+            if published:
+                newest = max([newest, *published]) if newest else max(published)
+                oldest = min([oldest, *published]) if oldest else min(published)
+
+            # Newest first, so a page with nothing new means the rest is already stored
+            if stats["inserted"] == 0 or len(articles) < page_size:
+                caught_up = True
+                break
+
+        if caught_up:
+            await asyncio.to_thread(self.set_watermark, query, newest)
+        else:
+            await asyncio.to_thread(self.set_watermark, query, None, oldest or resume_before, newest)
+        totals["caught_up"] = caught_up
+        return totals
+
+    def list_articles(self, query: Optional[str] = None, limit: int = 20, before: Optional[str] = None) -> List[Dict[str, Any]]:
+        sql = "SELECT a.id, a.url, a.title, a.description, a.author, a.source, a.image_url, a.published_at, a.duplicate_count FROM articles a"
+        args: List[Any] = []
+        conditions = []
+        if query:
+            sql += " JOIN article_queries q ON q.article_id = a.id"
+            conditions.append("q.query = ?")
+            args.append(self.normalize_query(query))
+        if before:
+            conditions.append("a.published_at < ?")
+            args.append(before)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY a.published_at DESC LIMIT ?"
+        args.append(limit)
+
+        with self.db_pool.get_connection() as conn:
+            return [dict(row) for row in conn.execute(sql, args).fetchall()]
+
+    # Keyset pagination over the (ticker, published_at, article_id) primary key, newest first
+    def list_articles_by_ticker(self, ticker: str, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+        sql = """SELECT a.id, a.url, a.title, a.description, a.author, a.source, a.image_url, a.published_at, a.duplicate_count
+                 FROM article_tickers t JOIN articles a ON a.id = t.article_id
+                 WHERE t.ticker = ?"""
+        args: List[Any] = [ticker.upper()]
+        if cursor:
+            published_at, _, article_id = cursor.rpartition("|")
+            sql += " AND (t.published_at < ? OR (t.published_at = ? AND t.article_id < ?))"
+            args += [published_at, published_at, int(article_id)]
+        sql += " ORDER BY t.published_at DESC, t.article_id DESC LIMIT ?"
+        args.append(limit)
+
+        with self.db_pool.get_connection() as conn:
+            rows = [dict(row) for row in conn.execute(sql, args).fetchall()]
+
+        next_cursor = f"{rows[-1]['published_at'] or ''}|{rows[-1]['id']}" if len(rows) == limit else None
+        return {"ticker": ticker.upper(), "results": rows, "next_cursor": next_cursor}
+
+    # Rebuilds the whole inverted index, for when the tickers catalog changed
+    def reindex_tickers(self, extractor=None) -> int:
+        if extractor is not None:
+            self.extractor = extractor
+        tagged = 0
+        with self.db_pool.get_connection() as conn:
+            rows = conn.execute("SELECT id, title, description, published_at FROM articles").fetchall()
+            conn.execute("DELETE FROM article_tickers")
+            texts = [f"{row['title'] or ''}\n{row['description'] or ''}" for row in rows]
+            for row, tickers in zip(rows, self.extractor.extract_batch(texts)):
+                self._tag_article(conn, row["id"], row["published_at"], tickers)
+                tagged += len(tickers)
+            conn.commit()
+        return tagged
+
+    def get_status(self):
+        with self.db_pool.get_connection() as conn:
+            articles = conn.execute("SELECT COUNT(*), COALESCE(SUM(duplicate_count), 0) FROM articles").fetchone()
+            queries = conn.execute("SELECT query, watermark, refreshed_at, resume_before FROM ingest_state ORDER BY refreshed_at DESC").fetchall()
+            tags = conn.execute("SELECT COUNT(*), COUNT(DISTINCT ticker) FROM article_tickers").fetchone()
+        return {
+            "articles": articles[0],
+            "ticker_tags": tags[0],
+            "tagged_tickers": tags[1],
+            "duplicates_collapsed": articles[1],
+            "queries": [dict(row) for row in queries],
+            "db_file": str(self.db_file)
+        }
@@ -1,13 +1,13 @@
-import google.generativeai as genai
 import logging
+import threading
 from typing import List, Dict, Any, Optional, AsyncGenerator
 
-try:
-    from app.config import settings
-    from app.models import ChatMessage, UsageInfo
-except ImportError:
-    from config import settings
-    from models import ChatMessage, UsageInfo
+from app.config import settings
+from app.models import ChatMessage, UsageInfo
+from app.cancellation import CancellationToken
+from app.metrics import instrument
+from app.tracing import to_thread
+from app.resilience import UpstreamUnavailable, get_upstream
 
 import asyncio
 import json
@@ -15,25 +15,43 @@ import json
 
 logger = logging.getLogger(__name__)
 
+_genai = None
+_genai_lock = threading.Lock()
+
+
+# google.generativeai takes about a second to import, it is loaded and configured once on first use (or by the
+# startup warm-up) instead of when this module is imported
+def load_genai():
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=settings.gemini_api_key)
+                _genai = genai
+    return _genai
+
+
+@instrument("gemini")
 class GeminiService:
     def __init__(self):
-        genai.configure(api_key=settings.gemini_api_key)
         self.base_model = settings.gemini_model
+        # Generation is not idempotent, so calls get the breaker and timeout but are never hedged
+        self.upstream = get_upstream("gemini")
         
         
-    def _convert_messages_to_gemini_format(self, messages: List[ChatMessage]) -> List[Dict[str, str]]:
+    def _convert_messages_to_gemini_format(self, messages: List[ChatMessage]) -> List[Dict[str, Any]]:
         gemini_messages = []
         
         for message in messages:
-            role = message.role
+            role = message.role.value if hasattr(message.role, "value") else str(message.role)
+            content = message.content
 
             if role == "assistant":
                 role = "model"
             elif role == "system":
                 role = "user"
                 content = f"System instructions: {message.content}"
-            else:
-                content = message.content
             
 
             gemini_message = {
@@ -48,8 +66,16 @@ class GeminiService:
         return gemini_messages
 
 
+    # Converted turns for this exchange, appended to a stored session after a reply
+    def build_turns(self, messages: List[ChatMessage], response_text: str) -> List[Dict[str, Any]]:
+        turns = self._convert_messages_to_gemini_format(messages)
+        turns.append({"role": "model", "parts": [{"text": response_text}]})
+        return turns
+
+
     async def simple_chat(self, message: str, model: Optional[str] = None, temperature: Optional[float] = 0.7, max_tokens: Optional[int] = 150) -> Dict[str, Any]:
         try:
+            genai = load_genai()
             generation_config = genai.GenerationConfig(
                 temperature=temperature or 0.7,
                 max_output_tokens=max_tokens or 150,
@@ -63,7 +89,7 @@ class GeminiService:
                 generation_config=generation_config
             )
             
-            response = await asyncio.to_thread(model.generate_content, message)
+            response = await self.upstream.call(lambda: to_thread(model.generate_content, message))
             response_text = response.text if response.text else "No response generated"
             input_tokens = len(message.split()) * 1.3
             output_tokens = len(response_text.split()) * 1.3
@@ -75,20 +101,80 @@ class GeminiService:
                     prompt_tokens=int(input_tokens),
                     output_tokens=int(output_tokens),
                     total_tokens=int(input_tokens + output_tokens)
-                ),
+                ).model_dump(),
                 "model": model_name,
                 "finish_reason": "stop"
             }
 
             return response_payload
             
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Gemini API error in simple_chat: {str(e)}")
             raise Exception(f"Gemini API error: {str(e)}")
 
 
-    async def create_chat_completion(self, messages: List[ChatMessage], model: Optional[str] = None, temperature: Optional[float] = 0.7, max_tokens: Optional[int] = 150) -> Dict[str, Any]:
+    # Fans prompts out with at most `concurrency` calls in flight and `min_interval` seconds between call starts,
+    # yielding one result per prompt in completion order. Failures are reported per item instead of aborting the batch
+    async def batch_chat(self, prompts: List[Dict[str, Any]], model: Optional[str] = None, temperature: Optional[float] = 0.7, max_tokens: Optional[int] = 150,
+                         concurrency: Optional[int] = None, min_interval: Optional[float] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        concurrency = max(1, concurrency or settings.gemini_batch_concurrency)
+        min_interval = settings.gemini_batch_min_interval if min_interval is None else max(0.0, min_interval)
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        pacing_lock = asyncio.Lock()
+        next_slot = loop.time()
+
+        async def pace():
+            nonlocal next_slot
+            async with pacing_lock:
+                now = loop.time()
+                wait = next_slot - now
+                next_slot = max(now, next_slot) + min_interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        async def run(index: int, prompt: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                await pace()
+                started = loop.time()
+                try:
+                    result = await self.simple_chat(message=prompt["message"], model=model, temperature=temperature, max_tokens=max_tokens)
+                    return {
+                        "index": index,
+                        "id": prompt.get("id"),
+                        "response": result["response"],
+                        "usage": result["usage"],
+                        "model": result["model"],
+                        "latency_ms": round((loop.time() - started) * 1000, 1)
+                    }
+                except Exception as e:
+                    return {
+                        "index": index,
+                        "id": prompt.get("id"),
+                        "error": str(e),
+                        "latency_ms": round((loop.time() - started) * 1000, 1)
+                    }
+
+        tasks = [asyncio.create_task(run(i, prompt)) for i, prompt in enumerate(prompts)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            # Consumer went away (client disconnect), drop whatever has not run yet
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+    # history holds already converted prior turns (from a session), messages is then only the new delta.
+    # context is retrieved reference data, it is prepended to the current user input but never stored in the turns
+    async def create_chat_completion(self, messages: List[ChatMessage], model: Optional[str] = None, temperature: Optional[float] = 0.7, max_tokens: Optional[int] = 150,
+                                     history: Optional[List[Dict[str, Any]]] = None, context: Optional[str] = None) -> Dict[str, Any]:
         try:
+            genai = load_genai()
             generation_config = genai.GenerationConfig(
                 temperature=temperature or 0.7,
                 max_output_tokens=max_tokens or 150,
@@ -96,26 +182,28 @@ class GeminiService:
                 top_k=40
             )
             
-            model_name = model if model and model.startswith("gemini") else self.model_name
+            model_name = model if model and model.startswith("gemini") else self.base_model
             gemini_model = genai.GenerativeModel(
                 model_name=model_name,
                 generation_config=generation_config
             )
             
             # Convert messages to Gemini format
-            gemini_messages = self._convert_messages_to_gemini_format(messages)
+            gemini_messages = (history or []) + self._convert_messages_to_gemini_format(messages)
             
             # Start chat session
             chat = gemini_model.start_chat(history=gemini_messages[:-1] if len(gemini_messages) > 1 else [])
             
             # Get the last message (current user input)
             last_message = gemini_messages[-1]["parts"][0]["text"]
+            if context:
+                last_message = f"{context}\n\nUse the data above where relevant.\n\n{last_message}"
             
             # Send message and wait for response
-            response = await asyncio.to_thread(chat.send_message, last_message)
+            response = await self.upstream.call(lambda: to_thread(chat.send_message, last_message))
             response_text = response.text if response.text else "No response generated"
             
-            total_input = sum(len(msg.content.split()) for msg in messages) * 1.3
+            total_input = sum(len(part["text"].split()) for msg in gemini_messages for part in msg["parts"]) * 1.3
             output_tokens = len(response_text.split()) * 1.3
             
 
@@ -125,20 +213,26 @@ class GeminiService:
                     prompt_tokens=int(total_input),
                     output_tokens=int(output_tokens),
                     total_tokens=int(total_input + output_tokens)
-                ),
+                ).model_dump(),
                 "model": model_name,
-                "finish_reason": "stop"
+                "finish_reason": "stop",
+                "turns": self.build_turns(messages, response_text)
             }
             return response_payload
             
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Gemini API error in create_chat_completion: {str(e)}")
             raise Exception(f"Gemini API error: {str(e)}")
 
 
-    async def streaming_chat_completion(self, messages: List[ChatMessage], model: Optional[str] = None, temperature: Optional[float] = 0.7, max_tokens: Optional[int] = 150) -> AsyncGenerator[str, None]:
+    # cancel_token stops pulling chunks from Gemini once the client is gone, each chunk is read on a worker thread
+    async def streaming_chat_completion(self, messages: List[ChatMessage], model: Optional[str] = None, temperature: Optional[float] = 0.7, max_tokens: Optional[int] = 150,
+                                        history: Optional[List[Dict[str, Any]]] = None, cancel_token: Optional[CancellationToken] = None) -> AsyncGenerator[str, None]:
         
         try:
+            genai = load_genai()
             generation_config = genai.GenerationConfig(
                 temperature=temperature or 0.7,
                 max_output_tokens=max_tokens or 150,
@@ -146,22 +240,30 @@ class GeminiService:
                 top_k=40
             )
             
-            model_name = model if model and model.startswith("gemini") else self.model_name
+            model_name = model if model and model.startswith("gemini") else self.base_model
             gemini_model = genai.GenerativeModel(
                 model_name=model_name,
                 generation_config=generation_config
             )
             
-            gemini_messages = self._convert_messages_to_gemini_format(messages)
+            gemini_messages = (history or []) + self._convert_messages_to_gemini_format(messages)
             chat = gemini_model.start_chat(history=gemini_messages[:-1] if len(gemini_messages) > 1 else [])
             last_message = gemini_messages[-1]["parts"][0]["text"]
-            response = await asyncio.to_thread(chat.send_message, last_message, stream=True)
+            response = await self.upstream.call(lambda: to_thread(chat.send_message, last_message, stream=True))
+            if cancel_token and cancel_token.cancelled:
+                return
             
             # Yield chunks as they come, a generator function that returns chunks over time
-            for chunk in response:
+            iterator = iter(response)
+            while not (cancel_token and cancel_token.cancelled):
+                chunk = await to_thread(next, iterator, None)
+                if chunk is None:
+                    break
                 if chunk.text:
                     yield chunk.text 
                     
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             logger.error(f"Gemini API error in streaming_chat_completion: {str(e)}")
-            yield f"Error: {str(e)}"
+            raise Exception(f"Gemini API error: {str(e)}")
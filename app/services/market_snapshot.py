@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.serialization import dumps
+from app.shared_cache import SharedCache
+from app.tracing import to_thread
+
+logger = logging.getLogger(__name__)
+
+# Mover list -> (column it is ranked by, descending), over the symbols that pass the price and volume floors
+MOVER_LISTS: Dict[str, Tuple[str, bool]] = {
+    "gainers": ("change_pct", True),
+    "losers": ("change_pct", False),
+    "active": ("volume", True),
+    "gap_up": ("gap_pct", True),
+    "gap_down": ("gap_pct", False),
+    "unusual_volume": ("relative_volume", True),
+}
+
+# Shared cache keys: a small pointer to the latest version, and one entry per version
+LATEST_KEY = "market:snapshot:latest"
+VERSION_KEY = "market:snapshot:{version}"
+
+
+def _session(timestamp) -> str:
+    if isinstance(timestamp, str):
+        return timestamp[:10]
+    return timestamp.date().isoformat()
+
+
+def _column(values: np.ndarray, digits: int) -> List[Optional[float]]:
+    return [None if not math.isfinite(value) else round(value, digits) for value in values.tolist()]
+
+
+# Daily statistics for the whole universe in one pass over (symbols x sessions) arrays. bars maps symbol -> daily
+# bar dicts, oldest first. Symbols whose last bar is not from the latest session (halted, delisted) are left out.
+# Returns the rows by symbol and each mover list as symbols, best first
+def compute_snapshot(bars: Dict[str, List[Dict[str, Any]]], names: Dict[str, str], list_size: int, min_price: float,
+                     min_volume: float) -> Dict[str, Any]:
+    histories = {symbol: rows for symbol, rows in bars.items() if len(rows) >= 2}
+    if not histories:
+        return {"session": None, "symbols": 0, "rows": {}, "lists": {name: [] for name in MOVER_LISTS}}
+
+    sessions = {symbol: _session(rows[-1]["timestamp"]) for symbol, rows in histories.items()}
+    session = max(sessions.values())
+    symbols = [symbol for symbol in histories if sessions[symbol] == session]
+    width = max(len(histories[symbol]) for symbol in symbols)
+
+    # Right aligned so column -1 is the latest session for every symbol, shorter histories are NaN padded on the left
+    close = np.full((len(symbols), width), np.nan)
+    opens = np.full((len(symbols), width), np.nan)
+    volume = np.full((len(symbols), width), np.nan)
+    for i, symbol in enumerate(symbols):
+        rows = histories[symbol]
+        close[i, width - len(rows):] = [row["close"] for row in rows]
+        opens[i, width - len(rows):] = [row["open"] for row in rows]
+        volume[i, width - len(rows):] = [row["volume"] for row in rows]
+
+    last, previous = close[:, -1], close[:, -2]
+    last_volume = volume[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change_pct = (last / previous - 1) * 100
+        gap_pct = (opens[:, -1] / previous - 1) * 100
+        average_volume = np.nanmean(volume[:, :-1], axis=1)
+        relative_volume = last_volume / average_volume
+
+    # 1 = highest volume of the session
+    order = np.argsort(-last_volume, kind="stable")
+    volume_rank = np.empty(len(symbols), dtype=np.int64)
+    volume_rank[order] = np.arange(1, len(symbols) + 1)
+
+    columns = {"change_pct": change_pct, "gap_pct": gap_pct, "volume": last_volume, "relative_volume": relative_volume}
+    eligible = (last >= min_price) & (last_volume >= min_volume) & np.isfinite(change_pct)
+    lists = {}
+    for name, (column, descending) in MOVER_LISTS.items():
+        values = columns[column]
+        candidates = np.flatnonzero(eligible & np.isfinite(values))
+        ranked = candidates[np.argsort(-values[candidates] if descending else values[candidates], kind="stable")][:list_size]
+        lists[name] = [symbols[i] for i in ranked.tolist()]
+
+    fields = {
+        "price": _column(last, 4),
+        "previous_close": _column(previous, 4),
+        "open": _column(opens[:, -1], 4),
+        "change_pct": _column(change_pct, 3),
+        "gap_pct": _column(gap_pct, 3),
+        "volume": _column(last_volume, 0),
+        "average_volume": _column(average_volume, 0),
+        "relative_volume": _column(relative_volume, 3),
+    }
+    ranks = volume_rank.tolist()
+    rows = {
+        symbol: {"symbol": symbol, "name": names.get(symbol), **{field: values[i] for field, values in fields.items()}, "volume_rank": ranks[i]}
+        for i, symbol in enumerate(symbols)
+    }
+    return {"session": session, "symbols": len(symbols), "rows": rows, "lists": lists}
+
+
+# Market wide daily snapshot. One worker per host materializes it on a schedule (daily bars for the tickers table in
+# batches, statistics computed vectorized) and stores it as a new version in the shared cache, every worker keeps the
+# latest version in memory with its mover lists already ranked, so serving a list is a slice
+class MarketSnapshotService:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.shared_cache = SharedCache()
+            self.version: Optional[str] = None
+            self.snapshot: Optional[Dict[str, Any]] = None
+            # list -> row dicts, best first
+            self.lists: Dict[str, List[Dict[str, Any]]] = {}
+            # (list, limit) -> encoded response body for the current version
+            self._encoded: Dict[Tuple[str, int], bytes] = {}
+            self.running = False
+            self.last_run: Optional[Dict[str, Any]] = None
+
+    def publish(self, snapshot: Dict[str, Any]):
+        rows = snapshot["rows"]
+        self.lists = {name: [rows[symbol] for symbol in symbols] for name, symbols in snapshot["lists"].items()}
+        self._encoded = {}
+        self.snapshot = snapshot
+        self.version = snapshot["version"]
+
+    # Picks up a version another worker stored, returns whether this worker now serves it
+    async def load_latest(self) -> bool:
+        pointer = await to_thread(self.shared_cache.get, LATEST_KEY, False)
+        if pointer is None:
+            return False
+        if pointer["version"] != self.version:
+            snapshot = await to_thread(self.shared_cache.get, VERSION_KEY.format(version=pointer["version"]), False)
+            if snapshot is None:
+                return False
+            self.publish(snapshot)
+        return True
+
+    # Scheduled entry point: the latest stored version while it is younger than market_snapshot_interval, otherwise
+    # a new one from the worker that gets the lease. The others keep serving what they have until it is stored
+    async def refresh(self, alpaca_service, ticker_db, force: bool = False) -> Dict[str, Any]:
+        pointer = await to_thread(self.shared_cache.get, LATEST_KEY, False)
+        if not force and pointer is not None and time.time() - pointer["created_at"] < settings.market_snapshot_interval:
+            await self.load_latest()
+            return self.get_status()
+
+        owner = await to_thread(self.shared_cache.try_acquire, "market:snapshot", settings.market_snapshot_lease_seconds)
+        if owner is None:
+            await self.load_latest()
+            return self.get_status()
+        try:
+            tickers = await to_thread(ticker_db.get_all_tickers)
+            await self.materialize(alpaca_service, [(row["ticker"], row["company_name"]) for row in tickers])
+        finally:
+            await to_thread(self.shared_cache.release, "market:snapshot", owner)
+        return self.get_status()
+
+    async def materialize(self, alpaca_service, universe: List[Tuple[str, Optional[str]]]) -> Dict[str, Any]:
+        self.running = True
+        started = time.perf_counter()
+        try:
+            names = dict(universe)
+            symbols = list(names)
+            size = max(1, settings.market_snapshot_batch_size)
+            batches = [symbols[i:i + size] for i in range(0, len(symbols), size)]
+            semaphore = asyncio.Semaphore(max(1, settings.market_snapshot_concurrency))
+            end = datetime.now()
+            start = end - timedelta(days=settings.market_snapshot_lookback_days)
+            failed = []
+
+            async def fetch(batch: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+                async with semaphore:
+                    try:
+                        bars = await alpaca_service.get_historical_bars(batch, timeframe="day", start=start, end=end)
+                    except Exception as e:
+                        # One bad batch (upstream error, unknown symbol) costs its symbols, not the snapshot
+                        logger.error(f"Market snapshot batch starting at {batch[0]} failed: {str(e)}")
+                        failed.append(batch[0])
+                        return {}
+                    return {symbol: [alpaca_service.bar_to_dict(bar) for bar in rows] for symbol, rows in (bars.data.items() if bars else ())}
+
+            bars: Dict[str, List[Dict[str, Any]]] = {}
+            for result in await asyncio.gather(*(fetch(batch) for batch in batches)):
+                bars.update(result)
+            fetched = time.perf_counter()
+
+            computed = await to_thread(compute_snapshot, bars, names, settings.market_snapshot_list_size,
+                                       settings.market_movers_min_price, settings.market_movers_min_volume)
+            if not computed["symbols"]:
+                raise RuntimeError(f"No daily bars for any of {len(symbols)} symbols, keeping version {self.version}")
+
+            created_at = time.time()
+            snapshot = {"version": f"{computed['session']}.{int(created_at * 1000)}", "created_at": created_at,
+                        "universe": len(symbols), "failed_batches": len(failed), **computed}
+            retention = settings.market_snapshot_retention
+            await to_thread(self.shared_cache.set, VERSION_KEY.format(version=snapshot["version"]), snapshot, retention)
+            await to_thread(self.shared_cache.set, LATEST_KEY, {"version": snapshot["version"], "created_at": created_at}, retention)
+            self.publish(snapshot)
+
+            self.last_run = {
+                "version": snapshot["version"], "universe": len(symbols), "symbols": computed["symbols"], "batches": len(batches),
+                "failed_batches": len(failed), "fetch_seconds": round(fetched - started, 3),
+                "compute_seconds": round(time.perf_counter() - fetched, 3)
+            }
+            logger.info(f"Market snapshot {snapshot['version']}: {self.last_run}")
+            return self.last_run
+        finally:
+            self.running = False
+
+    # Encoded {"version", "session", "list", "results"} of the top `limit` rows, built once per version and limit
+    def movers(self, name: str, limit: int) -> Optional[bytes]:
+        if self.snapshot is None:
+            return None
+        key = (name, limit)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            encoded = self._encoded[key] = dumps({"version": self.version, "session": self.snapshot["session"], "list": name,
+                                                  "results": self.lists.get(name, [])[:limit]})
+        return encoded
+
+    def get_status(self) -> Dict[str, Any]:
+        snapshot = self.snapshot or {}
+        return {
+            "version": self.version,
+            "session": snapshot.get("session"),
+            "created_at": snapshot.get("created_at"),
+            "universe": snapshot.get("universe"),
+            "symbols": snapshot.get("symbols"),
+            "running": self.running,
+            "last_run": self.last_run
+        }
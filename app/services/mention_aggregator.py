@@ -0,0 +1,247 @@
+import heapq
+import math
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.db import SQLitePool
+
+
+# name -> (bucket seconds, buckets kept), 1 hour of minutes, 1 day of 5 minutes, 1 week of hours, 90 days of days
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "1m": (60, 60),
+    "5m": (300, 288),
+    "1h": (3600, 168),
+    "1d": (86400, 90),
+}
+
+WORD_RE = re.compile(r"[a-z]+")
+BULLISH_WORDS = frozenset("""beat beats bull bullish buy buying calls climb climbs gain gains growth high higher jump jumps moon outperform
+    profit profits rally rallies record rise rises soar soars strong surge surges upgrade upgraded win wins""".split())
+BEARISH_WORDS = frozenset("""bear bearish bankruptcy crash crashes cut cuts decline declines downgrade downgraded drop drops fall falls fraud
+    lawsuit layoffs loss losses low lower miss misses plunge plunges probe puts recall sell selling slump slumps weak""".split())
+
+
+# Lexicon polarity in [-1, 1], cheap enough to run on every ingested post
+def score_sentiment(text: str) -> float:
+    positive = negative = 0
+    for word in WORD_RE.findall(text.lower()):
+        if word in BULLISH_WORDS:
+            positive += 1
+        elif word in BEARISH_WORDS:
+            negative += 1
+    total = positive + negative
+    return (positive - negative) / total if total else 0.0
+
+
+# Fixed size ring of (bucket, mentions, sentiment_sum) slots. A slot belongs to the bucket stamped on it,
+# so stale slots are recycled lazily on the next write instead of by a sweeper
+class RingCounter:
+    __slots__ = ("size", "buckets", "mentions", "sentiment")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.buckets = [-1] * size
+        self.mentions = [0] * size
+        self.sentiment = [0.0] * size
+
+    def add(self, bucket: int, mentions: int, sentiment: float):
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket:
+            if self.buckets[slot] > bucket:
+                # Slot already reused by a newer bucket, the event is older than the ring
+                return
+            self.buckets[slot] = bucket
+            self.mentions[slot] = 0
+            self.sentiment[slot] = 0.0
+        self.mentions[slot] += mentions
+        self.sentiment[slot] += sentiment
+
+    def get(self, bucket: int) -> Tuple[int, float]:
+        slot = bucket % self.size
+        if self.buckets[slot] != bucket:
+            return 0, 0.0
+        return self.mentions[slot], self.sentiment[slot]
+
+
+# Per ticker ring counters at several resolutions, fed by news and Reddit ingestion and checkpointed to SQLite
+class MentionAggregator:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, db_file: Optional[str] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            # ticker -> resolution -> RingCounter
+            self.counters: Dict[str, Dict[str, RingCounter]] = {}
+            self.last_event: Dict[str, float] = {}
+            # (ticker, resolution, bucket) -> [mentions, sentiment_sum] recorded by this worker since the last checkpoint
+            self._pending: Dict[Tuple[str, str, int], List] = {}
+            self.events = 0
+            self.lock = threading.Lock()
+
+            db_file = db_file if db_file is not None else settings.mention_db_file
+            self.db_pool = None
+            if db_file:
+                Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+                self.db_pool = SQLitePool(str(db_file))
+                self.init_mention_db()
+                self.restore()
+
+    def init_mention_db(self):
+        with self.db_pool.get_connection() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS mention_rollups (
+                ticker TEXT NOT NULL,
+                resolution TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                mentions INTEGER NOT NULL,
+                sentiment_sum REAL NOT NULL,
+                PRIMARY KEY (ticker, resolution, bucket)
+            ) WITHOUT ROWID;
+            """)
+            conn.commit()
+
+    # O(1) per resolution: one slot write each
+    def record(self, ticker: str, timestamp: Optional[float] = None, sentiment: float = 0.0, mentions: int = 1):
+        now = time.time()
+        timestamp = min(timestamp or now, now)
+        with self.lock:
+            counters = self.counters.get(ticker)
+            if counters is None:
+                counters = self.counters[ticker] = {name: RingCounter(size) for name, (_, size) in RESOLUTIONS.items()}
+            for name, (seconds, _) in RESOLUTIONS.items():
+                bucket = int(timestamp // seconds)
+                counters[name].add(bucket, mentions, sentiment * mentions)
+                delta = self._pending.setdefault((ticker, name, bucket), [0, 0.0])
+                delta[0] += mentions
+                delta[1] += sentiment * mentions
+            self.last_event[ticker] = max(self.last_event.get(ticker, 0.0), timestamp)
+            self.events += mentions
+
+    # Tagged documents as produced by ingestion: {"tickers": [...], "text": str, "timestamp": epoch seconds}
+    def record_documents(self, documents: Iterable[Dict[str, Any]]) -> int:
+        recorded = 0
+        for document in documents:
+            tickers = document.get("tickers") or []
+            if not tickers:
+                continue
+            sentiment = score_sentiment(document.get("text") or "")
+            for ticker in tickers:
+                self.record(ticker, document.get("timestamp"), sentiment)
+                recorded += 1
+        return recorded
+
+    def series(self, ticker: str, resolution: str = "5m", points: int = 12, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        seconds, size = RESOLUTIONS[resolution]
+        current = int((now or time.time()) // seconds)
+        points = min(points, size)
+        with self.lock:
+            counter = (self.counters.get(ticker.upper()) or {}).get(resolution)
+            values = [counter.get(bucket) if counter else (0, 0.0) for bucket in range(current - points + 1, current + 1)]
+        return [
+            {"start": (current - points + 1 + i) * seconds, "mentions": mentions, "sentiment": round(total / mentions, 3) if mentions else None}
+            for i, (mentions, total) in enumerate(values)
+        ]
+
+    # Ranks tickers by how far the current bucket (projected to a full bucket) sits above the average of the
+    # `baseline` buckets before it, in Poisson standard deviations, so 0 -> 3 mentions does not outrank 200 -> 600
+    def trending(self, resolution: str = "5m", k: int = 10, baseline: int = 12, min_mentions: int = 3,
+                 now: Optional[float] = None) -> List[Dict[str, Any]]:
+        seconds, size = RESOLUTIONS[resolution]
+        now = now or time.time()
+        current = int(now // seconds)
+        baseline = max(1, min(baseline, size - 1))
+        # Early in a bucket the projection is mostly noise, never extrapolate more than 4x
+        elapsed = max((now - current * seconds) / seconds, 0.25)
+        oldest = (current - baseline) * seconds
+
+        scored = []
+        with self.lock:
+            for ticker, counters in self.counters.items():
+                if self.last_event.get(ticker, 0.0) < oldest:
+                    continue
+                counter = counters[resolution]
+                mentions, sentiment = counter.get(current)
+                if mentions < min_mentions:
+                    continue
+                prior = sum(counter.get(bucket)[0] for bucket in range(current - baseline, current)) / baseline
+                projected = mentions / elapsed
+                velocity = (projected - prior) / math.sqrt(prior + 1)
+                scored.append((velocity, ticker, mentions, prior, sentiment))
+
+        top = heapq.nlargest(k, scored)
+        return [
+            {"ticker": ticker, "velocity": round(velocity, 3), "mentions": mentions, "baseline_mean": round(prior, 3),
+             "sentiment": round(sentiment / mentions, 3)}
+            for velocity, ticker, mentions, prior, sentiment in top
+        ]
+
+    # Adds this worker's counts since the last checkpoint to the stored rows, so workers sharing the database do not
+    # overwrite each other, and drops rows that fell out of their ring. Deltas of a failed write are kept for the next one
+    def checkpoint(self) -> int:
+        if self.db_pool is None:
+            return 0
+        with self.lock:
+            pending, self._pending = self._pending, {}
+        rows = [(ticker, name, bucket, mentions, sentiment) for (ticker, name, bucket), (mentions, sentiment) in pending.items() if mentions]
+
+        now = time.time()
+        try:
+            with self.db_pool.get_connection() as conn:
+                conn.executemany("""
+                    INSERT INTO mention_rollups (ticker, resolution, bucket, mentions, sentiment_sum) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (ticker, resolution, bucket) DO UPDATE SET
+                        mentions = mentions + excluded.mentions,
+                        sentiment_sum = sentiment_sum + excluded.sentiment_sum
+                """, rows)
+                for name, (seconds, size) in RESOLUTIONS.items():
+                    conn.execute("DELETE FROM mention_rollups WHERE resolution = ? AND bucket <= ?", (name, int(now // seconds) - size))
+                conn.commit()
+        except Exception:
+            with self.lock:
+                for key, (mentions, sentiment) in pending.items():
+                    delta = self._pending.setdefault(key, [0, 0.0])
+                    delta[0] += mentions
+                    delta[1] += sentiment
+            raise
+        return len(rows)
+
+    def restore(self) -> int:
+        now = time.time()
+        restored = 0
+        with self.db_pool.get_connection() as conn:
+            rows = conn.execute("SELECT ticker, resolution, bucket, mentions, sentiment_sum FROM mention_rollups").fetchall()
+        with self.lock:
+            for row in rows:
+                if row["resolution"] not in RESOLUTIONS:
+                    continue
+                seconds, size = RESOLUTIONS[row["resolution"]]
+                if row["bucket"] <= int(now // seconds) - size:
+                    continue
+                counters = self.counters.get(row["ticker"])
+                if counters is None:
+                    counters = self.counters[row["ticker"]] = {name: RingCounter(n) for name, (_, n) in RESOLUTIONS.items()}
+                counters[row["resolution"]].add(row["bucket"], row["mentions"], row["sentiment_sum"])
+                bucket_end = min(now, float((row["bucket"] + 1) * seconds))
+                self.last_event[row["ticker"]] = max(self.last_event.get(row["ticker"], 0.0), bucket_end)
+                restored += 1
+        return restored
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "tickers": len(self.counters),
+                "events": self.events,
+                "dirty_buckets": len(self._pending),
+                "resolutions": {name: {"bucket_seconds": seconds, "buckets": size} for name, (seconds, size) in RESOLUTIONS.items()},
+                "persistent": self.db_pool is not None
+            }
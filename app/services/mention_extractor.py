@@ -0,0 +1,237 @@
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import settings
+from app.db import TickerDB, db_pool, DB_FILE
+
+
+# Tokens keep their offsets and an optional leading "$" so cashtags and exact casing can be checked after matching
+TEXT_TOKEN_RE = re.compile(r"(\$?)([A-Za-z0-9]+)")
+NAME_TOKEN_RE = re.compile(r"[a-z0-9]+")
+UPPER_RE = re.compile(r"[A-Z]")
+LOWER_RE = re.compile(r"[a-z]")
+
+# Symbols that are also everyday words or acronyms only count as cashtags ($IT, $ALL)
+AMBIGUOUS_SYMBOLS = frozenset("""A I AI AM AN ARE AS AT BE BIG BY CAN CEO CFO DO EPS ETF EU FED FOR GDP GO HAS HE IN IPO IS IT
+    ME MY NEW NO NOW OF OK ON ONE OR OUT SEC SO TO TWO UK UP US USA WE ALL ANY GOOD REAL TRUE FUN LOVE NICE HOPE""".split())
+NAME_SUFFIXES = frozenset("""inc incorporated corp corporation co company ltd limited plc llc lp holdings holding group sa ag nv se
+    common stock ordinary shares class a b c adr ads depositary american each representing the new""".split())
+MAX_NAME_TOKENS = 4
+MIN_NAME_CHARS = 4
+# Above this share of capital letters (shouted headlines) bare symbols are meaningless, only cashtags count
+CAPS_TEXT_RATIO = 0.6
+
+SYMBOL = "symbol"
+NAME = "name"
+
+
+def normalize_name(name: str) -> Tuple[str, ...]:
+    tokens = NAME_TOKEN_RE.findall(name.lower())
+    while tokens and tokens[-1] in NAME_SUFFIXES:
+        tokens.pop()
+    return tuple(tokens[:MAX_NAME_TOKENS])
+
+
+# Aho-Corasick automaton over word tokens instead of characters: every pattern starts and ends on a word boundary
+# by construction and a document costs one transition per token whatever the catalog size
+class AhoCorasick:
+    def __init__(self, patterns: Iterable[Tuple[str, ...]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Tuple[int, ...]] = [()]
+        self.lengths: List[int] = []
+
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for token in pattern:
+                child = self.goto[node].get(token)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][token] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                node = child
+            self.output[node] += (index,)
+            self.lengths.append(len(pattern))
+
+        # Breadth first so every failure target is finished before its dependents
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                queue.append(child)
+                target = self.fail[node]
+                while target and token not in self.goto[target]:
+                    target = self.fail[target]
+                self.fail[child] = self.goto[target].get(token, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def __len__(self):
+        return len(self.lengths)
+
+    # Yields (first_token, last_token, pattern_index) for every occurrence, overlapping ones included
+    def iter_matches(self, tokens: List[str]):
+        goto, fail, output, lengths = self.goto, self.fail, self.output, self.lengths
+        node = 0
+        for position, token in enumerate(tokens):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            for index in output[node]:
+                yield position - lengths[index] + 1, position, index
+
+
+# Compiled view of one catalog snapshot, immutable so it can be swapped in while other threads are extracting
+class MentionMatcher:
+    def __init__(self, rows: Iterable[Any]):
+        started = time.perf_counter()
+        pattern_ids: Dict[Tuple[str, ...], int] = {}
+        # pattern index -> [(symbol, kind)], a token sequence can be both a symbol and a name
+        self.entries: List[List[Tuple[str, str]]] = []
+        self.symbols = 0
+        self.names = 0
+
+        def add(pattern, symbol, kind):
+            index = pattern_ids.setdefault(pattern, len(pattern_ids))
+            if index == len(self.entries):
+                self.entries.append([])
+            # First catalog row wins for names shared by several share classes
+            if kind == NAME and any(k == NAME for _, k in self.entries[index]):
+                return False
+            self.entries[index].append((symbol, kind))
+            return True
+
+        for row in rows:
+            symbol = row["ticker"]
+            symbol_tokens = tuple(NAME_TOKEN_RE.findall(symbol.lower()))
+            if symbol_tokens:
+                self.symbols += add(symbol_tokens, symbol, SYMBOL)
+            name = normalize_name(row["company_name"] or "")
+            # Short names ("Ace", "Box") would tag half of all documents
+            if sum(len(token) for token in name) >= MIN_NAME_CHARS:
+                self.names += add(name, symbol, NAME)
+
+        self.automaton = AhoCorasick(pattern_ids)
+        self.build_seconds = time.perf_counter() - started
+
+    def extract_mentions(self, text: str) -> List[Dict[str, Any]]:
+        matches = list(TEXT_TOKEN_RE.finditer(text))
+        if not matches:
+            return []
+        tokens = [match.group(2).lower() for match in matches]
+        upper = len(UPPER_RE.findall(text))
+        shouting = upper > CAPS_TEXT_RATIO * (upper + len(LOWER_RE.findall(text)))
+
+        mentions = []
+        names = []
+        for first, last, index in self.automaton.iter_matches(tokens):
+            start, end = matches[first].start(2), matches[last].end()
+            for symbol, kind in self.entries[index]:
+                if kind == SYMBOL:
+                    cashtag = bool(matches[first].group(1))
+                    # Bare symbols must be written exactly (no "Ford" for F, no "brk b" for BRK.B) and unambiguous
+                    if not cashtag and (shouting or len(symbol) < 2 or symbol in AMBIGUOUS_SYMBOLS or text[start:end] != symbol):
+                        continue
+                    mentions.append({"symbol": symbol, "kind": "cashtag" if cashtag else SYMBOL, "start": start, "end": end})
+                # One word names ("Target", "News") must be capitalized to count
+                elif first != last or text[start].isupper():
+                    names.append((start, end, symbol))
+
+        # Leftmost longest among names so "Bank of America" does not also count as "America"
+        names.sort(key=lambda hit: (hit[0], -hit[1]))
+        covered = -1
+        for start, end, symbol in names:
+            if start >= covered:
+                mentions.append({"symbol": symbol, "kind": NAME, "start": start, "end": end})
+                covered = end
+        return mentions
+
+    def extract(self, text: str) -> List[str]:
+        return sorted({mention["symbol"] for mention in self.extract_mentions(text)})
+
+    # Syndicated copies repeat the same text, so identical documents in a batch are only scanned once
+    def extract_batch(self, texts: Iterable[str]) -> List[List[str]]:
+        seen: Dict[str, List[str]] = {}
+        results = []
+        for text in texts:
+            found = seen.get(text)
+            if found is None:
+                found = seen[text] = self.extract(text or "")
+            results.append(found)
+        return results
+
+
+# Shared extractor over the tickers table, recompiled when the catalog changes
+class MentionExtractor:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, ticker_db: Optional[TickerDB] = None, check_interval: Optional[float] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.ticker_db = ticker_db or TickerDB(db_pool, DB_FILE)
+            self.check_interval = check_interval if check_interval is not None else settings.mention_catalog_check_interval
+            self.matcher: Optional[MentionMatcher] = None
+            self.catalog_version = None
+            self.checked_at = 0.0
+            self.rebuilds = 0
+            self.documents = 0
+            self.lock = threading.Lock()
+
+    # Cheap catalog fingerprint checked at most every `check_interval` seconds, the check and rebuild run in one
+    # caller under the lock. Callers arriving meanwhile keep using the old matcher until the new one is swapped in,
+    # only the very first build (or a forced one) is waited for
+    def refresh(self, force: bool = False) -> MentionMatcher:
+        now = time.monotonic()
+        if self.matcher is not None and not force and now - self.checked_at < self.check_interval:
+            return self.matcher
+
+        if not self.lock.acquire(blocking=self.matcher is None or force):
+            return self.matcher
+        try:
+            if self.matcher is not None and not force and now - self.checked_at < self.check_interval:
+                return self.matcher
+            version = self.ticker_db.get_catalog_version()
+            if force or self.matcher is None or version != self.catalog_version:
+                self.matcher = MentionMatcher(self.ticker_db.get_all_tickers())
+                self.catalog_version = version
+                self.rebuilds += 1
+            self.checked_at = now
+            return self.matcher
+        finally:
+            self.lock.release()
+
+    def extract_mentions(self, text: str) -> List[Dict[str, Any]]:
+        self.documents += 1
+        return self.refresh().extract_mentions(text)
+
+    def extract(self, text: str) -> List[str]:
+        self.documents += 1
+        return self.refresh().extract(text)
+
+    def extract_batch(self, texts: List[str]) -> List[List[str]]:
+        self.documents += len(texts)
+        return self.refresh().extract_batch(texts)
+
+    def get_status(self):
+        matcher = self.matcher
+        return {
+            "compiled": matcher is not None,
+            "patterns": len(matcher.automaton) if matcher else 0,
+            "symbols": matcher.symbols if matcher else 0,
+            "names": matcher.names if matcher else 0,
+            "states": len(matcher.automaton.goto) if matcher else 0,
+            "build_seconds": round(matcher.build_seconds, 3) if matcher else None,
+            "catalog_version": self.catalog_version,
+            "rebuilds": self.rebuilds,
+            "documents": self.documents
+        }
@@ -1,59 +1,227 @@
 from pydantic import BaseModel
 from datetime import date
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+from collections import OrderedDict
 
 
-try:
-    from app.config import settings
-except ImportError:
-    from config import settings
+from app.config import settings
+from app.metrics import instrument
+from app.resilience import get_upstream
 
-import requests
+import asyncio
+import time
+import httpx
 
 
 # BaseModel - building block for defining data structures and enforcing data validation (may refactor all services to it)
+@instrument("newsapi")
 class NewsAPIService:
-    def __init__(self):
-        load_dotenv(dotenv_path="../.env.newsapi")
-        self.api_key = settings.news_api_key
-        self.everything_url = settings.news_everything_url
-        self.headlines_url = settings.news_headlines_url
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            load_dotenv(dotenv_path="../.env.newsapi")
+            self.api_key = settings.news_api_key
+            self.everything_url = settings.news_everything_url
+            self.headlines_url = settings.news_headlines_url
+
+            # One keep-alive client per event loop, created on first use
+            self._transport = transport
+            self._client: Optional[httpx.AsyncClient] = None
+            self._client_loop = None
+
+            # (url, normalized params) -> {"data", "etag", "last_modified", "fetched_at"}, least recently used first
+            self._cache: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+            self._inflight: Dict[Tuple, asyncio.Future] = {}
+            self.cache_ttl = settings.news_cache_ttl
+            self.cache_max_entries = settings.news_cache_max_entries
+            self.cache_hits = 0
+            self.cache_revalidations = 0
+            self.cache_misses = 0
+            self.stale_hits = 0
+            # Breaker and timeout for NewsAPI, GETs are hedged past the recent p95
+            self.upstream = get_upstream("newsapi")
         
     def create_params(self, keywords : Optional[str] = "news", 
                                     from_date : Optional[date] = None,
+                                    to_date : Optional[date] = None,
                                     sortBy : Optional[str] = "popularity",
-                                    pageSize : Optional[int] = 10):
+                                    pageSize : Optional[int] = 10,
+                                    page : Optional[int] = None):
         params = {
-            "apiKey" : self.api_key,
             "q" : keywords,
             "from": from_date.isoformat() if from_date else None,
+            "to": to_date.isoformat() if to_date else None,
             "sortBy" : sortBy,
             "language" : "en",
-            "pageSize" : pageSize
+            "pageSize" : pageSize,
+            "page" : page
         }
 
         # Remove 'v' if None
         params = {k : v for k, v in params.items() if v is not None}
 
         return params
+
+    def create_headline_params(self, keywords : Optional[str] = None,
+                                     country : Optional[str] = "us",
+                                     category : Optional[str] = None,
+                                     pageSize : Optional[int] = 10,
+                                     page : Optional[int] = None):
+        params = {
+            "q" : keywords,
+            "country" : country,
+            "category" : category,
+            "pageSize" : pageSize,
+            "page" : page
+        }
+        return {k : v for k, v in params.items() if v is not None}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            # The key goes in a header so it never ends up in URLs, logs or cache keys
+            self._client = httpx.AsyncClient(
+                headers={"X-Api-Key": self.api_key},
+                timeout=settings.news_timeout,
+                limits=httpx.Limits(max_connections=settings.news_max_connections, max_keepalive_connections=settings.news_max_connections),
+                transport=self._transport
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    @staticmethod
+    def _cache_key(url: str, params: Dict[str, Any]) -> Tuple:
+        return (url, tuple(sorted((k, str(v)) for k, v in params.items() if k.lower() != "apikey" and v is not None)))
+
+    def _store(self, key: Tuple, response: httpx.Response) -> Dict[str, Any]:
+        entry = {
+            "data": response.json(),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.monotonic()
+        }
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def _request(self, url: str, key: Tuple, params: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self._cache.get(key)
+        headers = {}
+        if entry is not None:
+            # Stale entry, ask upstream whether it changed instead of downloading it again
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        async def fetch():
+            response = await self._get_client().get(url, params=params, headers=headers)
+            if response.status_code != 304:
+                response.raise_for_status() # Throw exception
+            return response
+
+        try:
+            response = await self.upstream.call(fetch, hedge=True)
+        except Exception:
+            # Upstream down or breaker open, the expired copy is better than nothing
+            if entry is None:
+                raise
+            self.stale_hits += 1
+            return {**entry["data"], "stale": True}
+
+        if response.status_code == 304 and entry is not None:
+            self.cache_revalidations += 1
+            entry["fetched_at"] = time.monotonic()
+            self._cache.move_to_end(key)
+            return entry["data"]
+
+        self.cache_misses += 1
+        return self._store(key, response)["data"]
+
+    async def _get(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        params = {k: v for k, v in params.items() if k.lower() != "apikey"}
+        key = self._cache_key(url, params)
+
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() - entry["fetched_at"] < self.cache_ttl:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return entry["data"]
+
+        # Identical concurrent requests share a single upstream call. It runs as a task of its own, so a caller that
+        # disconnects stops waiting for it without cancelling it for the others, and its answer still fills the cache
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._request(url, key, params))
+            task.add_done_callback(lambda done: self._finish_inflight(key, done))
+        return await asyncio.shield(task)
+
+    def _finish_inflight(self, key: Tuple, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark retrieved so a failure nobody else awaited does not log "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
     
     # Dict[str, Any] -> dictionary key from the parameters and Any being all other json parameters
     async def fetch_everything(self, params : Dict[str, Any]):
-        response = requests.get(self.everything_url, params=params)
-        response.raise_for_status() # Throw exception
-        return response.json()
+        return await self._get(self.everything_url, params)
 
     async def fetch_headlines(self, params):
-        response = requests.get(self.headlines_url, params=params)
-        response.raise_for_status() # Throw exception
-        return response.json()
+        return await self._get(self.headlines_url, params)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def get_cache_status(self):
+        return {
+            "entries": len(self._cache),
+            "max_entries": self.cache_max_entries,
+            "ttl_seconds": self.cache_ttl,
+            "hits": self.cache_hits,
+            "revalidations": self.cache_revalidations,
+            "misses": self.cache_misses,
+            "stale": self.stale_hits,
+            "pooled_client": self._client is not None and not self._client.is_closed
+        }
+
+    # Connections held by the keep-alive client, idle ones included
+    def get_pool_status(self):
+        connections = []
+        if self._client is not None and not self._client.is_closed:
+            pool = getattr(self._client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+        return {
+            "max_connections": settings.news_max_connections,
+            "connections": len(connections),
+            "idle": sum(1 for connection in connections if connection.is_idle())
+        }
         
 
 if __name__ == "__main__":
-    news = NewsAPIService()
-    params = news.create_params()
-    print(news.fetch_everything(params=params))
+    async def main():
+        news = NewsAPIService()
+        params = news.create_params()
+        print(await news.fetch_everything(params=params))
+        await news.aclose()
+
+    asyncio.run(main())
+    
     
     
-    
\ No newline at end of file
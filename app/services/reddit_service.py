@@ -1,4 +1,469 @@
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+import httpx
+
+from app.config import settings
+from app.db import SQLitePool
+from app.services.mention_extractor import MentionExtractor
+from app.services.mention_aggregator import MentionAggregator
+
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r"\s+")
+REMOVED_BODIES = ("[deleted]", "[removed]")
+# Short replies ("to the moon") legitimately repeat, only longer copy-pasted texts are treated as duplicates
+MIN_CONTENT_DEDUPE_CHARS = 40
+# Marks the end of a stage's input, each downstream worker gets one
+DONE = object()
+
+
+def clean_text(text: Optional[str]) -> str:
+    if not text or text in REMOVED_BODIES:
+        return ""
+    return WHITESPACE_RE.sub(" ", html.unescape(text)).strip()
+
+
+# Reddit listing child ({"kind": "t3" | "t1", "data": {...}}) -> flat post/comment record, None when there is no text
+def normalize_item(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    data = raw.get("data") or {}
+    kind = raw.get("kind") or ("t1" if "body" in data else "t3")
+    if kind not in ("t1", "t3") or not data.get("id"):
+        return None
+
+    is_post = kind == "t3"
+    title = clean_text(data.get("title") if is_post else "")
+    body = clean_text(data.get("selftext") if is_post else data.get("body"))
+    if not title and not body:
+        return None
+
+    return {
+        "id": data.get("name") or f"{kind}_{data['id']}",
+        "kind": "post" if is_post else "comment",
+        "subreddit": data.get("subreddit"),
+        "author": data.get("author"),
+        "title": title,
+        "body": body,
+        "created_utc": int(data.get("created_utc") or 0),
+        "score": int(data.get("score") or 0),
+        "permalink": data.get("permalink"),
+        "parent_id": None if is_post else data.get("link_id")
+    }
+
+
+# Public JSON listings, one feed per (subreddit, listing) paged with Reddit's `after` cursor
+class RedditAPISource:
+    def __init__(self, subreddits: Optional[Iterable[str]] = None, listings: Iterable[str] = ("new", "comments"),
+                 page_limit: Optional[int] = None, transport: Optional[httpx.AsyncBaseTransport] = None):
+        subreddits = subreddits or settings.reddit_subreddits.split(",")
+        self.subreddits = [subreddit.strip() for subreddit in subreddits if subreddit.strip()]
+        self.listings = list(listings)
+        self.page_limit = page_limit or settings.reddit_page_limit
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def feeds(self) -> List[Tuple[str, str]]:
+        return [(subreddit, listing) for subreddit in self.subreddits for listing in self.listings]
+
+    async def fetch_page(self, feed: Tuple[str, str], after: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=settings.reddit_base_url,
+                headers={"User-Agent": settings.reddit_user_agent},
+                timeout=10.0,
+                transport=self._transport
+            )
+        subreddit, listing = feed
+        params = {"limit": self.page_limit, "raw_json": 1}
+        if after:
+            params["after"] = after
+        response = await self._client.get(f"/r/{subreddit}/{listing}.json", params=params)
+        response.raise_for_status()
+        data = response.json().get("data") or {}
+        return data.get("children") or [], data.get("after")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Replays saved listings so the pipeline runs without the network. A path is a file or a directory of them:
+# .json holds one listing or a list of listings (pages), .jsonl holds one child per line
+class FileRedditSource:
+    def __init__(self, path: str, page_limit: Optional[int] = None, delay: float = 0.0):
+        self.path = Path(path)
+        self.page_limit = page_limit or settings.reddit_page_limit
+        self.delay = delay
+        self._pages: Dict[str, List[Dict[str, Any]]] = {}
+
+    def feeds(self) -> List[str]:
+        if self.path.is_dir():
+            return [str(p) for p in sorted(self.path.iterdir()) if p.suffix in (".json", ".jsonl")]
+        return [str(self.path)]
+
+    def _load(self, feed: str) -> List[Dict[str, Any]]:
+        path = Path(feed)
+        if path.suffix == ".jsonl":
+            children = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+            return [{"data": {"children": children[i:i + self.page_limit]}} for i in range(0, len(children), self.page_limit)]
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return data if isinstance(data, list) else [data]
+
+    async def fetch_page(self, feed: str, after: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if feed not in self._pages:
+            self._pages[feed] = await asyncio.to_thread(self._load, feed)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        pages = self._pages[feed]
+        index = int(after or 0)
+        children = (pages[index].get("data") or {}).get("children") or [] if index < len(pages) else []
+        return children, str(index + 1) if index + 1 < len(pages) else None
+
+    async def aclose(self):
+        self._pages.clear()
+
+
+# Posts, comments and their ticker mentions
+class RedditStore:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, db_file: Optional[str] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.db_file = Path(db_file or settings.reddit_db_file)
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            self.db_pool = SQLitePool(str(self.db_file))
+            self.init_reddit_db()
+
+    def init_reddit_db(self):
+        with self.db_pool.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS reddit_posts (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                subreddit TEXT,
+                author TEXT,
+                title TEXT,
+                body TEXT,
+                created_utc INTEGER NOT NULL,
+                score INTEGER,
+                permalink TEXT,
+                parent_id TEXT,
+                ingested_at TEXT NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS reddit_mentions (
+                ticker TEXT NOT NULL,
+                created_utc INTEGER NOT NULL,
+                post_id TEXT NOT NULL,
+                PRIMARY KEY (ticker, created_utc, post_id)
+            ) WITHOUT ROWID;
+            """)
+            conn.commit()
+
+    # Returns the records that were new, ids already stored from earlier runs are skipped
+    def write(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        now = datetime.now(timezone.utc).isoformat()
+        inserted = []
+        with self.db_pool.get_connection() as conn:
+            for item in items:
+                cursor = conn.execute(
+                    """INSERT OR IGNORE INTO reddit_posts (id, kind, subreddit, author, title, body, created_utc, score, permalink,
+                                                          parent_id, ingested_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (item["id"], item["kind"], item["subreddit"], item["author"], item["title"], item["body"], item["created_utc"],
+                     item["score"], item["permalink"], item["parent_id"], now)
+                )
+                if cursor.rowcount:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO reddit_mentions (ticker, created_utc, post_id) VALUES (?, ?, ?)",
+                        [(ticker, item["created_utc"], item["id"]) for ticker in item.get("tickers", [])]
+                    )
+                    inserted.append(item)
+            conn.commit()
+        return inserted
+
+    # Newest first, the cursor is "created_utc|post_id" of the last row of the previous page
+    def list_by_ticker(self, ticker: str, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+        sql = """SELECT p.id, p.kind, p.subreddit, p.author, p.title, p.body, p.created_utc, p.score, p.permalink
+                 FROM reddit_mentions m JOIN reddit_posts p ON p.id = m.post_id
+                 WHERE m.ticker = ?"""
+        args: List[Any] = [ticker.upper()]
+        if cursor:
+            created_utc, _, post_id = cursor.partition("|")
+            sql += " AND (m.created_utc < ? OR (m.created_utc = ? AND m.post_id < ?))"
+            args += [int(created_utc), int(created_utc), post_id]
+        sql += " ORDER BY m.created_utc DESC, m.post_id DESC LIMIT ?"
+        args.append(limit)
+
+        with self.db_pool.get_connection() as conn:
+            rows = [dict(row) for row in conn.execute(sql, args).fetchall()]
+
+        next_cursor = f"{rows[-1]['created_utc']}|{rows[-1]['id']}" if len(rows) == limit else None
+        return {"ticker": ticker.upper(), "results": rows, "next_cursor": next_cursor}
+
+    def get_status(self):
+        with self.db_pool.get_connection() as conn:
+            posts = conn.execute("SELECT COUNT(*), MAX(created_utc) FROM reddit_posts").fetchone()
+            mentions = conn.execute("SELECT COUNT(*), COUNT(DISTINCT ticker) FROM reddit_mentions").fetchone()
+        return {
+            "posts": posts[0],
+            "newest_created_utc": posts[1],
+            "mentions": mentions[0],
+            "tickers": mentions[1],
+            "db_file": str(self.db_file)
+        }
+
+
+# Records the high water mark so a stage that cannot keep up shows even after the queue drained
+class MonitoredQueue(asyncio.Queue):
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.max_depth = 0
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        if item is not DONE:
+            self.max_depth = max(self.max_depth, self.qsize())
+
+    def get_stats(self):
+        return {"depth": self.qsize(), "max_depth": self.max_depth, "capacity": self.maxsize}
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.batches = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    def get_stats(self, elapsed: float):
+        elapsed = max(elapsed, 1e-9)
+        return {
+            "workers": self.workers,
+            "batches": self.batches,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "errors": self.errors,
+            "items_per_second": round(self.items_out / elapsed, 1),
+            # Share of wall time the stage's workers spent working rather than waiting on their queues
+            "utilization": round(self.busy_seconds / (elapsed * self.workers), 3)
+        }
+
+
+# fetch -> normalize -> extract -> dedupe -> store, each stage a pool of workers between bounded queues so a slow
+# stage applies backpressure upstream instead of buffering the whole subreddit in memory
 class RedditService:
-    def __init__(self):
-        pass
\ No newline at end of file
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, store: Optional[RedditStore] = None, extractor=None, aggregator: Optional[MentionAggregator] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.store = store or RedditStore()
+            self.extractor = extractor or MentionExtractor()
+            self.aggregator = aggregator or MentionAggregator()
+            self.queue_size = settings.reddit_queue_size
+            self.batch_size = settings.reddit_batch_size
+            self.workers = {
+                "fetch": settings.reddit_fetch_workers,
+                "normalize": settings.reddit_normalize_workers,
+                "extract": settings.reddit_extract_workers,
+                "dedupe": 1,
+                "store": 1
+            }
+            # Recently seen ids and content hashes, survives between runs of the same worker
+            self._seen: "OrderedDict[str, None]" = OrderedDict()
+            self.dedupe_window = settings.reddit_dedupe_window
+
+            self.running = False
+            self._run: Optional[Dict[str, Any]] = None
+            self.last_run: Optional[Dict[str, Any]] = None
+
+    def create_source(self, subreddits: Optional[Iterable[str]] = None):
+        if settings.reddit_fixture_path:
+            return FileRedditSource(settings.reddit_fixture_path)
+        return RedditAPISource(subreddits)
+
+    async def run(self, source=None, max_pages: Optional[int] = None) -> Dict[str, Any]:
+        if self.running:
+            raise RuntimeError("Reddit ingestion is already running")
+        self.running = True
+        source = source or self.create_source()
+        max_pages = max_pages or settings.reddit_max_pages
+
+        queues = {name: MonitoredQueue(self.queue_size) for name in ("raw", "normalized", "extracted", "unique")}
+        stages = {name: StageStats(name, workers) for name, workers in self.workers.items()}
+        self._run = {"started": time.perf_counter(), "queues": queues, "stages": stages}
+
+        tasks = [
+            asyncio.create_task(self._fetch_stage(source, queues["raw"], stages["fetch"], max_pages, self.workers["normalize"])),
+            asyncio.create_task(self._stage(stages["normalize"], queues["raw"], queues["normalized"], self._normalize, self.workers["extract"])),
+            asyncio.create_task(self._stage(stages["extract"], queues["normalized"], queues["extracted"], self._extract, self.workers["dedupe"])),
+            asyncio.create_task(self._stage(stages["dedupe"], queues["extracted"], queues["unique"], self._dedupe, self.workers["store"])),
+            asyncio.create_task(self._stage(stages["store"], queues["unique"], None, self._store, 0)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # A failing stage would leave its neighbours blocked on full or empty queues forever
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await source.aclose()
+            self.last_run = self.get_run_stats()
+            self._run = None
+            self.running = False
+        return self.last_run
+
+    async def _fetch_stage(self, source, outbox: MonitoredQueue, stats: StageStats, max_pages: int, downstream: int):
+        feeds: asyncio.Queue = asyncio.Queue()
+        for feed in source.feeds():
+            feeds.put_nowait(feed)
+
+        async def worker():
+            while not feeds.empty():
+                feed = feeds.get_nowait()
+                after = None
+                for _ in range(max_pages):
+                    started = time.perf_counter()
+                    try:
+                        children, after = await source.fetch_page(feed, after)
+                    except Exception as e:
+                        stats.errors += 1
+                        logger.error(f"Error fetching reddit feed {feed}: {str(e)}")
+                        break
+                    finally:
+                        stats.busy_seconds += time.perf_counter() - started
+                    stats.batches += 1
+                    stats.items_in += len(children)
+                    for child in children:
+                        await outbox.put(child)
+                        stats.items_out += 1
+                    if not after:
+                        break
+
+        await asyncio.gather(*(worker() for _ in range(stats.workers)))
+        for _ in range(downstream):
+            await outbox.put(DONE)
+
+    # Workers drain up to batch_size items at a time and exit on their DONE marker, once all of them are done
+    # one marker per downstream worker is forwarded
+    async def _stage(self, stats: StageStats, inbox: MonitoredQueue, outbox: Optional[MonitoredQueue], handler, downstream: int):
+        async def worker():
+            done = False
+            while not done:
+                batch = []
+                item = await inbox.get()
+                while True:
+                    if item is DONE:
+                        done = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size or inbox.empty():
+                        break
+                    item = inbox.get_nowait()
+                if not batch:
+                    continue
+
+                started = time.perf_counter()
+                try:
+                    results = await handler(batch)
+                except Exception as e:
+                    stats.errors += 1
+                    logger.error(f"Error in reddit {stats.name} stage: {str(e)}")
+                    results = []
+                stats.busy_seconds += time.perf_counter() - started
+                stats.batches += 1
+                stats.items_in += len(batch)
+                stats.items_out += len(results)
+                if outbox is not None:
+                    for result in results:
+                        await outbox.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(stats.workers)))
+        for _ in range(downstream):
+            await outbox.put(DONE)
+
+    async def _normalize(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [item for item in map(normalize_item, batch) if item is not None]
+
+    async def _extract(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        texts = [f"{item['title']}\n{item['body']}" for item in batch]
+        for item, tickers in zip(batch, await asyncio.to_thread(self.extractor.extract_batch, texts)):
+            item["tickers"] = tickers
+        return batch
+
+    def _remember(self, key: str) -> bool:
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self.dedupe_window:
+            self._seen.popitem(last=False)
+        return True
+
+    async def _dedupe(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        unique = []
+        for item in batch:
+            if not self._remember(item["id"]):
+                continue
+            text = f"{item['title']} {item['body']}".lower()
+            if len(text) >= MIN_CONTENT_DEDUPE_CHARS and not self._remember(hashlib.sha1(text.encode("utf-8")).hexdigest()):
+                continue
+            unique.append(item)
+        return unique
+
+    # Only newly stored records reach the rolling counters, so re-ingesting a page never double counts
+    async def _store(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        inserted = await asyncio.to_thread(self.store.write, batch)
+        # Sentiment scoring is CPU work and the counters share a lock with the checkpoint thread, kept off the event loop
+        await asyncio.to_thread(self.aggregator.record_documents, [
+            {"tickers": item["tickers"], "text": f"{item['title']} {item['body']}", "timestamp": item["created_utc"]} for item in inserted
+        ])
+        return inserted
+
+    def get_run_stats(self) -> Optional[Dict[str, Any]]:
+        run = self._run
+        if run is None:
+            return None
+        elapsed = time.perf_counter() - run["started"]
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "stages": {name: stage.get_stats(elapsed) for name, stage in run["stages"].items()},
+            "queues": {name: queue.get_stats() for name, queue in run["queues"].items()}
+        }
+
+    def get_status(self):
+        return {
+            "running": self.running,
+            "current_run": self.get_run_stats(),
+            "last_run": self.last_run,
+            "store": self.store.get_status()
+        }
@@ -0,0 +1,365 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import settings
+
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Filler words plus catalog boilerplate ("Common Stock", "Ordinary Shares", ...) that would otherwise dominate short documents
+STOPWORDS = frozenset("""a an and are about as at be by for from how in is it of on or the to what whats with going tell me
+    common stock inc corp corporation ordinary shares ltd listed class co plc holdings group sa ag nv""".split())
+
+
+# Deterministic feature hashing embedder (unigrams + bigrams), no model download and stable across processes
+class HashingEmbedder:
+    name = "hashing"
+    # Similarity is purely lexical, a hit without any shared term can only be a hash collision
+    lexical = True
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        tokens = [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                vectors[row, h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+# Gemini text embeddings, better recall on short catalog entries at the cost of upstream calls while indexing
+class GeminiEmbedder:
+    name = "gemini"
+    lexical = False
+    batch_size = 100
+
+    def __init__(self, model: str = "models/text-embedding-004", dim: int = 768):
+        import google.generativeai as genai
+
+        genai.configure(api_key=settings.gemini_api_key)
+        self.genai = genai
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            result = self.genai.embed_content(model=self.model, content=batch, task_type="retrieval_document")
+            rows.extend(result["embedding"])
+
+        vectors = np.asarray(rows, dtype=np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+def create_embedder(name: Optional[str] = None):
+    name = name or settings.retrieval_embedder
+    if name == "gemini":
+        return GeminiEmbedder()
+    return HashingEmbedder(settings.retrieval_dim)
+
+
+# Cosine similarity index over L2 normalized vectors, brute force by default with optional IVF partitioning
+class VectorIndex:
+    def __init__(self, dim: int, embedder: str = "hashing"):
+        self.dim = dim
+        self.embedder = embedder
+        # Rows beyond len(ids) are spare capacity so incremental adds are amortized O(dim)
+        self._buffer = np.zeros((0, dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.id_to_row: Dict[str, int] = {}
+
+        # IVF state, centroids is None while the index is brute force only
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._buffer[:len(self.ids)]
+
+    def _reserve(self, rows: int):
+        if rows > len(self._buffer):
+            grown = np.zeros((max(rows, 2 * len(self._buffer), 64), self.dim), dtype=np.float32)
+            grown[:len(self.ids)] = self.vectors
+            self._buffer = grown
+
+    def _nearest_centroids(self, vectors: np.ndarray, n: int = 1) -> np.ndarray:
+        scores = vectors @ self.centroids.T
+        if n == 1:
+            return np.argmax(scores, axis=1)
+        return np.argsort(-scores, axis=1)[:, :n]
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray, metadata: Sequence[Dict[str, Any]]):
+        # Upsert, existing ids are replaced
+        self.delete([doc_id for doc_id in ids if doc_id in self.id_to_row])
+
+        start = len(self.ids)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        self._reserve(start + len(vectors))
+        self._buffer[start:start + len(vectors)] = vectors
+        self.ids.extend(ids)
+        self.metadata.extend(metadata)
+        for offset, doc_id in enumerate(ids):
+            self.id_to_row[doc_id] = start + offset
+
+        if self.centroids is not None:
+            self.assignments = np.concatenate([self.assignments, self._nearest_centroids(vectors).astype(np.int32)])
+
+    def delete(self, ids: Iterable[str]) -> int:
+        rows = sorted((self.id_to_row[doc_id] for doc_id in ids if doc_id in self.id_to_row), reverse=True)
+        for row in rows:
+            # Swap the last row into the hole so deletes stay O(dim)
+            last = len(self.ids) - 1
+            removed_id = self.ids[row]
+            if row != last:
+                self._buffer[row] = self._buffer[last]
+                self.ids[row] = self.ids[last]
+                self.metadata[row] = self.metadata[last]
+                self.id_to_row[self.ids[row]] = row
+                if self.centroids is not None:
+                    self.assignments[row] = self.assignments[last]
+            self.ids.pop()
+            self.metadata.pop()
+            del self.id_to_row[removed_id]
+
+        if rows and self.centroids is not None:
+            self.assignments = self.assignments[:len(self.ids)]
+        return len(rows)
+
+    # Spherical k-means, seeded so rebuilding the same data gives the same partitions
+    def build_ivf(self, n_lists: Optional[int] = None, n_iter: int = 10, seed: int = 0):
+        n = len(self.ids)
+        if n == 0:
+            return
+        n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+
+        rng = np.random.default_rng(seed)
+        centroids = self.vectors[rng.choice(n, size=n_lists, replace=False)].copy()
+        for _ in range(n_iter):
+            assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = self.vectors[assignments == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    if norm > 0:
+                        centroids[c] = centroid / norm
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments = np.argmax(self.vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def drop_ivf(self):
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+
+    def search(self, query: np.ndarray, k: int = 5, n_probe: Optional[int] = None) -> List[Dict[str, Any]]:
+        if not self.ids:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+
+        if self.centroids is not None:
+            n_probe = min(len(self.centroids), n_probe or settings.retrieval_ivf_probes)
+            probes = self._nearest_centroids(query[None, :], n_probe)[0]
+            candidates = np.flatnonzero(np.isin(self.assignments, probes))
+            if len(candidates) == 0:
+                return []
+            scores = self.vectors[candidates] @ query
+        else:
+            candidates = None
+            scores = self.vectors @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for position in top:
+            row = int(candidates[position]) if candidates is not None else int(position)
+            results.append({"id": self.ids[row], "score": float(scores[position]), **self.metadata[row]})
+        return results
+
+    # Arrays go to an .npz file and ids/metadata to a JSON sidecar, both written atomically
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        arrays = {"vectors": self.vectors, "assignments": self.assignments}
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+        tmp_npz = path.with_suffix(".tmp.npz")
+        np.savez(tmp_npz, **arrays)
+
+        tmp_json = path.with_suffix(".tmp.json")
+        with open(tmp_json, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "embedder": self.embedder, "ids": self.ids, "metadata": self.metadata}, f)
+
+        os.replace(tmp_npz, path.with_suffix(".npz"))
+        os.replace(tmp_json, path.with_suffix(".json"))
+
+    @classmethod
+    def load(cls, path: Path) -> "VectorIndex":
+        path = Path(path)
+        with open(path.with_suffix(".json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = np.load(path.with_suffix(".npz"))
+
+        index = cls(meta["dim"], meta.get("embedder", "hashing"))
+        index._buffer = arrays["vectors"].astype(np.float32)
+        index.ids = meta["ids"]
+        index.metadata = meta["metadata"]
+        index.id_to_row = {doc_id: row for row, doc_id in enumerate(index.ids)}
+        if "centroids" in arrays:
+            index.centroids = arrays["centroids"]
+            index.assignments = arrays["assignments"].astype(np.int32)
+        return index
+
+
+# Keeps our own market data (ticker catalog, news, bar summaries) searchable so it can be added to Gemini prompts
+class RetrievalService:
+    _instance = None
+    # The first construction loads the persisted index on a warm-up thread, callers arriving meanwhile wait for it
+    _init_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            with cls._init_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, index_path: Optional[str] = None, embedder=None):
+        if hasattr(self, '_initialized'):
+            return
+        with self._init_lock:
+            if hasattr(self, '_initialized'):
+                return
+            index_path = Path(index_path or settings.retrieval_index_path)
+            embedder = embedder or create_embedder()
+            index = VectorIndex(embedder.dim, embedder.name)
+            if index_path.with_suffix(".npz").exists() and index_path.with_suffix(".json").exists():
+                persisted = VectorIndex.load(index_path)
+                # Vectors from another embedder are not comparable, start over in that case
+                if persisted.dim == embedder.dim and persisted.embedder == embedder.name:
+                    index = persisted
+
+            self.index_path = index_path
+            self.embedder = embedder
+            self.lock = threading.RLock()
+            self.index = index
+            # Last, so nobody sees the instance before it is complete
+            self._initialized = True
+
+    def _add(self, docs: List[Dict[str, Any]]) -> int:
+        if not docs:
+            return 0
+        vectors = self.embedder.embed([doc.get("embed_text", doc["text"]) for doc in docs])
+        with self.lock:
+            self.index.add([doc["id"] for doc in docs], vectors, [{"kind": doc["kind"], "text": doc["text"]} for doc in docs])
+        return len(docs)
+
+    def add_tickers(self, rows: Iterable[Any]) -> int:
+        docs = []
+        for row in rows:
+            text = f"{row['ticker']}: {row['company_name']}, listed on {row['exchange']}"
+            docs.append({"id": f"ticker:{row['ticker']}", "kind": "ticker", "text": text,
+                         "embed_text": f"{row['ticker']} {row['company_name']}"})
+        return self._add(docs)
+
+    # Articles in NewsAPI shape, keyed by URL
+    def add_articles(self, articles: Iterable[Dict[str, Any]]) -> int:
+        docs = []
+        for article in articles:
+            if not article.get("url"):
+                continue
+            source = (article.get("source") or {}).get("name") or "unknown source"
+            text = f"{article.get('title') or ''}. {article.get('description') or ''} ({source}, {article.get('publishedAt') or 'undated'})"
+            docs.append({"id": f"article:{article['url']}", "kind": "article", "text": text})
+        return self._add(docs)
+
+    # Bars as dicts with timestamp/open/high/low/close/volume, summarized into a single snippet per symbol
+    def add_bar_summary(self, symbol: str, bars: Sequence[Dict[str, Any]]) -> int:
+        if not bars:
+            return 0
+        closes = np.array([bar["close"] for bar in bars], dtype=np.float64)
+        volumes = np.array([bar["volume"] for bar in bars], dtype=np.float64)
+        change = (closes[-1] / closes[0] - 1) * 100 if closes[0] else 0.0
+
+        first, last = str(bars[0]["timestamp"])[:10], str(bars[-1]["timestamp"])[:10]
+        text = (f"{symbol} daily bars {first} to {last}: last close {closes[-1]:.2f}, {change:+.2f}% over {len(bars)} sessions, "
+                f"range {min(bar['low'] for bar in bars):.2f}-{max(bar['high'] for bar in bars):.2f}, average volume {volumes.mean():,.0f}")
+        return self._add([{"id": f"bars:{symbol}", "kind": "bars", "text": text}])
+
+    def delete(self, ids: Iterable[str]) -> int:
+        with self.lock:
+            return self.index.delete(list(ids))
+
+    # Vector search over a wider candidate pool, reranked by exact term overlap to weed out hash collisions
+    def retrieve(self, query: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        k = k or settings.retrieval_top_k
+        vector = self.embedder.embed([query])[0]
+        with self.lock:
+            candidates = self.index.search(vector, max(k, settings.retrieval_rerank_candidates))
+
+        query_terms = set(TOKEN_RE.findall(query.lower())) - STOPWORDS
+        reranked = []
+        for candidate in candidates:
+            doc_terms = set(TOKEN_RE.findall(candidate["text"].lower()))
+            overlap = len(query_terms & doc_terms) / len(query_terms) if query_terms else 0.0
+            if overlap == 0 and self.embedder.lexical:
+                continue
+            candidate["score"] = round(candidate["score"] + overlap, 6)
+            reranked.append(candidate)
+
+        reranked.sort(key=lambda candidate: candidate["score"], reverse=True)
+        return [c for c in reranked[:k] if c["score"] >= settings.retrieval_min_score]
+
+    # Prompt block with the top-k snippets, None when nothing relevant is indexed
+    def build_context(self, query: str, k: Optional[int] = None) -> Optional[str]:
+        snippets = self.retrieve(query, k)
+        if not snippets:
+            return None
+        lines = "\n".join(f"- {snippet['text']}" for snippet in snippets)
+        return f"Relevant market data from our records:\n{lines}"
+
+    def build_ivf(self, n_lists: Optional[int] = None):
+        with self.lock:
+            self.index.build_ivf(n_lists)
+
+    def save(self):
+        with self.lock:
+            self.index.save(self.index_path)
+
+    def get_status(self):
+        with self.lock:
+            kinds = {}
+            for meta in self.index.metadata:
+                kinds[meta["kind"]] = kinds.get(meta["kind"], 0) + 1
+            return {
+                "documents": len(self.index),
+                "by_kind": kinds,
+                "dim": self.index.dim,
+                "embedder": self.index.embedder,
+                "ivf_lists": len(self.index.centroids) if self.index.centroids is not None else 0,
+                "index_path": str(self.index_path)
+            }
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.config import settings
+from app.db import SQLitePool
+
+
+# Keeps converted Gemini history server side so clients only send the newest message(s). Without session_db_file the
+# sessions live in this worker's memory, so with several uvicorn workers (WEB_CONCURRENCY > 1) a session only exists
+# on the worker that created it. With it, SQLite is the source of truth and any worker can continue a session
+class ConversationSessionStore:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, ttl_seconds: Optional[int] = None, max_sessions: Optional[int] = None, db_file: Optional[str] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.session_ttl_seconds
+            self.max_sessions = max_sessions if max_sessions is not None else settings.session_max_entries
+            db_file = db_file if db_file is not None else settings.session_db_file
+
+            # session_id -> (last_access, history) ordered from least to most recently used
+            self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+            self.lock = threading.Lock()
+            # session_id -> [lock, holders], one turn at a time per session in this worker
+            self._turn_locks: Dict[str, list] = {}
+
+            # Persistence is optional, in-memory only when no file is configured
+            self.db_pool = None
+            if db_file:
+                Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+                self.db_pool = SQLitePool(str(db_file))
+                self._init_db()
+
+    def _init_db(self):
+        with self.db_pool.get_connection() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_sessions (
+                session_id TEXT PRIMARY KEY,
+                history TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            """)
+            conn.commit()
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - last_access > self.ttl_seconds
+
+    def _evict(self, now: float):
+        # Oldest entries sit at the front so expiry and LRU eviction stop at the first live entry
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if len(self._sessions) > self.max_sessions or self._expired(last_access, now):
+                self._sessions.popitem(last=False)
+            else:
+                break
+
+    def create_session(self) -> str:
+        session_id = uuid.uuid4().hex
+        self.save(session_id, [])
+        return session_id
+
+    # Serializes the read history -> call Gemini -> append turns cycle of one session, so a second turn sent before
+    # the first one's reply is stored sees that reply. Only covers this worker, append keeps turns from being lost
+    # across workers
+    @asynccontextmanager
+    async def turn(self, session_id: str) -> AsyncIterator[None]:
+        entry = self._turn_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._turn_locks[session_id]
+
+    def get_history(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        now = time.time()
+        if self.db_pool is None:
+            with self.lock:
+                entry = self._sessions.get(session_id)
+                if entry is None:
+                    return None
+                if self._expired(entry[0], now):
+                    del self._sessions[session_id]
+                    return None
+                self._sessions[session_id] = (now, entry[1])
+                self._sessions.move_to_end(session_id)
+                return entry[1]
+
+        # Another worker may have appended turns since this one last saw the session
+        with self.db_pool.get_connection() as conn:
+            row = conn.execute(
+                "SELECT history, updated_at FROM conversation_sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+
+        if row is None or self._expired(row["updated_at"], now):
+            return None
+
+        history = json.loads(row["history"])
+        with self.lock:
+            self._sessions[session_id] = (now, history)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+        return history
+
+    def save(self, session_id: str, history: List[Dict[str, Any]]):
+        now = time.time()
+        with self.lock:
+            self._sessions[session_id] = (now, history)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+
+        if self.db_pool is not None:
+            with self.db_pool.get_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO conversation_sessions (session_id, history, updated_at) VALUES (?, ?, ?)",
+                    (session_id, json.dumps(history), now)
+                )
+                conn.commit()
+
+    # Adds turns to whatever is stored now rather than to a copy read earlier, so concurrent turns are all kept.
+    # BEGIN IMMEDIATE makes the read and write one step for every worker sharing the database
+    def append(self, session_id: str, turns: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        now = time.time()
+        if self.db_pool is None:
+            with self.lock:
+                entry = self._sessions.get(session_id)
+                history = (entry[1] if entry is not None and not self._expired(entry[0], now) else []) + turns
+                self._sessions[session_id] = (now, history)
+                self._sessions.move_to_end(session_id)
+                self._evict(now)
+            return history
+
+        with self.db_pool.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT history, updated_at FROM conversation_sessions WHERE session_id = ?", (session_id,)).fetchone()
+            history = (json.loads(row["history"]) if row is not None and not self._expired(row["updated_at"], now) else []) + turns
+            conn.execute(
+                "INSERT OR REPLACE INTO conversation_sessions (session_id, history, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(history), now)
+            )
+            conn.commit()
+        with self.lock:
+            self._sessions[session_id] = (now, history)
+            self._sessions.move_to_end(session_id)
+            self._evict(now)
+        return history
+
+    def delete(self, session_id: str) -> bool:
+        with self.lock:
+            removed = self._sessions.pop(session_id, None) is not None
+
+        if self.db_pool is not None:
+            with self.db_pool.get_connection() as conn:
+                cursor = conn.execute("DELETE FROM conversation_sessions WHERE session_id = ?", (session_id,))
+                conn.commit()
+                removed = removed or cursor.rowcount > 0
+        return removed
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self.lock:
+            expired = [sid for sid, (last_access, _) in self._sessions.items() if self._expired(last_access, now)]
+            for sid in expired:
+                del self._sessions[sid]
+
+        if self.db_pool is not None and self.ttl_seconds > 0:
+            with self.db_pool.get_connection() as conn:
+                conn.execute("DELETE FROM conversation_sessions WHERE updated_at < ?", (now - self.ttl_seconds,))
+                conn.commit()
+        return len(expired)
+
+    def get_status(self):
+        with self.lock:
+            size = len(self._sessions)
+        return {
+            "sessions": size,
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "persistent": self.db_pool is not None
+        }
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.db import SQLitePool
+from app.cancellation import OperationCancelled
+from app.tracing import to_thread
+from app.serialization import dumps, loads
+
+
+# Cache shared by every uvicorn worker on the host through one SQLite WAL file. Each process keeps a short lived
+# in-memory copy of hot keys, and misses are filled under a cross-process lease so N workers cost one upstream call
+class SharedCache:
+    _instance = None
+    ENCODED_SUFFIX = "|json"
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, db_file: Optional[str] = None, local_ttl: Optional[float] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.db_file = Path(db_file or settings.shared_cache_file)
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            self.db_pool = SQLitePool(str(self.db_file))
+            self.local_ttl = local_ttl if local_ttl is not None else settings.shared_cache_local_ttl
+            self.lease_seconds = settings.shared_cache_lease_seconds
+            self.lock_timeout = settings.shared_cache_lock_timeout
+
+            # key (or key + ENCODED_SUFFIX for the encoded form) -> (expires_at, value)
+            self._local: Dict[str, Tuple[float, Any]] = {}
+            self._local_lock = threading.Lock()
+            self._inflight: Dict[str, asyncio.Future] = {}
+            self._writes = 0
+            self.stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "loads": 0, "waits": 0}
+            self.init_cache_db()
+
+    def init_cache_db(self):
+        with self.db_pool.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS cache_leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """)
+            conn.commit()
+
+    def _local_key(self, key: str, encoded: bool) -> str:
+        return key + self.ENCODED_SUFFIX if encoded else key
+
+    # encoded=True returns the stored JSON document as bytes, ready to send, instead of decoding it. Both forms get
+    # their own in-memory copy, so one key can be read either way
+    def get(self, key: str, count_miss: bool = True, encoded: bool = False) -> Optional[Any]:
+        now = time.time()
+        local_key = self._local_key(key, encoded)
+        with self._local_lock:
+            entry = self._local.get(local_key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.stats["local_hits"] += 1
+                    return entry[1]
+                del self._local[local_key]
+
+        with self.db_pool.get_connection() as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row["expires_at"] <= now:
+            if count_miss:
+                self.stats["misses"] += 1
+            return None
+
+        stored = row["value"]
+        if encoded:
+            value = stored if isinstance(stored, bytes) else stored.encode("utf-8")
+        else:
+            value = loads(stored)
+        self._remember(local_key, value, row["expires_at"], now)
+        self.stats["shared_hits"] += 1
+        return value
+
+    # Decoded values of several keys with one query for the ones not held locally. Missing and expired keys are left out
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        now = time.time()
+        found: Dict[str, Any] = {}
+        remaining = []
+        with self._local_lock:
+            for key in keys:
+                entry = self._local.get(key)
+                if entry is not None and entry[0] > now:
+                    found[key] = entry[1]
+                else:
+                    remaining.append(key)
+        self.stats["local_hits"] += len(found)
+        if not remaining:
+            return found
+
+        with self.db_pool.get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM cache_entries WHERE key IN ({','.join('?' * len(remaining))}) AND expires_at > ?",
+                (*remaining, now)
+            ).fetchall()
+        for row in rows:
+            value = loads(row["value"])
+            self._remember(row["key"], value, row["expires_at"], now)
+            found[row["key"]] = value
+        self.stats["shared_hits"] += len(rows)
+        self.stats["misses"] += len(remaining) - len(rows)
+        return found
+
+    def _remember(self, key: str, value: Any, expires_at: float, now: float):
+        if self.local_ttl > 0:
+            with self._local_lock:
+                self._local[key] = (min(expires_at, now + self.local_ttl), value)
+
+    # Bytes are taken as an already encoded JSON document
+    def set(self, key: str, value: Any, ttl: float):
+        now = time.time()
+        encoded = value if isinstance(value, bytes) else dumps(value)
+        with self.db_pool.get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+                (key, encoded, now + ttl, now)
+            )
+            self._writes += 1
+            # Expired rows are swept every few hundred writes instead of by a separate job
+            if self._writes % 200 == 0:
+                conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+            conn.commit()
+        # Keep the form the caller stored (decoded from the JSON, so local hits return what other workers will read)
+        # and drop this process' copy of the other form
+        is_encoded = isinstance(value, bytes)
+        with self._local_lock:
+            self._local.pop(self._local_key(key, not is_encoded), None)
+        self._remember(self._local_key(key, is_encoded), encoded if is_encoded else loads(encoded), now + ttl, now)
+
+    # Several entries with the same ttl in one transaction
+    def set_many(self, values: Dict[str, Any], ttl: float):
+        if not values:
+            return
+        now = time.time()
+        encoded = {key: dumps(value) for key, value in values.items()}
+        with self.db_pool.get_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now + ttl, now) for key, value in encoded.items()]
+            )
+            self._writes += len(encoded)
+            conn.commit()
+        with self._local_lock:
+            for key in values:
+                self._local.pop(self._local_key(key, True), None)
+        for key, value in encoded.items():
+            self._remember(key, loads(value), now + ttl, now)
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._local_lock:
+            for key in [k for k in self._local if k.startswith(prefix)]:
+                del self._local[key]
+        with self.db_pool.get_connection() as conn:
+            cursor = conn.execute("DELETE FROM cache_entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            conn.commit()
+            return cursor.rowcount
+
+    # Owner token of the new lease, None while someone else holds it. BEGIN IMMEDIATE takes SQLite's write lock
+    # so two processes cannot both see the lease as free
+    def try_acquire(self, name: str, lease_seconds: Optional[float] = None) -> Optional[str]:
+        now = time.time()
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        with self.db_pool.get_connection() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                return None
+            row = conn.execute("SELECT expires_at FROM cache_leases WHERE name = ?", (name,)).fetchone()
+            # A lease past its expiry belongs to a worker that died or hung
+            if row is not None and row["expires_at"] > now:
+                conn.rollback()
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + (lease_seconds or self.lease_seconds))
+            )
+            conn.commit()
+            return owner
+
+    def release(self, name: str, owner: str):
+        with self.db_pool.get_connection() as conn:
+            conn.execute("DELETE FROM cache_leases WHERE name = ? AND owner = ?", (name, owner))
+            conn.commit()
+
+    # Cross-process mutex for one-off jobs such as populating the tickers table on first boot
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: Optional[float] = None, poll_interval: float = 0.05):
+        deadline = time.monotonic() + (timeout or self.lock_timeout)
+        while True:
+            owner = await to_thread(self.try_acquire, f"lock:{name}")
+            if owner:
+                break
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for shared lock {name}")
+            self.stats["waits"] += 1
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 1.0)
+        try:
+            yield
+        finally:
+            await to_thread(self.release, f"lock:{name}", owner)
+
+    # Cached value or one load across all workers: coroutines in this process share a future, processes share a lease.
+    # Waiters poll the cache until the lease holder stores the value, and load themselves if it never shows up.
+    # With encoded=True the result is the JSON document as bytes, so a hit skips decoding and re-encoding entirely
+    async def get_or_load(self, key: str, ttl: float, loader: Callable[[], Awaitable[Any]],
+                          cacheable: Callable[[Any], bool] = lambda value: value is not None, encoded: bool = False) -> Any:
+        value = await to_thread(self.get, key, True, encoded)
+        if value is not None:
+            return value
+
+        inflight_key = self._local_key(key, encoded)
+        future = self._inflight.get(inflight_key)
+        while future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # A cancelled future means the leading request went away, its cancellation is not ours. We lead next
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                future = self._inflight.get(inflight_key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[inflight_key] = future
+        try:
+            value = await self._load_once(key, ttl, loader, cacheable, encoded)
+            future.set_result(value)
+            return value
+        except (asyncio.CancelledError, OperationCancelled):
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else awaited it, keep the loop from logging "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(inflight_key, None)
+
+    async def _load_once(self, key: str, ttl: float, loader, cacheable, encoded: bool) -> Any:
+        lease = f"load:{key}"
+        deadline = time.monotonic() + self.lock_timeout
+        poll_interval = 0.05
+        while True:
+            owner = await to_thread(self.try_acquire, lease)
+            if owner:
+                try:
+                    # Another worker may have stored it between our miss and the lease
+                    value = await to_thread(self.get, key, False, encoded)
+                    if value is not None:
+                        return value
+                    value = await loader()
+                    self.stats["loads"] += 1
+                    store = cacheable(value)
+                    if encoded:
+                        value = dumps(value)
+                    if store:
+                        await to_thread(self.set, key, value, ttl)
+                    return value
+                finally:
+                    await to_thread(self.release, lease, owner)
+
+            self.stats["waits"] += 1
+            await asyncio.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 1.0)
+            value = await to_thread(self.get, key, False, encoded)
+            if value is not None:
+                return value
+            if time.monotonic() >= deadline:
+                # The holder is slow or its result was not cacheable, do not keep the caller waiting any longer
+                self.stats["loads"] += 1
+                value = await loader()
+                return dumps(value) if encoded else value
+
+    def get_status(self):
+        now = time.time()
+        with self.db_pool.get_connection() as conn:
+            entries = conn.execute("SELECT COUNT(*), TOTAL(LENGTH(value)) FROM cache_entries WHERE expires_at > ?", (now,)).fetchone()
+            leases = conn.execute("SELECT COUNT(*) FROM cache_leases WHERE expires_at > ?", (now,)).fetchone()
+        with self._local_lock:
+            local = len(self._local)
+        return {
+            **self.stats,
+            "entries": entries[0],
+            "bytes": int(entries[1]),
+            "active_leases": leases[0],
+            "local_entries": local,
+            "pid": os.getpid(),
+            "db_file": str(self.db_file)
+        }
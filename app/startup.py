@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_imported_at = time.time()
+
+
+# Wall clock time the process was started, from /proc on Linux so interpreter boot and imports are included.
+# Elsewhere it falls back to the first import of this module
+def process_start_time() -> float:
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the ")" that closes the command name start at field 3, starttime is field 22
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return _imported_at
+
+
+# Cold start bookkeeping for one worker: milestones (imported, startup hook done, first /health, ready) relative to
+# process start, and the warm-up steps that run in the background after the startup hook returns
+class StartupTracker:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.process_started = process_start_time()
+            self.marks: Dict[str, float] = {"imported": time.time()}
+            self.steps: List[Dict[str, Any]] = []
+            self.ready_event: Optional[asyncio.Event] = None
+            # name -> callable returning (ok, details), evaluated by /ready once the warm-up is done
+            self.checks: Dict[str, Callable[[], Tuple[bool, Dict[str, Any]]]] = {}
+
+    def mark(self, name: str) -> bool:
+        if name in self.marks:
+            return False
+        self.marks[name] = time.time()
+        return True
+
+    def seconds(self, name: str) -> Optional[float]:
+        return round(self.marks[name] - self.process_started, 3) if name in self.marks else None
+
+    @property
+    def ready(self) -> bool:
+        return "ready" in self.marks
+
+    # Runs the steps in order, a failed step is logged and recorded but does not stop the worker from becoming ready
+    async def warm_up(self, steps: List[Tuple[str, Callable[[], Awaitable[Any]]]]):
+        self.ready_event = self.ready_event or asyncio.Event()
+        for name, step in steps:
+            started = time.perf_counter()
+            error = None
+            try:
+                await step()
+            except Exception as e:
+                error = str(e)
+                logger.error(f"Warm-up step {name} failed: {error}")
+            self.steps.append({"name": name, "duration_ms": round((time.perf_counter() - started) * 1000, 1), "error": error})
+        self.mark("ready")
+        self.ready_event.set()
+        logger.info(f"Worker ready {self.seconds('ready')}s after process start, first /health at {self.seconds('first_health')}s")
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        if self.ready:
+            return True
+        self.ready_event = self.ready_event or asyncio.Event()
+        try:
+            await asyncio.wait_for(self.ready_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.ready
+
+    def add_check(self, name: str, check: Callable[[], Tuple[bool, Dict[str, Any]]]):
+        self.checks[name] = check
+
+    # Warm-up done and every check passing. A check that raises counts as failing
+    def check_readiness(self) -> Dict[str, Any]:
+        status = self.get_status()
+        results = {}
+        for name, check in self.checks.items():
+            try:
+                ok, details = check()
+            except Exception as e:
+                ok, details = False, {"error": str(e)}
+            results[name] = {"ok": ok, **details}
+        status["ready"] = self.ready and all(result["ok"] for result in results.values())
+        status["checks"] = results
+        return status
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "process_started": self.process_started,
+            "seconds_since_process_start": {name: self.seconds(name) for name in self.marks},
+            "warm_up": self.steps
+        }
+
+    def metrics(self):
+        return [("app_startup_seconds", "gauge", "Seconds from process start to each startup milestone of this worker",
+                 [({"milestone": name}, self.seconds(name)) for name in self.marks])]
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Offline load test: boots app.main:app in-process against stub Alpaca, Gemini and NewsAPI clients and drives a mix of
+search-as-you-type, bars, chat, streaming and news requests at a target arrival rate. Reports throughput and
+p50/p95/p99 per scenario and compares them with a stored baseline (exit code 1 on regression, 2 when the baseline was
+recorded with a different workload).
+Usage (from the repo root): python3 -m app.test.bench_load [--rate 40] [--duration 20] [--mix search=50,bars=20,...]
+                            [--save-baseline] [--baseline app/test/fixtures/bench_baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_BASELINE = REPO_ROOT / "app" / "test" / "fixtures" / "bench_baseline.json"
+DEFAULT_MIX = "search=50,bars=20,chat=10,stream=10,news=10"
+CLIENT_IP = "127.0.0.1"
+
+PROMPTS = ["How did {symbol} trade this week?", "Summarize the outlook for {symbol}", "Is {symbol} more volatile than the market?",
+           "Compare {symbol} with its sector", "What drove the last move in {symbol}?"]
+# Arguments that only tune the comparison, every other argument shapes the offered load
+COMPARE_ARGS = ("baseline", "save_baseline", "tolerance", "min_delta_ms")
+
+NEWS_QUERIES = ["earnings", "inflation", "semiconductors", "energy", "banks", "guidance", "merger", "layoffs"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def parse_mix(mix: str):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+# Keeps the run away from the repo's data/ files (every data path is relative) and lifts the per IP rate limits
+# for the load generator. Settings are already loaded at this point, so they are changed in place
+def prepare_environment(work_dir: str):
+    from app.config import settings
+
+    os.chdir(work_dir)
+    settings.rate_limit_ips = {**settings.rate_limit_ips, CLIENT_IP: 1000000}
+
+
+class LoadRunner:
+    def __init__(self, client, catalog, args):
+        self.client = client
+        self.catalog = catalog
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def timed(self, scenario: str, method: str, url: str, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400 and b'"error"' not in response.content[:200]
+        except Exception:
+            ok = False
+        finally:
+            self.in_flight -= 1
+        self.latencies[scenario].append(time.perf_counter() - started)
+        if not ok:
+            self.errors[scenario] += 1
+
+    # One arrival is one word typed into the search bar, a request per keystroke
+    async def search(self):
+        row = self.rng.choice(self.catalog)
+        word = row["ticker"] if self.rng.random() < 0.6 else row["company_name"].split()[0]
+        for i in range(1, min(len(word), 5) + 1):
+            await self.timed("search", "GET", "/tickers/search", params={"query": word[:i], "limit": 10})
+            await asyncio.sleep(self.args.keystroke_ms / 1000)
+
+    async def bars(self):
+        symbol = self.rng.choice(self.catalog[:self.args.hot_symbols])["ticker"]
+        timeframe, days = self.rng.choice((("day", 30), ("day", 365), ("hour", 5), ("minute", 1)))
+        await self.timed("bars", "GET", "/alpaca/fetch_company_bars", params={"symbol": symbol, "days": days, "timeframe": timeframe})
+
+    # A dashboard refresh, one snapshot request for a 40 symbol watchlist (not in the default mix, add watchlist=N)
+    async def watchlist(self):
+        symbols = self.rng.sample(self.catalog[:self.args.hot_symbols], 40)
+        await self.timed("watchlist", "GET", "/alpaca/snapshot", params={"symbols": ",".join(row["ticker"] for row in symbols)})
+
+    def conversation(self):
+        symbol = self.rng.choice(self.catalog)["ticker"]
+        return {"messages": [{"role": "user", "content": self.rng.choice(PROMPTS).format(symbol=symbol)}], "use_retrieval": True}
+
+    async def chat(self):
+        await self.timed("chat", "POST", "/gemini/conversation", json=self.conversation())
+
+    async def stream(self):
+        await self.timed("stream", "POST", "/gemini/stream", json=self.conversation())
+
+    async def news(self):
+        await self.timed("news", "GET", "/news/everything", params={"query": self.rng.choice(NEWS_QUERIES), "page_size": 20})
+
+    # Open loop: arrivals follow a Poisson process at the target rate whether or not earlier requests finished
+    async def run(self, weights):
+        scenarios = list(weights)
+        cumulative = [weights[name] for name in scenarios]
+        tasks = []
+        started = time.perf_counter()
+        next_arrival = started
+        while next_arrival - started < self.args.duration:
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            scenario = self.rng.choices(scenarios, weights=cumulative)[0]
+            tasks.append(asyncio.create_task(getattr(self, scenario)()))
+            next_arrival += self.rng.expovariate(self.args.rate)
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - started
+
+
+def summarize(runner: LoadRunner, elapsed: float):
+    report = {}
+    for scenario, samples in sorted(runner.latencies.items()):
+        report[scenario] = {
+            "requests": len(samples),
+            "errors": runner.errors[scenario],
+            "throughput": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        }
+    return report
+
+
+def print_report(report, elapsed, runner, stubs):
+    print(f"{'scenario':10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for scenario, row in report.items():
+        print(f"{scenario:10} {row['requests']:9d} {row['errors']:7d} {row['throughput']:8.2f} {row['p50_ms']:9.2f} "
+              f"{row['p95_ms']:9.2f} {row['p99_ms']:9.2f}")
+    print(f"elapsed {elapsed:.1f} s, peak in-flight {runner.max_in_flight}, upstream calls {stubs.get_status()}")
+
+
+# A scenario regresses when its p95 grows or its throughput drops by more than `tolerance` (and by more than
+# min_delta_ms for latencies, so sub-millisecond noise on fast routes is ignored). p99 only counts once a scenario
+# has enough requests for its tail to be more than one or two samples
+def compare(report, baseline, tolerance: float, min_delta_ms: float):
+    regressions = []
+    for scenario, base in baseline.get("scenarios", {}).items():
+        row = report.get(scenario)
+        if row is None:
+            continue
+        keys = ("p95_ms", "p99_ms") if row["requests"] >= 500 else ("p95_ms",)
+        for key in keys:
+            if row[key] > base[key] * (1 + tolerance) and row[key] - base[key] > min_delta_ms:
+                regressions.append(f"{scenario} {key} {base[key]:.2f} -> {row[key]:.2f}")
+        if row["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{scenario} throughput {base['throughput']:.2f} -> {row['throughput']:.2f}")
+        if row["errors"] > base["errors"] and row["errors"] / row["requests"] > tolerance / 10:
+            regressions.append(f"{scenario} errors {base['errors']} -> {row['errors']}")
+    return regressions
+
+
+# Workload arguments that differ from the baseline's, throughput and latencies of such runs are not comparable
+def workload_differences(args, baseline):
+    recorded = baseline.get("settings", {})
+    current = {k: v for k, v in vars(args).items() if k not in COMPARE_ARGS}
+    differences = [f"{key} {recorded.get(key)} -> {value}" for key, value in current.items() if recorded.get(key) != value]
+    if "mix" in recorded and "mix" in current and parse_mix(recorded["mix"]) == parse_mix(current["mix"]):
+        differences = [line for line in differences if not line.startswith("mix ")]
+    return differences
+
+
+async def run_benchmark(args):
+    import httpx
+    from app.main import app
+    from app.startup import StartupTracker
+    from app.test.stub_upstreams import Faults, StubUpstreams
+
+    stubs = StubUpstreams(
+        alpaca=Faults(args.alpaca_latency_ms / 1000, error_rate=args.error_rate, seed=args.seed),
+        gemini=Faults(args.gemini_latency_ms / 1000, error_rate=args.error_rate, seed=args.seed + 1),
+        news=Faults(args.news_latency_ms / 1000, error_rate=args.error_rate, seed=args.seed + 2),
+        catalog_size=args.catalog_size,
+        chunk_delay=args.chunk_ms / 1000,
+    ).install()
+
+    # Fresh data directory, the warm-up fills the tickers table from the stub catalog
+    await app.router.startup()
+    await StartupTracker().wait_ready()
+    try:
+        transport = httpx.ASGITransport(app=app, client=(CLIENT_IP, 50000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            runner = LoadRunner(client, stubs.catalog, args)
+            elapsed = await runner.run(parse_mix(args.mix))
+    finally:
+        await app.router.shutdown()
+        stubs.uninstall()
+    return summarize(runner, elapsed), elapsed, runner, stubs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=40.0, help="arrivals per second")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of arrivals")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--alpaca-latency-ms", type=float, default=40.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0)
+    parser.add_argument("--news-latency-ms", type=float, default=80.0)
+    parser.add_argument("--chunk-ms", type=float, default=30.0, help="delay between streamed Gemini chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected failure rate for every upstream")
+    parser.add_argument("--keystroke-ms", type=float, default=80.0)
+    parser.add_argument("--catalog-size", type=int, default=5000)
+    parser.add_argument("--hot-symbols", type=int, default=200, help="bars requests pick from the first N symbols")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    args.baseline = args.baseline.resolve()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        prepare_environment(work_dir)
+        report, elapsed, runner, stubs = asyncio.run(run_benchmark(args))
+        os.chdir(REPO_ROOT)
+    print_report(report, elapsed, runner, stubs)
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        settings = {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline")}
+        args.baseline.write_text(json.dumps({"settings": settings, "scenarios": report}, indent=2) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        differences = workload_differences(args, baseline)
+        if differences:
+            print("Baseline was recorded with a different workload, not comparing (rerun with its settings or --save-baseline):")
+            for line in differences:
+                print(f"  {line}")
+            return 2
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Mention extraction throughput, Aho-Corasick automaton vs a per-document loop over the catalog.
+Usage (from the repo root): python3 -m app.test.bench_mentions [--docs 5000] [--naive-docs 200]
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+from pathlib import Path
+
+from app.services.mention_extractor import MentionMatcher, normalize_name
+
+
+DB_FILE = Path("data/tickers.db")
+FILLER = ("shares rose after the company reported quarterly results that beat analyst expectations while guidance for "
+          "the next quarter was cut as costs climbed and demand for consumer products slowed across several markets").split()
+
+
+def load_catalog():
+    if DB_FILE.exists():
+        conn = sqlite3.connect(DB_FILE)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT ticker, company_name FROM tickers").fetchall()
+        conn.close()
+        return rows
+    return [{"ticker": f"S{i:04d}", "company_name": f"Synthetic Holdings {i} Inc."} for i in range(10000)]
+
+
+# Headline plus description sized documents mentioning a few random companies by symbol, cashtag or name
+def make_documents(rows, count, seed=7):
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(count):
+        words = rng.choices(FILLER, k=45)
+        for row in rng.sample(rows, 3):
+            form = rng.choice(("symbol", "cashtag", "name"))
+            mention = row["ticker"] if form == "symbol" else f"${row['ticker']}" if form == "cashtag" else (row["company_name"] or "")
+            words.insert(rng.randrange(len(words)), mention)
+        docs.append(" ".join(words))
+    return docs
+
+
+# What tagging looks like without an automaton: every symbol and name checked against every document
+def naive_extract(rows, text):
+    padded = f" {text} "
+    lowered = padded.lower()
+    found = set()
+    for row in rows:
+        if f" {row['ticker']} " in padded or f"${row['ticker']} " in padded:
+            found.add(row["ticker"])
+        name = " ".join(normalize_name(row["company_name"] or ""))
+        if name and name in lowered:
+            found.add(row["ticker"])
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--naive-docs", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = load_catalog()
+    started = time.perf_counter()
+    matcher = MentionMatcher(rows)
+    print(f"Compiled {len(matcher.automaton)} patterns ({matcher.symbols} symbols, {matcher.names} names, "
+          f"{len(matcher.automaton.goto)} states) in {time.perf_counter() - started:.2f} s")
+
+    docs = make_documents(rows, args.docs)
+    started = time.perf_counter()
+    results = matcher.extract_batch(docs)
+    elapsed = time.perf_counter() - started
+    print(f"aho-corasick  {len(docs) / elapsed:10.0f} docs/s  ({sum(map(len, results)) / len(docs):.2f} tickers/doc)")
+
+    sample = docs[:args.naive_docs]
+    started = time.perf_counter()
+    for doc in sample:
+        naive_extract(rows, doc)
+    elapsed = time.perf_counter() - started
+    print(f"naive loop    {len(sample) / elapsed:10.1f} docs/s")
+
+
+if __name__ == "__main__":
+    main()
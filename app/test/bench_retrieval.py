@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Retrieval latency benchmark, brute force vs IVF over the ticker catalog.
+Usage (from the repo root): python3 -m app.test.bench_retrieval [--queries 300] [--k 5]
+"""
+
+import argparse
+import sqlite3
+import statistics
+import time
+from pathlib import Path
+
+from app.services.retrieval_service import HashingEmbedder, VectorIndex
+
+
+DB_FILE = Path("data/tickers.db")
+
+
+def load_documents(synthetic: int):
+    if DB_FILE.exists() and not synthetic:
+        conn = sqlite3.connect(DB_FILE)
+        rows = conn.execute("SELECT ticker, company_name, exchange FROM tickers").fetchall()
+        conn.close()
+        return [(f"ticker:{t}", f"{t} {name}") for t, name, _ in rows]
+    return [(f"doc:{i}", f"synthetic company {i} operating in sector {i % 50} region {i % 13}") for i in range(synthetic or 30000)]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_queries(index, queries, k, n_probe=None):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append([r["id"] for r in index.search(query, k, n_probe=n_probe)])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, results
+
+
+def report(label, latencies):
+    print(f"{label:<22} p50 {percentile(latencies, 50):7.3f} ms  p95 {percentile(latencies, 95):7.3f} ms  "
+          f"p99 {percentile(latencies, 99):7.3f} ms  mean {statistics.mean(latencies):7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--probes", type=int, default=4)
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic documents instead of data/tickers.db")
+    args = parser.parse_args()
+
+    docs = load_documents(args.synthetic)
+    embedder = HashingEmbedder(args.dim)
+
+    started = time.perf_counter()
+    vectors = embedder.embed([text for _, text in docs])
+    print(f"Embedded {len(docs)} documents in {time.perf_counter() - started:.2f} s")
+
+    index = VectorIndex(args.dim)
+    index.add([doc_id for doc_id, _ in docs], vectors, [{} for _ in docs])
+
+    # Query with real document texts so every query has a meaningful top-k
+    step = max(1, len(docs) // args.queries)
+    queries = embedder.embed([text for _, text in docs[::step][:args.queries]])
+
+    brute_latencies, brute_results = time_queries(index, queries, args.k)
+    report("brute force", brute_latencies)
+
+    started = time.perf_counter()
+    index.build_ivf()
+    print(f"Built IVF with {len(index.centroids)} lists in {time.perf_counter() - started:.2f} s")
+
+    ivf_latencies, ivf_results = time_queries(index, queries, args.k, n_probe=args.probes)
+    report(f"ivf (probes={args.probes})", ivf_latencies)
+
+    recall = statistics.mean(len(set(a) & set(b)) / len(a) for a, b in zip(brute_results, ivf_results) if a)
+    print(f"IVF recall@{args.k} vs brute force: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
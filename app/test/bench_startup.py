@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Cold start benchmark: launches uvicorn with app.main:app in a fresh process and measures the time until the first
+/health response and until /ready turns 200, alongside the worker's own numbers (seconds since process start)
+from /ready. Needs the usual environment (API keys) and runs against the repo's data/ directory.
+Usage (from the repo root): python3 -m app.test.bench_startup [--runs 5] [--port 8765]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def wait_for(client: httpx.Client, url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(url)
+
+
+def measure(port: int, timeout: float):
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=os.environ.copy())
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=2) as client:
+            health = wait_for(client, "/health", started + timeout)
+            ready = wait_for(client, "/ready", started + timeout)
+            internal = client.get("/ready").json()
+    finally:
+        server.terminate()
+        server.wait()
+    return health - started, ready - started, internal
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    health_times, ready_times = [], []
+    for run in range(args.runs):
+        health, ready, internal = measure(args.port, args.timeout)
+        health_times.append(health)
+        ready_times.append(ready)
+        steps = ", ".join(f"{step['name']} {step['duration_ms']:.0f} ms" for step in internal["warm_up"])
+        print(f"run {run + 1}: first /health {health * 1000:7.0f} ms, ready {ready * 1000:7.0f} ms "
+              f"(worker: {internal['seconds_since_process_start']}, warm-up: {steps})")
+
+    print(f"median first /health {statistics.median(health_times) * 1000:.0f} ms, "
+          f"median ready {statistics.median(ready_times) * 1000:.0f} ms over {args.runs} runs")
+
+
+if __name__ == "__main__":
+    main()
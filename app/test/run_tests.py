@@ -2,15 +2,15 @@ import unittest
 import sys
 import os
 
-# Add the parent directory (app) to Python path so imports work
-sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Run from the repo root (python3 -m app.test.run_tests) so the tests import as app.test.*
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 def run_tests():
     """Discover and run all tests in the current directory"""
     # Discover tests in the current directory
     loader = unittest.TestLoader()
     start_dir = os.path.dirname(__file__)
-    suite = loader.discover(start_dir, pattern='test_*.py')
+    suite = loader.discover(start_dir, pattern='test_*.py', top_level_dir=REPO_ROOT)
     
     # Run the tests
     runner = unittest.TextTestRunner(verbosity=2)
@@ -0,0 +1,205 @@
+"""
+Local stand-ins for the Alpaca, Gemini and NewsAPI clients with injectable latency and errors, so the app can be
+driven offline (bench_load.py). Each stub sleeps the way the real client would block: sync clients on their worker
+thread, the NewsAPI transport on the event loop.
+"""
+
+import asyncio
+import random
+import string
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest import mock
+
+import google.generativeai as genai
+import httpx
+
+from app.services.alpaca_service import AlpacaMarketService
+from app.services.news_api_service import NewsAPIService
+
+
+class UpstreamError(Exception):
+    pass
+
+
+# Latency in seconds drawn from a lognormal around `latency` (jitter is the sigma), failures with `error_rate`
+class Faults:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.3, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    def delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return self.latency * self.rng.lognormvariate(0, self.jitter)
+
+    def maybe_fail(self, name: str):
+        self.calls += 1
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            raise UpstreamError(f"Injected {name} failure")
+
+    def block(self, name: str):
+        time.sleep(self.delay())
+        self.maybe_fail(name)
+
+    async def wait(self, name: str):
+        await asyncio.sleep(self.delay())
+        self.maybe_fail(name)
+
+
+def synthetic_catalog(count: int = 5000, seed: int = 7) -> List[Dict[str, str]]:
+    rng = random.Random(seed)
+    words = ["Apex", "Blue", "Cedar", "Delta", "Echo", "Fusion", "Granite", "Harbor", "Iron", "Juniper", "Keystone", "Lumen",
+             "Meridian", "North", "Orion", "Pioneer", "Quantum", "River", "Summit", "Titan", "Union", "Vertex", "West", "Zenith"]
+    kinds = ["Holdings", "Technologies", "Energy", "Therapeutics", "Financial", "Industries", "Systems", "Brands"]
+    symbols = set()
+    catalog = []
+    while len(catalog) < count:
+        symbol = "".join(rng.choices(string.ascii_uppercase, k=rng.choice((2, 3, 4, 4, 4))))
+        if symbol in symbols:
+            continue
+        symbols.add(symbol)
+        catalog.append({"ticker": symbol, "company_name": f"{rng.choice(words)} {rng.choice(words)} {rng.choice(kinds)} Inc.",
+                        "exchange": rng.choice(("NASDAQ", "NYSE", "ARCA"))})
+    return catalog
+
+
+class StubTradingClient:
+    def __init__(self, faults: Faults, catalog: List[Dict[str, str]]):
+        self.faults = faults
+        self.catalog = catalog
+
+    def get_all_assets(self, *args, **kwargs):
+        self.faults.block("alpaca assets")
+        return [SimpleNamespace(symbol=row["ticker"], name=row["company_name"], exchange=SimpleNamespace(value=row["exchange"]),
+                                tradable=True, status="active") for row in self.catalog]
+
+
+# One bar per timeframe step between request.start and request.end, a random walk seeded by the symbol
+class StubHistoricalClient:
+    def __init__(self, faults: Faults, max_bars: int = 5000):
+        self.faults = faults
+        self.max_bars = max_bars
+
+    def get_stock_bars(self, request):
+        self.faults.block("alpaca bars")
+        symbols = [request.symbol_or_symbols] if isinstance(request.symbol_or_symbols, str) else request.symbol_or_symbols
+        step = {"Min": timedelta(minutes=1), "Hour": timedelta(hours=1)}.get(request.timeframe.unit.value, timedelta(days=1))
+        return SimpleNamespace(data={symbol: self._walk(symbol, request.start, request.end, step) for symbol in symbols})
+
+    def _walk(self, symbol: str, start: datetime, end: datetime, step: timedelta):
+        rng = random.Random(symbol)
+        price = rng.uniform(10, 500)
+        bars = []
+        timestamp = start
+        while timestamp < end and len(bars) < self.max_bars:
+            close = max(1.0, price * (1 + rng.gauss(0, 0.01)))
+            bars.append(SimpleNamespace(timestamp=timestamp, open=price, high=max(price, close) * 1.005,
+                                        low=min(price, close) * 0.995, close=close, volume=rng.randint(1000, 1000000)))
+            price = close
+            timestamp += step
+        return bars
+
+
+class StubChat:
+    def __init__(self, faults: Faults, chunk_delay: float, chunks: int):
+        self.faults = faults
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+
+    def _reply(self, message: str) -> List[str]:
+        words = f"Stub reply to: {message}".split() + ["lorem"] * (self.chunks * 4)
+        return [" ".join(words[i:i + 4]) + " " for i in range(0, self.chunks * 4, 4)]
+
+    def send_message(self, message: str, stream: bool = False):
+        self.faults.block("gemini")
+        parts = self._reply(message)
+        if not stream:
+            return SimpleNamespace(text="".join(parts))
+
+        def chunks():
+            for part in parts:
+                time.sleep(self.chunk_delay)
+                yield SimpleNamespace(text=part)
+        return chunks()
+
+
+# Stands in for genai.GenerativeModel, configured through StubGenerativeModel.configure before use
+class StubGenerativeModel:
+    faults = Faults()
+    chunk_delay = 0.0
+    chunks = 8
+
+    def __init__(self, model_name: str = "", generation_config=None, **kwargs):
+        self.model_name = model_name
+
+    @classmethod
+    def configure(cls, faults: Faults, chunk_delay: float, chunks: int):
+        cls.faults, cls.chunk_delay, cls.chunks = faults, chunk_delay, chunks
+
+    def generate_content(self, message: str):
+        return self.start_chat().send_message(message)
+
+    def start_chat(self, history=None):
+        return StubChat(self.faults, self.chunk_delay, self.chunks)
+
+
+def news_transport(faults: Faults, articles: int = 20) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        try:
+            await faults.wait("newsapi")
+        except UpstreamError:
+            return httpx.Response(503, json={"status": "error", "message": "Injected failure"})
+        query = request.url.params.get("q", "news")
+        now = datetime.utcnow()
+        return httpx.Response(200, json={"status": "ok", "totalResults": articles, "articles": [
+            {"source": {"id": None, "name": "Stub Wire"}, "author": "Stub", "title": f"{query} story {i} {now:%H%M%S%f}",
+             "description": f"Synthetic coverage of {query}", "url": f"https://news.example/{query}/{now:%H%M%S%f}/{i}",
+             "publishedAt": (now - timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ"), "content": "..."}
+            for i in range(articles)
+        ]})
+    return httpx.MockTransport(handler)
+
+
+# Swaps the stubs into the service singletons and the genai module, undone by uninstall()
+class StubUpstreams:
+    def __init__(self, alpaca: Faults, gemini: Faults, news: Faults, catalog_size: int = 5000, chunk_delay: float = 0.0, chunks: int = 8):
+        self.alpaca = alpaca
+        self.gemini = gemini
+        self.news = news
+        self.catalog = synthetic_catalog(catalog_size)
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self._patches = []
+
+    def install(self):
+        alpaca_service = AlpacaMarketService()
+        self._patches = [
+            # The service creates its SDK clients lazily, filling the slots first means the SDK never loads
+            mock.patch.object(alpaca_service, "_trading_client", StubTradingClient(self.alpaca, self.catalog)),
+            mock.patch.object(alpaca_service, "_historical_client", StubHistoricalClient(self.alpaca)),
+            mock.patch.object(genai, "GenerativeModel", StubGenerativeModel),
+        ]
+        for patch in self._patches:
+            patch.start()
+        StubGenerativeModel.configure(self.gemini, self.chunk_delay, self.chunks)
+        NewsAPIService._instance = None
+        NewsAPIService(transport=news_transport(self.news))
+        return self
+
+    def uninstall(self):
+        for patch in reversed(self._patches):
+            patch.stop()
+        self._patches = []
+        NewsAPIService._instance = None
+
+    def get_status(self):
+        return {name: {"calls": faults.calls, "errors": faults.errors}
+                for name, faults in (("alpaca", self.alpaca), ("gemini", self.gemini), ("newsapi", self.news))}
@@ -0,0 +1,134 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import httpx
+
+from app.admission import AdmissionController, AdmissionMiddleware, AdmissionPool, Rejected, route_class
+
+
+class TestAdmissionPool(unittest.TestCase):
+
+    def test_queue_handoff_and_limits(self):
+        async def run():
+            pool = AdmissionPool("gemini", limit=1, queue_size=1)
+            await pool.acquire(timeout=1)
+            waiter = asyncio.create_task(pool.acquire(timeout=1))
+            await asyncio.sleep(0)
+            self.assertEqual(pool.queued, 1)
+
+            # Queue is full
+            with self.assertRaises(Rejected) as rejected:
+                await pool.acquire(timeout=1)
+            self.assertEqual(rejected.exception.reason, "queue_full")
+
+            # The released slot goes to the waiter
+            pool.release()
+            await waiter
+            self.assertEqual((pool.in_flight, pool.queued), (1, 0))
+
+            with self.assertRaises(Rejected) as rejected:
+                await pool.acquire(timeout=0.01)
+            self.assertEqual(rejected.exception.reason, "queue_timeout")
+            self.assertEqual(pool.queued, 0)
+            pool.release()
+            self.assertEqual(pool.in_flight, 0)
+
+        asyncio.run(run())
+
+    def test_saturated_executor_sheds_non_priority(self):
+        async def run():
+            expensive = AdmissionPool("gemini", limit=1, queue_size=10)
+            cheap = AdmissionPool("cheap", limit=1, queue_size=10, priority=True)
+            await expensive.acquire(timeout=1)
+            await cheap.acquire(timeout=1)
+            with self.assertRaises(Rejected) as rejected:
+                await expensive.acquire(timeout=1, saturated=True)
+            self.assertEqual(rejected.exception.reason, "executor_saturated")
+
+            waiter = asyncio.create_task(cheap.acquire(timeout=1, saturated=True))
+            await asyncio.sleep(0)
+            cheap.release()
+            await waiter
+
+        asyncio.run(run())
+
+    def test_route_classes(self):
+        self.assertIsNone(route_class("/ready"))
+        self.assertEqual(route_class("/tickers/search"), "cheap")
+        self.assertEqual(route_class("/alpaca/fetch_company_bars"), "alpaca")
+        # Served from the catalog cache, but a miss calls Alpaca
+        self.assertEqual(route_class("/alpaca/fetch_tickers"), "alpaca")
+        self.assertEqual(route_class("/gemini/stream"), "gemini")
+        self.assertEqual(route_class("/traces/slowest"), "default")
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.release = None
+        app = FastAPI()
+
+        @app.get("/gemini/slow")
+        async def slow():
+            await self.release.wait()
+            return {"ok": True}
+
+        @app.get("/tickers/search")
+        async def search():
+            return {"results": []}
+
+        self.controller = AdmissionController({"gemini": [1, 1], "cheap": [10, 10]}, ["cheap"])
+        app.add_middleware(AdmissionMiddleware, controller=self.controller,
+                           executor_status=lambda: {"saturated": False})
+        self.app = app
+
+    def test_sheds_with_retry_after_and_keeps_cheap_routes_open(self):
+        async def run():
+            self.release = asyncio.Event()
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                first = asyncio.create_task(client.get("/gemini/slow"))
+                second = asyncio.create_task(client.get("/gemini/slow"))
+                while self.controller.pools["gemini"].queued < 1:
+                    await asyncio.sleep(0.001)
+
+                shed = await client.get("/gemini/slow")
+                self.assertEqual(shed.status_code, 503)
+                self.assertEqual(shed.headers["retry-after"], "2")
+                self.assertFalse(self.controller.readiness()[0])
+
+                # Cheap routes have their own slots
+                self.assertEqual((await client.get("/tickers/search")).status_code, 200)
+
+                self.release.set()
+                self.assertEqual([(await first).status_code, (await second).status_code], [200, 200])
+            self.assertEqual(self.controller.pools["gemini"].in_flight, 0)
+            self.assertEqual(self.controller.pools["gemini"].rejected, 1)
+            self.assertTrue(self.controller.readiness()[0])
+
+        with mock.patch("app.admission.settings.admission_retry_after", 2):
+            asyncio.run(run())
+
+
+class TestReadyChecks(unittest.TestCase):
+
+    def test_ready_reflects_checks(self):
+        from app.main import app, startup_tracker
+        client = TestClient(app)
+        with mock.patch.object(app.state, "catalog_version", (0, None, 0)), mock.patch.dict(startup_tracker.marks, {"ready": 0}):
+            response = client.get("/ready")
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(response.json()["checks"]["ticker_db"]["ok"])
+            self.assertTrue(response.json()["checks"]["admission"]["ok"])
+
+            app.state.catalog_version = (12, 12, 100)
+            response = client.get("/ready")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["checks"]["ticker_db"]["tickers"], 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,11 +2,7 @@ import asyncio
 import unittest
 import os
 
-try:
-    from app.services.alpaca_service import AlpacaMarketService
-except ImportError:
-    from services.alpaca_service import AlpacaMarketService
-    
+from app.services.alpaca_service import AlpacaMarketService
 
 
 class TestAlpacaServices(unittest.TestCase):
@@ -1,15 +1,11 @@
 #!/usr/bin/env python3
 """
-Simple test script for AlpacaService that can be run from the test directory.
-Usage: python3 test_alpaca_simple.py
+Simple test script for AlpacaService.
+Usage (from the repo root): python3 -m app.test.test_alpaca_simple
 """
 
 import asyncio
 import sys
-import os
-
-# Add the parent directory (app) to Python path so imports work
-sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 async def test_alpaca_service():
     """Test the AlpacaService"""
@@ -17,7 +13,7 @@ async def test_alpaca_service():
         print("Testing AlpacaService...")
         
         # Import the service
-        from services.alpaca_service import AlpacaMarketService
+        from app.services.alpaca_service import AlpacaMarketService
         
         # Create service instance
         service = AlpacaMarketService()
@@ -33,7 +29,7 @@ async def test_alpaca_service():
         
     except ImportError as e:
         print(f"❌ Import error: {e}")
-        print("Make sure you're running this from the test directory")
+        print("Make sure you're running this from the repo root")
         return False
     except Exception as e:
         print(f"❌ Test failed: {e}")
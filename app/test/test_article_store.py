@@ -0,0 +1,142 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from app.services.mention_extractor import MentionMatcher
+from app.services.article_store import ArticleStore, canonicalize_url, simhash, hamming_distance
+
+
+def article(url, title, description="", published_at="2025-08-01T10:00:00Z", source="Reuters"):
+    return {"url": url, "title": title, "description": description, "publishedAt": published_at, "source": {"name": source}}
+
+
+CATALOG = [
+    {"ticker": "NVDA", "company_name": "NVIDIA Corporation Common Stock"},
+    {"ticker": "AAPL", "company_name": "Apple Inc. Common Stock"},
+    {"ticker": "IT", "company_name": "Gartner, Inc. Common Stock"},
+    {"ticker": "XOM", "company_name": "Exxon Mobil Corporation Common Stock"},
+]
+
+
+class FakeNewsService:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def create_params(self, keywords=None, from_date=None, to_date=None, sortBy=None, pageSize=None, page=None):
+        return {"q": keywords, "from": from_date, "to": to_date, "sortBy": sortBy, "pageSize": pageSize, "page": page}
+
+    async def fetch_everything(self, params):
+        self.calls.append(params)
+        return {"articles": self.pages.get(params["page"], [])}
+
+
+# Newest first with NewsAPI's inclusive from/to filters, paginated by pageSize
+class FakeNewsFeed(FakeNewsService):
+    def __init__(self, articles):
+        super().__init__({})
+        self.articles = sorted(articles, key=lambda a: a["publishedAt"], reverse=True)
+
+    async def fetch_everything(self, params):
+        self.calls.append(params)
+        stamp = lambda a: datetime.fromisoformat(a["publishedAt"].replace("Z", "+00:00"))
+        matching = [a for a in self.articles if (params["from"] is None or stamp(a) >= params["from"])
+                    and (params["to"] is None or stamp(a) <= params["to"])]
+        start = (params["page"] - 1) * params["pageSize"]
+        return {"articles": matching[start:start + params["pageSize"]]}
+
+
+class TestArticleStore(unittest.TestCase):
+
+    def setUp(self):
+        ArticleStore._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = ArticleStore(db_file=os.path.join(self.tmp_dir.name, "news.db"), extractor=MentionMatcher(CATALOG))
+
+    def tearDown(self):
+        ArticleStore._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_canonical_url(self):
+        self.assertEqual(
+            canonicalize_url("HTTPS://www.Example.com/markets/nvda/?utm_source=x&b=2&a=1#top"),
+            canonicalize_url("https://example.com/markets/nvda?a=1&b=2")
+        )
+
+    def test_simhash_near_duplicates(self):
+        original = simhash("Nvidia shares jump after record data center revenue beats Wall Street estimates")
+        syndicated = simhash("Nvidia shares jump after record data center revenue beats Wall Street estimates - Yahoo")
+        unrelated = simhash("Oil prices slide as OPEC signals higher output next quarter")
+        self.assertLessEqual(hamming_distance(original, syndicated), 7)
+        self.assertGreater(hamming_distance(original, unrelated), 7)
+
+    def test_ingest_deduplicates(self):
+        stats = self.store.ingest([
+            article("https://example.com/a?utm_medium=rss", "Nvidia beats estimates on record data center revenue growth"),
+            article("https://www.example.com/a", "Nvidia beats estimates on record data center revenue growth"),
+            article("https://other.com/copy", "Nvidia beats estimates on record data center revenue growth again"),
+            article("https://example.com/b", "Oil prices slide as OPEC signals higher output"),
+        ], query="Nvidia")
+
+        self.assertEqual((stats["inserted"], stats["url_duplicates"], stats["near_duplicates"]), (2, 1, 1))
+        self.assertEqual(len(self.store.list_articles("nvidia")), 2)
+
+    def test_refresh_uses_watermark(self):
+        service = FakeNewsService({1: [
+            article("https://example.com/new", "Apple unveils new iPhone lineup at September event", published_at="2025-08-02T09:00:00Z"),
+            article("https://example.com/old", "Apple supplier results point to strong demand", published_at="2025-08-01T09:00:00Z"),
+        ]})
+        first = asyncio.run(self.store.refresh(service, "apple", page_size=10))
+        second = asyncio.run(self.store.refresh(service, "apple", page_size=10))
+
+        self.assertEqual(first["inserted"], 2)
+        self.assertEqual(second["inserted"], 0)
+        self.assertIsNone(service.calls[0]["from"])
+        self.assertEqual(service.calls[1]["from"].isoformat(), "2025-08-02T09:00:00+00:00")
+        self.assertEqual([a["url"] for a in self.store.list_articles("apple")], ["https://example.com/new", "https://example.com/old"])
+
+    def test_refresh_cut_off_by_max_pages_resumes_the_gap(self):
+        titles = ["Apple earnings beat", "Nvidia chips sell out", "Exxon raises dividend", "Gartner cuts outlook",
+                  "Apple supplier expands plant", "Nvidia opens new campus"]
+        feed = FakeNewsFeed([article(f"https://example.com/{day}", titles[day - 1], published_at=f"2025-08-0{day}T09:00:00Z")
+                             for day in range(1, 7)])
+        first = asyncio.run(self.store.refresh(feed, "market", page_size=2, max_pages=1))
+        self.assertFalse(first["caught_up"])
+        state = self.store.get_watermark("market")
+        self.assertIsNone(state["watermark"])
+        self.assertEqual(state["resume_before"], "2025-08-05T09:00:00Z")
+
+        # Two newer articles arrive meanwhile, the gap is filled before the watermark moves
+        feed.articles[:0] = [article("https://example.com/8", "Exxon finds new oil field", published_at="2025-08-08T09:00:00Z"),
+                             article("https://example.com/7", "Gartner hires new chief", published_at="2025-08-07T09:00:00Z")]
+        while not asyncio.run(self.store.refresh(feed, "market", page_size=2, max_pages=1))["caught_up"]:
+            pass
+        self.assertEqual(self.store.get_watermark("market")["watermark"], "2025-08-06T09:00:00Z")
+        asyncio.run(self.store.refresh(feed, "market", page_size=2, max_pages=5))
+
+        self.assertEqual(len(self.store.list_articles("market", limit=20)), 8)
+        self.assertEqual(self.store.get_watermark("market")["watermark"], "2025-08-08T09:00:00Z")
+
+    def test_by_ticker_pagination(self):
+        self.store.ingest([
+            article(f"https://example.com/nvda-{day}", f"Nvidia story number {day} about chips and {day * 'x'}",
+                    published_at=f"2025-08-{day:02d}T10:00:00Z")
+            for day in range(1, 6)
+        ] + [article("https://example.com/oil", "Exxon Mobil output rises")])
+
+        first = self.store.list_articles_by_ticker("nvda", limit=2)
+        self.assertEqual([a["published_at"] for a in first["results"]], ["2025-08-05T10:00:00Z", "2025-08-04T10:00:00Z"])
+        rest = self.store.list_articles_by_ticker("NVDA", limit=10, cursor=first["next_cursor"])
+        self.assertEqual(len(rest["results"]), 3)
+        self.assertIsNone(rest["next_cursor"])
+        self.assertEqual(len(self.store.list_articles_by_ticker("XOM")["results"]), 1)
+
+        # Rebuilding against a catalog without Exxon drops its tags
+        self.store.reindex_tickers(MentionMatcher(CATALOG[:2]))
+        self.assertEqual(self.store.list_articles_by_ticker("XOM")["results"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
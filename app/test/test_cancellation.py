@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from app.cancellation import CancellationToken, OperationCancelled, cancel_on_disconnect, sse_frames
+from app.config import settings
+from app.services.session_store import ConversationSessionStore
+from app.shared_cache import SharedCache
+
+
+async def chunks_with_gaps(items):
+    # (text, seconds to wait before it)
+    for text, delay in items:
+        await asyncio.sleep(delay)
+        yield text
+
+
+async def collect(frames):
+    return [frame async for frame in frames]
+
+
+def content(frame: bytes) -> str:
+    return json.loads(frame[len(b"data: "):])["content"]
+
+
+# Drives the ASGI app directly: the request body first, then http.disconnect from `disconnect_after` seconds on
+async def call_asgi(app, path, body=b"", method="GET", query=b"", disconnect_after=0.0):
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+             "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query,
+             "headers": [(b"host", b"testserver"), (b"content-type", b"application/json")],
+             "client": ("testclient", 50000), "server": ("testserver", 80)}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+    loop = asyncio.get_running_loop()
+    disconnect_at = loop.time() + disconnect_after
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # Request.is_disconnected() receives in an already cancelled scope, so answer without awaiting once it is time
+        if loop.time() < disconnect_at:
+            await asyncio.sleep(disconnect_at - loop.time())
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+class TestSSEFrames(unittest.TestCase):
+
+    def test_coalesces_by_chars(self):
+        frames = asyncio.run(collect(sse_frames(chunks_with_gaps([("ab", 0), ("cd", 0), ("ef", 0), ("g", 0)]),
+                                                heartbeat_interval=10, coalesce_chars=4, coalesce_interval=10)))
+        self.assertEqual([content(frame) for frame in frames], ["abcd", "efg"])
+
+    def test_coalesces_by_interval(self):
+        # The second chunk arrives after the first one's flush deadline
+        frames = asyncio.run(collect(sse_frames(chunks_with_gaps([("a", 0), ("b", 0), ("c", 0.1)]),
+                                                heartbeat_interval=10, coalesce_chars=100, coalesce_interval=0.03)))
+        self.assertEqual([content(frame) for frame in frames], ["ab", "c"])
+
+    def test_heartbeat_while_idle(self):
+        frames = asyncio.run(collect(sse_frames(chunks_with_gaps([("a", 0.12)]), heartbeat_interval=0.05,
+                                                coalesce_chars=1, coalesce_interval=0)))
+        self.assertGreaterEqual(frames.count(b": keep-alive\n\n"), 2)
+        self.assertEqual(content(frames[-1]), "a")
+
+    def test_closing_the_frames_cancels_the_source(self):
+        cancelled = []
+
+        async def endless():
+            try:
+                while True:
+                    await asyncio.sleep(1)
+                    yield "x"
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            frames = sse_frames(endless(), heartbeat_interval=0.01)
+            self.assertEqual(await frames.__anext__(), b": keep-alive\n\n")
+            await frames.aclose()
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(cancelled, [True])
+
+
+class TestCancellation(unittest.TestCase):
+
+    def test_token_stops_worker_thread(self):
+        token = CancellationToken()
+        steps = []
+
+        def worker():
+            try:
+                for step in range(100):
+                    token.raise_if_cancelled()
+                    steps.append(step)
+                    threading.Event().wait(0.01)
+            except OperationCancelled:
+                steps.append("cancelled")
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        threading.Event().wait(0.03)
+        token.cancel()
+        thread.join(1)
+        self.assertEqual(steps[-1], "cancelled")
+        self.assertLess(len(steps), 100)
+
+    def test_cancel_on_disconnect(self):
+        class Request:
+            polls = 0
+
+            async def is_disconnected(self):
+                self.polls += 1
+                return self.polls >= 3
+
+        async def run():
+            async with cancel_on_disconnect(Request(), poll_interval=0.01) as token:
+                for _ in range(100):
+                    if token.cancelled:
+                        return True
+                    await asyncio.sleep(0.01)
+            return False
+
+        self.assertTrue(asyncio.run(run()))
+
+
+class TestDisconnectRoutes(unittest.TestCase):
+
+    def setUp(self):
+        SharedCache._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        SharedCache(db_file=os.path.join(self.tmp_dir.name, "cache.db"), local_ttl=0)
+        self.limits = mock.patch.object(settings, "rate_limit_ips", {"testclient": 1000})
+        self.limits.start()
+
+    def tearDown(self):
+        from app.main import app
+        app.dependency_overrides.clear()
+        self.limits.stop()
+        SharedCache._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_bars_request_gets_499_and_upstream_stops(self):
+        from app.main import app, get_alpaca_service
+        tokens = []
+
+        class SlowAlpacaService:
+            async def get_historical_bars(self, symbol, timeframe="day", start=None, end=None, cancel_token=None):
+                tokens.append(cancel_token)
+                # Chunked pulls check the token between windows
+                while True:
+                    cancel_token.raise_if_cancelled()
+                    await asyncio.sleep(0.01)
+
+        app.dependency_overrides[get_alpaca_service] = lambda: SlowAlpacaService()
+        with mock.patch.object(settings, "disconnect_poll_interval", 0.01):
+            sent = asyncio.run(call_asgi(app, "/alpaca/fetch_company_bars", query=b"symbol=gone", disconnect_after=0.05))
+        self.assertEqual(sent[0]["status"], 499)
+        self.assertTrue(tokens[0].cancelled)
+
+    def test_stream_disconnect_cancels_gemini_and_skips_session_save(self):
+        from app.main import app, get_gemini_service, get_session_store
+        tokens = []
+
+        class SlowGeminiService:
+            async def streaming_chat_completion(self, messages, model=None, temperature=None, max_tokens=None, history=None, cancel_token=None):
+                tokens.append(cancel_token)
+                yield "first "
+                while not cancel_token.cancelled:
+                    await asyncio.sleep(0.01)
+                    yield "more "
+
+            def build_turns(self, messages, text):
+                return [{"role": "model", "text": text}]
+
+        ConversationSessionStore._instance = None
+        session_store = ConversationSessionStore(db_file="")
+        session_store.append = mock.Mock()
+        app.dependency_overrides[get_gemini_service] = lambda: SlowGeminiService()
+        app.dependency_overrides[get_session_store] = lambda: session_store
+        body = json.dumps({"messages": [{"role": "user", "content": "hi"}]}).encode()
+        sent = asyncio.run(call_asgi(app, "/gemini/stream", body=body, method="POST", disconnect_after=0.1))
+
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertTrue(tokens[0].cancelled)
+        session_store.append.assert_not_called()
+        ConversationSessionStore._instance = None
+
+
+if __name__ == "__main__":
+    unittest.main()
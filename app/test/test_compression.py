@@ -0,0 +1,94 @@
+import gzip
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.compression import CompressedVariants, CompressionMiddleware, negotiate
+from app.http_cache import cached_json, etag_matches, strong_etag
+from app.serialization import FastJSONResponse, dumps
+
+BIG = {"data": [{"ticker": f"T{i}", "close": i * 1.5} for i in range(500)]}
+
+
+def build_app(variants):
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, variants=variants)
+
+    @app.get("/big")
+    async def big():
+        return BIG
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/cached")
+    async def cached(request: Request):
+        return cached_json(request, dumps(BIG), 60)
+
+    @app.get("/events")
+    async def events():
+        async def frames():
+            for i in range(200):
+                yield f"data: {'x' * 50} {i}\n\n"
+        return StreamingResponse(frames(), media_type="text/event-stream")
+
+    return app
+
+
+class TestNegotiation(unittest.TestCase):
+
+    def test_q_values(self):
+        self.assertEqual(negotiate("gzip, deflate"), "gzip")
+        self.assertIsNone(negotiate("gzip;q=0, identity"))
+        self.assertIsNone(negotiate(None))
+        self.assertEqual(negotiate("*;q=0.5"), next(iter(negotiate.__globals__["CODECS"])))
+        self.assertEqual(negotiate("deflate, gzip;q=0.2"), "gzip")
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        self.variants = CompressedVariants(max_bytes=1024 * 1024)
+        self.client = TestClient(build_app(self.variants))
+
+    def get(self, path, encoding="gzip", **headers):
+        return self.client.get(path, headers={"Accept-Encoding": encoding, **headers})
+
+    def test_threshold_and_identity(self):
+        response = self.get("/big")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertLess(int(response.headers["content-length"]), len(dumps(BIG)))
+        self.assertEqual(response.json(), BIG)
+
+        self.assertNotIn("content-encoding", self.get("/small").headers)
+        identity = self.get("/big", encoding="identity")
+        self.assertNotIn("content-encoding", identity.headers)
+        self.assertEqual(identity.headers["vary"], "Accept-Encoding")
+
+    def test_sse_untouched(self):
+        response = self.get("/events")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.text.count("data: "), 200)
+
+    def test_cached_variant_and_validators(self):
+        with self.client.stream("GET", "/cached", headers={"Accept-Encoding": "gzip"}) as response:
+            raw = b"".join(response.iter_raw())
+        self.assertEqual(gzip.decompress(raw), dumps(BIG))
+        etag = response.headers["etag"]
+        self.assertEqual(etag, strong_etag(dumps(BIG))[:-1] + '-gzip"')
+        self.assertTrue(etag_matches(etag, strong_etag(dumps(BIG))))
+
+        self.get("/cached")
+        self.assertEqual((self.variants.misses, self.variants.hits), (1, 1))
+
+        not_modified = self.get("/cached", **{"If-None-Match": etag})
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers["etag"], etag)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app, get_gemini_service
+from app.services.gemini_service import GeminiService
+
+
+# Echoes the prompt, "slow" prompts take longer and "fail" prompts raise. Records concurrency and call start times
+class FakeGeminiService(GeminiService):
+    def __init__(self, delay=0.02):
+        super().__init__()
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.started = []
+
+    async def simple_chat(self, message, model=None, temperature=0.7, max_tokens=150):
+        self.started.append(asyncio.get_running_loop().time())
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay * (5 if message.startswith("slow") else 1))
+            if message.startswith("fail"):
+                raise RuntimeError("quota exceeded")
+            return {"response": message.upper(), "usage": {"total_tokens": len(message)}, "model": "fake"}
+        finally:
+            self.active -= 1
+
+
+class TestBatchChat(unittest.TestCase):
+
+    def run_batch(self, service, prompts, **kwargs):
+        async def collect():
+            return [result async for result in service.batch_chat(prompts, **kwargs)]
+        return asyncio.run(collect())
+
+    def test_concurrency_cap_and_failure_isolation(self):
+        service = FakeGeminiService()
+        prompts = [{"message": f"prompt {i}", "id": f"p{i}"} for i in range(8)] + [{"message": "fail please", "id": "bad"}]
+        results = self.run_batch(service, prompts, concurrency=3, min_interval=0)
+
+        self.assertEqual(service.peak, 3)
+        self.assertEqual(sorted(result["index"] for result in results), list(range(9)))
+        failed = [result for result in results if "error" in result]
+        self.assertEqual(failed, [{"index": 8, "id": "bad", "error": "quota exceeded", "latency_ms": failed[0]["latency_ms"]}])
+        for result in results:
+            if "error" not in result:
+                self.assertEqual(result["response"], prompts[result["index"]]["message"].upper())
+                self.assertEqual(result["id"], prompts[result["index"]]["id"])
+
+    def test_minimum_spacing_between_calls(self):
+        service = FakeGeminiService(delay=0)
+        self.run_batch(service, [{"message": str(i)} for i in range(4)], concurrency=4, min_interval=0.05)
+        gaps = [later - earlier for earlier, later in zip(service.started, service.started[1:])]
+        self.assertTrue(all(gap >= 0.045 for gap in gaps), gaps)
+
+
+class TestBatchRoute(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeGeminiService()
+        app.dependency_overrides[get_gemini_service] = lambda: self.service
+        self.limits = mock.patch.object(settings, "rate_limit_ips", {"testclient": 1000})
+        self.limits.start()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.limits.stop()
+        app.dependency_overrides.clear()
+
+    def test_ndjson_in_completion_order(self):
+        with mock.patch.object(settings, "gemini_batch_min_interval", 0):
+            response = self.client.post("/gemini/batch", json={"prompts": [{"message": "slow one", "id": "a"}, {"message": "quick", "id": "b"}],
+                                                               "concurrency": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        # Finished results come first, index maps them back to the request
+        self.assertEqual([(line["index"], line["id"]) for line in lines], [(1, "b"), (0, "a")])
+        self.assertEqual(lines[0]["response"], "QUICK")
+        self.assertEqual(set(lines[0]), {"index", "id", "response", "usage", "model", "latency_ms"})
+
+    def test_empty_and_oversized_batches(self):
+        self.assertEqual(self.client.post("/gemini/batch", json={"prompts": []}).status_code, 400)
+        with mock.patch.object(settings, "gemini_batch_max_items", 2):
+            response = self.client.post("/gemini/batch", json={"prompts": [{"message": str(i)} for i in range(3)]})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.service.started, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app import serialization
+from app.config import settings
+from app.http_cache import etag_matches, strong_etag
+from app.main import app, get_alpaca_service, search_cache
+from app.shared_cache import SharedCache
+
+
+class FakeAlpacaService:
+    def __init__(self):
+        self.minute_calls = 0
+        self.bar_calls = 0
+
+    async def get_minute_prices_for_day(self, symbol, target_date, cancel_token=None):
+        self.minute_calls += 1
+        return {"symbol": symbol, "date": target_date, "total_samples": 1, "data": [{"close": 1.0}], "status": "success"}
+
+    async def get_historical_bars(self, symbol, timeframe="day", start=None, end=None, cancel_token=None):
+        self.bar_calls += 1
+        return SimpleNamespace(data={symbol: [{"close": 2.0}]})
+
+    @staticmethod
+    def bar_to_dict(bar):
+        return bar
+
+
+class TestEtags(unittest.TestCase):
+
+    def test_matching(self):
+        etag = strong_etag(b"body")
+        self.assertEqual(etag, strong_etag(b"body"))
+        self.assertNotEqual(etag, strong_etag(b"other"))
+        self.assertTrue(etag_matches(f'"x", W/{etag}', etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches(None, etag))
+        self.assertFalse(etag_matches('"x"', etag))
+
+    def test_etag_follows_the_encoder_in_use(self):
+        # "auto" is hashed as the encoder it resolves to, so it matches an explicit setting of that encoder only
+        with mock.patch.object(serialization, "_dumps", None), mock.patch.object(settings, "json_encoder", "auto"):
+            auto = strong_etag(b"body")
+            resolved = serialization.get_encoder_name()
+        with mock.patch.object(serialization, "_dumps", None), mock.patch.object(settings, "json_encoder", "json"):
+            self.assertEqual(strong_etag(b"body") == auto, resolved == "json")
+
+
+class TestCachedRoutes(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeAlpacaService()
+        app.dependency_overrides[get_alpaca_service] = lambda: self.service
+        self.patches = [
+            mock.patch.object(settings, "rate_limit_ips", {"testclient": 1000}),
+            mock.patch.object(app.state, "catalog_version", (3, 3, 30)),
+        ]
+        for patch in self.patches:
+            patch.start()
+        search_cache.clear()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        app.dependency_overrides.clear()
+        search_cache.clear()
+
+    def test_search_not_modified_without_lookup(self):
+        rows = [{"ticker": "AAPL", "company_name": "Apple Inc.", "exchange": "NASDAQ"}]
+        with mock.patch("app.db.TickerDB.search_tickers_db", return_value=rows) as search:
+            first = self.client.get("/tickers/search", params={"query": "aap"})
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first.headers["cache-control"], f"public, max-age={settings.http_cache_search_max_age}")
+            search_cache.clear()
+
+            again = self.client.get("/tickers/search", params={"query": "aap"}, headers={"If-None-Match": first.headers["etag"]})
+            self.assertEqual(again.status_code, 304)
+            self.assertEqual(again.content, b"")
+            self.assertEqual(again.headers["etag"], first.headers["etag"])
+            self.assertEqual(search.call_count, 1)
+
+            # A new catalog version changes every search ETag
+            app.state.catalog_version = (4, 4, 40)
+            self.assertEqual(self.client.get("/tickers/search", params={"query": "aap"}, headers={"If-None-Match": first.headers["etag"]}).status_code, 200)
+
+    def test_closed_session_minutes(self):
+        day = (datetime.now() - timedelta(days=3)).strftime("%Y-%m-%d")
+        first = self.client.get("/alpaca/fetch_minute_prices", params={"symbol": "aapl", "date": day})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("immutable", first.headers["cache-control"])
+
+        again = self.client.get("/alpaca/fetch_minute_prices", params={"symbol": "AAPL", "date": day}, headers={"If-None-Match": first.headers["etag"]})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.service.minute_calls, 1)
+
+    def test_bars_validated_by_content(self):
+        SharedCache().delete_prefix("alpaca:bars:ETAGTEST:")
+        first = self.client.get("/alpaca/fetch_company_bars", params={"symbol": "etagtest", "days": 5})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers["etag"], strong_etag(first.content))
+        max_age = int(first.headers["cache-control"].rsplit("=", 1)[1])
+        self.assertLessEqual(max_age, settings.alpaca_bars_ttl)
+
+        again = self.client.get("/alpaca/fetch_company_bars", params={"symbol": "etagtest", "days": 5}, headers={"If-None-Match": first.headers["etag"]})
+        self.assertEqual(again.status_code, 304)
+        SharedCache().delete_prefix("alpaca:bars:ETAGTEST:")
+
+
+if __name__ == "__main__":
+    unittest.main()
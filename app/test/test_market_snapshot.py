@@ -0,0 +1,144 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.main import app, get_market_snapshot_service
+from app.services.market_snapshot import MarketSnapshotService, compute_snapshot
+from app.shared_cache import SharedCache
+
+
+def daily_bars(closes, volumes, last_open=None, end=datetime(2024, 5, 10)):
+    bars = [{"timestamp": end - timedelta(days=len(closes) - 1 - i), "open": close, "close": close, "volume": volume}
+            for i, (close, volume) in enumerate(zip(closes, volumes))]
+    if last_open is not None:
+        bars[-1]["open"] = last_open
+    return bars
+
+
+UNIVERSE = {
+    "UP": daily_bars([10, 10, 11], [200000, 200000, 600000], last_open=10.5),
+    "DOWN": daily_bars([50, 50, 45], [300000, 300000, 300000], last_open=48),
+    "FLAT": daily_bars([20, 20], [900000, 1000000]),
+    "PENNY": daily_bars([0.5, 0.5, 0.9], [5000000, 5000000, 5000000]),
+    "THIN": daily_bars([30, 30, 60], [100, 100, 100]),
+    # Halted, last bar is a session behind
+    "HALTED": daily_bars([5, 10], [200000, 200000], end=datetime(2024, 5, 9)),
+}
+
+
+# Serves UNIVERSE in batches, "FAIL" in a batch fails the whole batch
+class FakeAlpacaService:
+    def __init__(self):
+        self.batches = []
+
+    async def get_historical_bars(self, symbol, timeframe="day", start=None, end=None, cancel_token=None):
+        self.batches.append(list(symbol))
+        if "FAIL" in symbol:
+            raise ConnectionError("alpaca down")
+        return SimpleNamespace(data={s: UNIVERSE[s] for s in symbol if s in UNIVERSE})
+
+    @staticmethod
+    def bar_to_dict(bar):
+        return bar
+
+
+class TestComputeSnapshot(unittest.TestCase):
+
+    def test_returns_gaps_and_lists(self):
+        snapshot = compute_snapshot(UNIVERSE, {"UP": "Up Inc"}, list_size=10, min_price=1.0, min_volume=1000)
+        self.assertEqual(snapshot["session"], "2024-05-10")
+        self.assertEqual(snapshot["symbols"], 5)
+        self.assertNotIn("HALTED", snapshot["rows"])
+
+        up = snapshot["rows"]["UP"]
+        self.assertEqual(up["name"], "Up Inc")
+        self.assertEqual((up["price"], up["previous_close"], up["change_pct"], up["gap_pct"]), (11.0, 10.0, 10.0, 5.0))
+        self.assertEqual((up["average_volume"], up["relative_volume"]), (200000, 3.0))
+        self.assertEqual(snapshot["rows"]["PENNY"]["volume_rank"], 1)
+
+        # PENNY is under the price floor, THIN under the volume floor
+        lists = snapshot["lists"]
+        self.assertEqual(lists["gainers"], ["UP", "FLAT", "DOWN"])
+        self.assertEqual(lists["losers"], ["DOWN", "FLAT", "UP"])
+        self.assertEqual(lists["active"], ["FLAT", "UP", "DOWN"])
+        self.assertEqual(lists["gap_up"][0], "UP")
+        self.assertEqual(lists["gap_down"][0], "DOWN")
+        self.assertEqual(lists["unusual_volume"], ["UP", "FLAT", "DOWN"])
+
+        self.assertEqual(compute_snapshot({}, {}, 10, 1.0, 0)["symbols"], 0)
+
+
+class TestMarketSnapshotService(unittest.TestCase):
+
+    def setUp(self):
+        SharedCache._instance = None
+        MarketSnapshotService._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        SharedCache(db_file=os.path.join(self.tmp_dir.name, "cache.db"), local_ttl=0)
+        self.patches = [mock.patch("app.services.market_snapshot.settings.market_snapshot_batch_size", 2),
+                        mock.patch("app.services.market_snapshot.settings.market_movers_min_volume", 1000)]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        app.dependency_overrides.clear()
+        SharedCache._instance = None
+        MarketSnapshotService._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_materialize_in_batches_and_share_version(self):
+        async def run():
+            alpaca = FakeAlpacaService()
+            service = MarketSnapshotService()
+            universe = [(symbol, None) for symbol in ["UP", "DOWN", "FAIL", "FLAT", "PENNY"]]
+            run_status = await service.materialize(alpaca, universe)
+            self.assertEqual(sorted(map(tuple, alpaca.batches)), [("FAIL", "FLAT"), ("PENNY",), ("UP", "DOWN")])
+            self.assertEqual((run_status["batches"], run_status["failed_batches"], run_status["symbols"]), (3, 1, 3))
+            self.assertEqual(service.lists["gainers"][0]["symbol"], "UP")
+
+            # Another worker picks up the stored version without fetching anything
+            MarketSnapshotService._instance = None
+            other = MarketSnapshotService()
+            self.assertTrue(await other.load_latest())
+            self.assertEqual(other.version, service.version)
+            self.assertEqual(other.movers("gainers", 1), service.movers("gainers", 1))
+
+            # A fresh version is reused by refresh, force builds the next one
+            status = await other.refresh(alpaca, SimpleNamespace(get_all_tickers=lambda: []))
+            self.assertEqual(status["version"], service.version)
+            with self.assertRaises(RuntimeError):
+                await other.refresh(alpaca, SimpleNamespace(get_all_tickers=lambda: []), force=True)
+            self.assertEqual(other.version, service.version)
+
+        asyncio.run(run())
+
+    def test_movers_route(self):
+        service = MarketSnapshotService()
+        app.dependency_overrides[get_market_snapshot_service] = lambda: service
+        client = TestClient(app)
+        missing = client.get("/market/movers/gainers")
+        self.assertEqual(missing.status_code, 503)
+        self.assertIn("retry-after", missing.headers)
+        self.assertEqual(client.get("/market/movers/sideways").status_code, 400)
+
+        asyncio.run(service.materialize(FakeAlpacaService(), [(symbol, None) for symbol in UNIVERSE]))
+        response = client.get("/market/movers/losers", params={"limit": 2})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["version"], service.version)
+        self.assertEqual([row["symbol"] for row in body["results"]], ["DOWN", "FLAT"])
+
+        cached = client.get("/market/movers/losers", params={"limit": 2}, headers={"If-None-Match": response.headers["etag"]})
+        self.assertEqual(cached.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
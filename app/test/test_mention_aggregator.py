@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+import unittest
+
+from app.services.mention_aggregator import MentionAggregator, RingCounter, score_sentiment
+
+
+class TestMentionAggregator(unittest.TestCase):
+
+    def setUp(self):
+        MentionAggregator._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.now = time.time()
+
+    def tearDown(self):
+        MentionAggregator._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_ring_recycles_slots(self):
+        ring = RingCounter(4)
+        ring.add(10, 2, 1.0)
+        ring.add(14, 1, 0.0)
+        # Bucket 14 took over slot 2, bucket 10 is gone and late events for it are ignored
+        ring.add(10, 5, 0.0)
+        self.assertEqual(ring.get(10), (0, 0.0))
+        self.assertEqual(ring.get(14), (1, 0.0))
+
+    def test_sentiment(self):
+        self.assertEqual(score_sentiment("Nvidia beats and shares surge"), 1.0)
+        self.assertEqual(score_sentiment("Tesla misses, stock plunges despite record deliveries"), -1 / 3)
+        self.assertEqual(score_sentiment("Apple event today"), 0.0)
+
+    def test_series_and_trending(self):
+        aggregator = MentionAggregator(db_file="")
+        # Steady chatter about AAPL, NVDA jumps from 1 to 20 mentions in the current 5 minute bucket
+        for minutes_ago in range(5, 60, 5):
+            for _ in range(10):
+                aggregator.record("AAPL", self.now - minutes_ago * 60)
+            aggregator.record("NVDA", self.now - minutes_ago * 60)
+        bucket_start = self.now - self.now % 300
+        for _ in range(10):
+            aggregator.record("AAPL", bucket_start)
+        for _ in range(20):
+            aggregator.record("NVDA", bucket_start, sentiment=1.0)
+
+        series = aggregator.series("nvda", "5m", points=3, now=self.now)
+        self.assertEqual(series[-1]["mentions"], 20)
+        self.assertEqual(series[-1]["sentiment"], 1.0)
+
+        trending = aggregator.trending("5m", k=2, baseline=6, now=bucket_start + 299)
+        self.assertEqual([t["ticker"] for t in trending], ["NVDA", "AAPL"])
+        self.assertGreater(trending[0]["velocity"], trending[1]["velocity"])
+
+    def test_checkpoint_restore(self):
+        db_file = os.path.join(self.tmp_dir.name, "mentions.db")
+        aggregator = MentionAggregator(db_file=db_file)
+        for _ in range(3):
+            aggregator.record("TSLA", self.now, sentiment=-1.0)
+        self.assertEqual(aggregator.checkpoint(), 4)
+        # Nothing new since the last checkpoint
+        self.assertEqual(aggregator.checkpoint(), 0)
+
+        MentionAggregator._instance = None
+        restored = MentionAggregator(db_file=db_file)
+        for window in ("1m", "1d"):
+            point = restored.series("TSLA", window, points=1, now=self.now)[0]
+            self.assertEqual((point["mentions"], point["sentiment"]), (3, -1.0))
+
+    def test_checkpoints_of_several_workers_add_up(self):
+        db_file = os.path.join(self.tmp_dir.name, "mentions.db")
+        first = MentionAggregator(db_file=db_file)
+        # Second instance stands in for another uvicorn worker on the same file
+        MentionAggregator._instance = None
+        second = MentionAggregator(db_file=db_file)
+
+        first.record("AMD", self.now, sentiment=1.0)
+        second.record("AMD", self.now, sentiment=-1.0)
+        second.record("AMD", self.now, sentiment=-1.0)
+        first.checkpoint()
+        second.checkpoint()
+        first.record("AMD", self.now, sentiment=1.0)
+        first.checkpoint()
+        second.checkpoint()
+
+        MentionAggregator._instance = None
+        restored = MentionAggregator(db_file=db_file)
+        point = restored.series("AMD", "1m", points=1, now=self.now)[0]
+        self.assertEqual((point["mentions"], point["sentiment"]), (4, 0.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
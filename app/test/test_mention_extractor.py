@@ -0,0 +1,115 @@
+import threading
+import unittest
+
+from app.services.mention_extractor import AhoCorasick, MentionExtractor, MentionMatcher
+
+
+CATALOG = [
+    {"ticker": "NVDA", "company_name": "NVIDIA Corporation Common Stock"},
+    {"ticker": "AAPL", "company_name": "Apple Inc. Common Stock"},
+    {"ticker": "IT", "company_name": "Gartner, Inc. Common Stock"},
+    {"ticker": "A", "company_name": "Agilent Technologies, Inc. Common Stock"},
+    {"ticker": "ALL", "company_name": "Allstate Corporation (The) Common Stock"},
+    {"ticker": "BAC", "company_name": "Bank of America Corporation Common Stock"},
+    {"ticker": "AMER", "company_name": "America Inc."},
+    {"ticker": "BRK.B", "company_name": "Berkshire Hathaway Inc. Class B"},
+    {"ticker": "TGT", "company_name": "Target Corporation Common Stock"},
+]
+
+
+class FakeTickerDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get_all_tickers(self):
+        return list(self.rows)
+
+    def get_catalog_version(self):
+        return (len(self.rows), tuple(row["ticker"] for row in self.rows))
+
+
+class TestAhoCorasick(unittest.TestCase):
+
+    def test_overlapping_patterns(self):
+        automaton = AhoCorasick([("he",), ("she",), ("his",), ("he", "said")])
+        matches = sorted(automaton.iter_matches(["she", "said", "he", "said", "his"]))
+        self.assertEqual(matches, [(0, 0, 1), (2, 2, 0), (2, 3, 3), (4, 4, 2)])
+
+
+class TestMentionMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = MentionMatcher(CATALOG)
+
+    def test_symbols_and_names(self):
+        self.assertEqual(self.matcher.extract("Apple and Nvidia rally while $BRK.B and BRK.B slip"), ["AAPL", "BRK.B", "NVDA"])
+        self.assertEqual(self.matcher.extract("NVDA up 3%, Berkshire Hathaway flat"), ["BRK.B", "NVDA"])
+
+    def test_ambiguous_symbols(self):
+        # Common words and single letters only count as cashtags
+        self.assertEqual(self.matcher.extract("IT spending is A big deal for ALL of us"), [])
+        self.assertEqual(self.matcher.extract("$IT and $A beat, $ALL misses"), ["A", "ALL", "IT"])
+        # Shouted headlines only trust cashtags, names still match
+        self.assertEqual(self.matcher.extract("NVDA AND AAPL SOAR AS APPLE WINS"), ["AAPL"])
+
+    def test_name_rules(self):
+        # One word names need a capital letter, the longest name wins over names inside it
+        self.assertEqual(self.matcher.extract("we hit the target"), [])
+        self.assertEqual(self.matcher.extract("Target cuts prices"), ["TGT"])
+        self.assertEqual(self.matcher.extract("Bank of America lifts dividend"), ["BAC"])
+        self.assertEqual(self.matcher.extract("America rallies"), ["AMER"])
+
+    def test_batch(self):
+        texts = ["Apple earnings", "", "Apple earnings", "$NVDA"]
+        self.assertEqual(self.matcher.extract_batch(texts), [["AAPL"], [], ["AAPL"], ["NVDA"]])
+
+
+class TestMentionExtractor(unittest.TestCase):
+
+    def setUp(self):
+        MentionExtractor._instance = None
+
+    def tearDown(self):
+        MentionExtractor._instance = None
+
+    def test_rebuilds_on_catalog_change(self):
+        ticker_db = FakeTickerDB(CATALOG[:2])
+        extractor = MentionExtractor(ticker_db=ticker_db, check_interval=0)
+        self.assertEqual(extractor.extract("Gartner and Apple"), ["AAPL"])
+
+        ticker_db.rows = CATALOG
+        self.assertEqual(extractor.extract("Gartner and Apple"), ["AAPL", "IT"])
+        self.assertEqual(extractor.get_status()["rebuilds"], 2)
+
+        # Unchanged catalog keeps the compiled automaton
+        extractor.extract("Apple")
+        self.assertEqual(extractor.get_status()["rebuilds"], 2)
+
+    def test_readers_keep_old_matcher_during_rebuild(self):
+        ticker_db = FakeTickerDB(CATALOG[:2])
+        extractor = MentionExtractor(ticker_db=ticker_db, check_interval=0)
+        extractor.extract("Apple")
+
+        started, release = threading.Event(), threading.Event()
+
+        class SlowRows(list):
+            def __iter__(self):
+                started.set()
+                release.wait(2)
+                return super().__iter__()
+
+        ticker_db.rows = SlowRows(CATALOG)
+        rebuild = threading.Thread(target=extractor.extract, args=("Gartner",))
+        rebuild.start()
+        started.wait(2)
+        try:
+            # Answered right away from the old catalog while the rebuild is blocked
+            self.assertEqual(extractor.extract("Gartner and Apple"), ["AAPL"])
+        finally:
+            release.set()
+            rebuild.join(2)
+        self.assertEqual(extractor.extract("Gartner and Apple"), ["AAPL", "IT"])
+
+
+if __name__ == "__main__":
+    unittest.main()
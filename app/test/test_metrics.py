@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.metrics import MetricsMiddleware, MetricsRegistry, instrument, registry, upstream_errors, upstream_latency
+
+
+def sample_value(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+@instrument("fake")
+class FakeUpstream:
+    async def fetch(self, fail=False):
+        if fail:
+            raise RuntimeError("upstream down")
+        return "ok"
+
+    async def stream(self):
+        for i in range(3):
+            yield i
+
+    def _private(self):
+        return "untimed"
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_shards_merge(self):
+        counter = self.registry.counter("jobs_total", "Jobs", ("kind",))
+
+        def work():
+            for _ in range(1000):
+                counter.inc("a")
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc("b", amount=2)
+
+        text = self.registry.render()
+        self.assertIn("# TYPE jobs_total counter", text)
+        self.assertEqual(sample_value(text, 'jobs_total{kind="a"}'), 4000)
+        self.assertEqual(sample_value(text, 'jobs_total{kind="b"}'), 2)
+
+    def test_histogram_is_cumulative(self):
+        histogram = self.registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            histogram.observe(value)
+
+        text = self.registry.render()
+        self.assertEqual(sample_value(text, 'latency_seconds_bucket{le="0.1"}'), 1)
+        self.assertEqual(sample_value(text, 'latency_seconds_bucket{le="1"}'), 3)
+        self.assertEqual(sample_value(text, 'latency_seconds_bucket{le="+Inf"}'), 4)
+        self.assertEqual(sample_value(text, "latency_seconds_count"), 4)
+        self.assertAlmostEqual(sample_value(text, "latency_seconds_sum"), 4.05)
+
+    def test_collectors_and_escaping(self):
+        self.registry.register_collector(lambda: [("pool_connections", "gauge", "Pool", [({"db": 'a"b'}, 3)])])
+        self.assertIn('pool_connections{db="a\\"b"} 3', self.registry.render())
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def count(self, method):
+        families = upstream_latency.collect()[0][3]
+        return sum(value for labels, value in families
+                   if labels.get("method") == method and labels.get("upstream") == "fake" and labels.get("__suffix__") == "_count")
+
+    def test_methods_are_timed(self):
+        upstream = FakeUpstream()
+        before = self.count("fetch"), self.count("stream")
+
+        async def run():
+            await upstream.fetch()
+            with self.assertRaises(RuntimeError):
+                await upstream.fetch(fail=True)
+            return [item async for item in upstream.stream()]
+
+        self.assertEqual(asyncio.run(run()), [0, 1, 2])
+        self.assertEqual(self.count("fetch") - before[0], 2)
+        self.assertEqual(self.count("stream") - before[1], 1)
+        errors = dict((tuple(labels.values()), value) for labels, value in upstream_errors.collect()[0][3])
+        self.assertGreaterEqual(errors[("fake", "fetch")], 1)
+        self.assertEqual(upstream._private(), "untimed")
+
+    def test_middleware_uses_route_templates(self):
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def get_item(item_id: int):
+            return {"id": item_id}
+
+        client = TestClient(app)
+        for item_id in (1, 2, 3):
+            self.assertEqual(client.get(f"/items/{item_id}").status_code, 200)
+        client.get("/missing")
+
+        text = registry.render()
+        self.assertGreaterEqual(sample_value(text, 'http_requests_total{method="GET",route="/items/{item_id}",status="200"}'), 3)
+        self.assertGreaterEqual(sample_value(text, 'http_requests_total{method="GET",route="unmatched",status="404"}'), 1)
+        self.assertNotIn('route="/items/1"', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+
+import httpx
+
+from app.services.news_api_service import NewsAPIService
+
+
+ARTICLES = {"status": "ok", "totalResults": 1, "articles": [{"title": "NVIDIA beats estimates", "url": "https://example.com/nvda"}]}
+
+
+class TestNewsAPIService(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.etag = '"v1"'
+
+        self.delay = 0
+
+        async def handler(request: httpx.Request):
+            self.requests.append(request)
+            await asyncio.sleep(self.delay)
+            if request.headers.get("If-None-Match") == self.etag:
+                return httpx.Response(304)
+            return httpx.Response(200, json=ARTICLES, headers={"ETag": self.etag})
+
+        NewsAPIService._instance = None
+        self.service = NewsAPIService(transport=httpx.MockTransport(handler))
+
+    def tearDown(self):
+        NewsAPIService._instance = None
+
+    def run_async(self, coro):
+        async def wrapper():
+            try:
+                return await coro
+            finally:
+                await self.service.aclose()
+        return asyncio.run(wrapper())
+
+    def test_api_key_sent_as_header_not_param(self):
+        params = self.service.create_params(keywords="nvidia")
+        params["apiKey"] = "should-not-leak"
+        result = self.run_async(self.service.fetch_everything(params))
+
+        self.assertEqual(result["articles"][0]["title"], "NVIDIA beats estimates")
+        self.assertNotIn("apiKey", str(self.requests[0].url))
+        self.assertEqual(self.requests[0].headers["X-Api-Key"], self.service.api_key)
+
+    def test_fresh_cache_hit_skips_upstream(self):
+        async def fetch_twice():
+            await self.service.fetch_everything(self.service.create_params(keywords="nvidia"))
+            # Same params in another order (and with a key) map to the same cache entry
+            await self.service.fetch_everything({"pageSize": 10, "language": "en", "sortBy": "popularity", "q": "nvidia", "apiKey": "x"})
+
+        self.run_async(fetch_twice())
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.service.get_cache_status()["hits"], 1)
+
+    def test_stale_entry_is_revalidated(self):
+        self.service.cache_ttl = 0
+
+        async def fetch_twice():
+            await self.service.fetch_everything(self.service.create_params(keywords="nvidia"))
+            return await self.service.fetch_everything(self.service.create_params(keywords="nvidia"))
+
+        result = self.run_async(fetch_twice())
+        self.assertEqual(result, ARTICLES)
+        self.assertEqual(self.requests[1].headers["If-None-Match"], self.etag)
+        self.assertEqual(self.service.get_cache_status()["revalidations"], 1)
+
+    def test_concurrent_identical_requests_share_one_call(self):
+        async def fetch_many():
+            params = self.service.create_params(keywords="nvidia")
+            return await asyncio.gather(*(self.service.fetch_everything(params) for _ in range(5)))
+
+        results = self.run_async(fetch_many())
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(self.requests), 1)
+
+    def test_cancelled_caller_does_not_cancel_shared_call(self):
+        self.delay = 0.05
+
+        async def leader_disconnects():
+            params = self.service.create_params(keywords="nvidia")
+            leader = asyncio.create_task(self.service.fetch_everything(params))
+            await asyncio.sleep(0.01)
+            follower = asyncio.create_task(self.service.fetch_everything(params))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(self.run_async(leader_disconnects()), ARTICLES)
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(self.service._inflight, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import threading
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.profiling import RouteProfiler, SamplingProfiler
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def test_collapsed_stacks(self):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy_loop, args=(stop,), name="busy-worker")
+        worker.start()
+        try:
+            profiler = SamplingProfiler(interval=0.002)
+            stacks = profiler.run(0.2)
+        finally:
+            stop.set()
+            worker.join()
+
+        self.assertGreater(profiler.samples, 10)
+        busy = [stack for stack in stacks if stack.startswith("busy-worker;")]
+        self.assertTrue(busy)
+        self.assertTrue(any("busy_loop (test_profiling.py:" in stack for stack in busy))
+        # One "stack count" line per distinct stack, hottest first
+        lines = SamplingProfiler.render(stacks).splitlines()
+        self.assertEqual(len(lines), len(stacks))
+        self.assertEqual(int(lines[0].rsplit(" ", 1)[1]), max(stacks.values()))
+
+
+class TestRouteProfiler(unittest.TestCase):
+
+    def setUp(self):
+        RouteProfiler._instance = None
+        self.app = FastAPI()
+
+        @self.app.get("/fib")
+        async def fib(n: int = 15):
+            return {"value": fibonacci(n)}
+
+        @self.app.get("/other")
+        async def other():
+            return {"ok": True}
+
+        self.client = TestClient(self.app)
+        self.profiler = RouteProfiler()
+
+    def tearDown(self):
+        RouteProfiler._instance = None
+
+    def test_toggle_restores_original_app(self):
+        route = next(r for r in self.app.routes if getattr(r, "path", None) == "/fib")
+        original = route.app
+
+        self.profiler.enable(self.app, "/fib", sample_rate=1.0, max_requests=2)
+        self.assertIsNot(route.app, original)
+        for _ in range(3):
+            self.assertEqual(self.client.get("/fib").json(), {"value": 610})
+
+        status = self.profiler.describe("/fib")
+        self.assertEqual((status["requests_seen"], status["requests_profiled"]), (2, 2))
+        # max_requests reached, the route runs its original handler again
+        self.assertFalse(status["enabled"])
+        self.assertIs(route.app, original)
+        self.assertIn("fibonacci", self.profiler.report("/fib"))
+
+        self.assertTrue(self.profiler.clear("/fib"))
+        self.assertIsNone(self.profiler.report("/fib"))
+
+    def test_unknown_route(self):
+        with self.assertRaises(KeyError):
+            self.profiler.enable(self.app, "/missing")
+
+
+class TestAdminRoutes(unittest.TestCase):
+
+    def setUp(self):
+        RouteProfiler._instance = None
+        from app.main import app
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        RouteProfiler._instance = None
+
+    def test_admin_key_required(self):
+        with mock.patch.object(settings, "admin_api_key", None):
+            self.assertEqual(self.client.get("/admin/profile/routes").status_code, 404)
+        with mock.patch.object(settings, "admin_api_key", "secret"):
+            self.assertEqual(self.client.get("/admin/profile/routes").status_code, 403)
+            headers = {"X-Admin-Key": "secret"}
+            self.assertEqual(self.client.get("/admin/profile/routes", headers=headers).json(), {"routes": []})
+
+            response = self.client.post("/admin/profile/sample?seconds=0.05&interval_ms=5", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreater(int(response.headers["x-profile-samples"]), 0)
+            for interval_ms in (-1, 0, 100):
+                response = self.client.post(f"/admin/profile/sample?seconds=0.05&interval_ms={interval_ms}", headers=headers)
+                self.assertEqual(response.status_code, 422, interval_ms)
+
+            response = self.client.post("/admin/profile/routes?route=/health&max_requests=1", headers=headers)
+            self.assertEqual(response.json()["enabled"], True)
+            self.client.get("/health")
+            report = self.client.get("/admin/profile/routes/report?route=/health", headers=headers)
+            self.assertIn("function calls", report.text)
+            self.assertEqual(self.client.delete("/admin/profile/routes?route=/health", headers=headers).status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
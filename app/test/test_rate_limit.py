@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from limits import parse
+from limits.storage import MemoryStorage, storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+from slowapi import _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+
+from app.config import settings
+from app.rate_limit import SQLiteStorage, create_limiter, scale_limit
+
+
+# Runs in a forked process, like a second uvicorn worker hitting the same key
+def hit_in_worker(uri, hits):
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    return sum(limiter.hit(parse("10/minute"), "ip:1.2.3.4") for _ in range(hits))
+
+
+class TestSQLiteStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.uri = f"sqlite:///{os.path.join(self.tmp_dir.name, 'rate_limits.db')}"
+        self.storage = storage_from_string(self.uri)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_storage_from_uri(self):
+        self.assertIsInstance(self.storage, SQLiteStorage)
+        self.assertTrue(self.storage.check())
+
+    def test_sliding_window_counter(self):
+        limiter = SlidingWindowCounterRateLimiter(self.storage)
+        item = parse("3/minute")
+        self.assertEqual([limiter.hit(item, "a") for _ in range(4)], [True, True, True, False])
+        # Other keys have their own window
+        self.assertTrue(limiter.hit(item, "b"))
+        self.assertEqual(limiter.get_window_stats(item, "a").remaining, 0)
+
+        limiter.clear(item, "a")
+        self.assertTrue(limiter.hit(item, "a"))
+
+    def test_previous_window_is_weighted(self):
+        # 60 second window, 15 seconds into window 1001 with 8 hits in window 1000: 8 * 0.75 = 6 still count
+        with mock.patch("app.rate_limit.time.time", return_value=1000 * 60 + 30):
+            for _ in range(8):
+                self.assertTrue(self.storage.acquire_sliding_window_entry("k", 10, 60))
+        with mock.patch("app.rate_limit.time.time", return_value=1001 * 60 + 15):
+            self.assertEqual(self.storage.get_sliding_window("k", 60), (8, 45.0, 0, 105.0))
+            results = [self.storage.acquire_sliding_window_entry("k", 10, 60) for _ in range(5)]
+        self.assertEqual(results, [True, True, True, True, False])
+        # Two windows later nothing carries over
+        with mock.patch("app.rate_limit.time.time", return_value=1003 * 60):
+            self.assertEqual(self.storage.get_sliding_window("k", 60)[::2], (0, 0))
+
+    def test_busy_lock_fails_open_quickly(self):
+        storage = SQLiteStorage(self.uri, busy_timeout=0.02)
+        # Another worker stuck holding the write lock
+        other = sqlite3.connect(str(storage.db_file), isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.perf_counter()
+            self.assertTrue(storage.acquire_sliding_window_entry("k", 1, 60))
+            self.assertTrue(storage.acquire_sliding_window_entry("k", 1, 60))
+            self.assertLess(time.perf_counter() - started, 0.5)
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        # Nothing was counted while the lock was busy, the limit applies again once it is free
+        self.assertEqual([storage.acquire_sliding_window_entry("k", 1, 60) for _ in range(2)], [True, False])
+
+    def test_limit_shared_across_processes(self):
+        context = multiprocessing.get_context("fork")
+        with context.Pool(2) as pool:
+            admitted = pool.starmap(hit_in_worker, [(self.uri, 8), (self.uri, 8)])
+        self.assertEqual(sum(admitted), 10)
+
+
+class TestScaledLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.patches = [
+            mock.patch.object(settings, "rate_limit_api_keys", {"partner-key": 10}),
+            mock.patch.object(settings, "rate_limit_ips", {"testclient": 0.5}),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        # Memory storage stands in for the shared backend
+        self.app = FastAPI()
+        self.limiter = create_limiter(storage_uri="memory://")
+        self.app.state.limiter = self.limiter
+        self.app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+        @self.app.get("/ping")
+        @self.limiter.limit("4/minute")
+        async def ping(request: Request):
+            return {"ok": True}
+
+        self.client = TestClient(self.app)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+
+    def test_scale_limit(self):
+        self.assertEqual(scale_limit("3/minute", 1.0), "3/minute")
+        self.assertEqual(scale_limit("3/minute", 10), "30 per 1 minute")
+        self.assertEqual(scale_limit("3/minute", 0.1), "1 per 1 minute")
+
+    def test_per_ip_and_per_key(self):
+        self.assertIsInstance(self.limiter._storage, MemoryStorage)
+        # The test client's address is limited to half the route limit
+        codes = [self.client.get("/ping").status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+
+        # A configured key gets its own, larger bucket
+        headers = {"X-API-Key": "partner-key"}
+        codes = [self.client.get("/ping", headers=headers).status_code for _ in range(41)]
+        self.assertEqual(codes.count(200), 40)
+        self.assertEqual(codes[-1], 429)
+
+        # Unknown keys do not escape the per IP limit
+        self.assertEqual(self.client.get("/ping", headers={"X-API-Key": "made-up"}).status_code, 429)
+
+
+if __name__ == "__main__":
+    unittest.main()
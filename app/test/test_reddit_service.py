@@ -0,0 +1,91 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import httpx
+
+from app.services.mention_aggregator import MentionAggregator
+from app.services.mention_extractor import MentionMatcher
+from app.services.reddit_service import FileRedditSource, RedditAPISource, RedditService, RedditStore, normalize_item
+
+
+FIXTURE = Path(__file__).parent / "fixtures" / "reddit_wallstreetbets.json"
+CATALOG = [
+    {"ticker": "NVDA", "company_name": "NVIDIA Corporation Common Stock"},
+    {"ticker": "AAPL", "company_name": "Apple Inc. Common Stock"},
+    {"ticker": "MSFT", "company_name": "Microsoft Corporation Common Stock"},
+    {"ticker": "TSLA", "company_name": "Tesla, Inc. Common Stock"},
+]
+
+
+class TestRedditService(unittest.TestCase):
+
+    def setUp(self):
+        RedditService._instance = None
+        RedditStore._instance = None
+        MentionAggregator._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = RedditStore(db_file=os.path.join(self.tmp_dir.name, "reddit.db"))
+        self.aggregator = MentionAggregator(db_file="")
+        self.service = RedditService(store=self.store, extractor=MentionMatcher(CATALOG), aggregator=self.aggregator)
+
+    def tearDown(self):
+        RedditService._instance = None
+        RedditStore._instance = None
+        MentionAggregator._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_normalize(self):
+        item = normalize_item({"kind": "t3", "data": {"id": "x", "title": "AAPL &amp; MSFT", "selftext": "  a\n\nb ", "created_utc": 1.5}})
+        self.assertEqual((item["id"], item["kind"], item["title"], item["body"], item["created_utc"]), ("t3_x", "post", "AAPL & MSFT", "a b", 1))
+        self.assertIsNone(normalize_item({"kind": "t1", "data": {"id": "y", "body": "[deleted]"}}))
+        self.assertIsNone(normalize_item({"kind": "more", "data": {"id": "z"}}))
+
+    def test_pipeline_from_fixture(self):
+        # One worker per stage keeps arrival order, so the first copy of a duplicate is the one stored
+        self.service.batch_size = 2
+        self.service.workers.update(normalize=1, extract=1)
+        stats = asyncio.run(self.service.run(FileRedditSource(str(FIXTURE))))
+
+        # 10 children: a deleted comment, a repeated post and a copy-pasted comment are dropped, short repeats are kept
+        self.assertEqual(stats["stages"]["fetch"]["items_out"], 10)
+        self.assertEqual(stats["stages"]["normalize"]["items_out"], 9)
+        self.assertEqual(stats["stages"]["dedupe"]["items_out"], 7)
+        self.assertEqual(stats["stages"]["store"]["items_out"], 7)
+        self.assertTrue(all(queue["depth"] == 0 for queue in stats["queues"].values()))
+
+        nvda = self.store.list_by_ticker("nvda")["results"]
+        self.assertEqual([row["id"] for row in nvda], ["t3_p1", "t1_c1"])
+        self.assertEqual(len(self.store.list_by_ticker("MSFT")["results"]), 1)
+        # Stored mentions feed the rolling counters once
+        self.assertEqual(sum(point["mentions"] for point in self.aggregator.series("NVDA", "1d", points=90, now=1754000000)), 2)
+
+        # A fresh worker has no dedupe memory, the store still skips what an earlier run wrote
+        RedditService._instance = None
+        fresh = RedditService(store=self.store, extractor=MentionMatcher(CATALOG), aggregator=self.aggregator)
+        fresh.workers.update(normalize=1, extract=1)
+        rerun = asyncio.run(fresh.run(FileRedditSource(str(FIXTURE))))
+        self.assertEqual(rerun["stages"]["dedupe"]["items_out"], 7)
+        self.assertEqual(rerun["stages"]["store"]["items_out"], 0)
+
+    def test_api_source_paging(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            after = request.url.params.get("after")
+            children = [{"kind": "t3", "data": {"id": f"{after or 'a'}1", "title": "$NVDA", "created_utc": 1}}]
+            return httpx.Response(200, json={"data": {"children": children, "after": None if after else "t3_a1"}})
+
+        source = RedditAPISource(["stocks"], listings=["new"], transport=httpx.MockTransport(handler))
+        stats = asyncio.run(self.service.run(source, max_pages=5))
+
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0].url.path, "/r/stocks/new.json")
+        self.assertEqual(stats["stages"]["store"]["items_out"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
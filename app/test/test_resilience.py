@@ -0,0 +1,187 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app, get_alpaca_service
+from app.resilience import CircuitBreaker, Upstream, UpstreamUnavailable, get_or_load_with_fallback
+from app.shared_cache import SharedCache
+
+
+class ClientError(Exception):
+    status_code = 404
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_half_open_close(self):
+        breaker = CircuitBreaker("alpaca", failure_threshold=2, reset_timeout=0.05, half_open_calls=1)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertGreater(breaker.retry_after(), 0)
+
+        time.sleep(0.06)
+        # One probe at a time once the reset timeout passed
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_abandoned()
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class TestUpstream(unittest.TestCase):
+
+    def test_open_breaker_fails_fast(self):
+        async def run():
+            upstream = Upstream("test", timeout=0.05, failure_threshold=2, reset_timeout=60)
+            calls = []
+
+            async def hang():
+                calls.append(1)
+                await asyncio.sleep(1)
+
+            async def not_found():
+                raise ClientError("no such symbol")
+
+            # Client errors do not count against the upstream
+            for _ in range(3):
+                with self.assertRaises(ClientError):
+                    await upstream.call(not_found)
+            self.assertEqual(upstream.breaker.state, CircuitBreaker.CLOSED)
+
+            for _ in range(2):
+                with self.assertRaises(UpstreamUnavailable):
+                    await upstream.call(hang)
+            started = time.perf_counter()
+            with self.assertRaises(UpstreamUnavailable) as raised:
+                await upstream.call(hang)
+            self.assertLess(time.perf_counter() - started, 0.01)
+            self.assertEqual(raised.exception.reason, "circuit open")
+            self.assertEqual(len(calls), 2)
+
+        asyncio.run(run())
+
+    def test_hedge_after_p95(self):
+        async def run():
+            upstream = Upstream("test", timeout=5)
+            for _ in range(20):
+                upstream.latency.add(0.01)
+            attempts = []
+
+            async def read():
+                attempts.append(1)
+                # The first attempt is stuck, the hedge answers right away
+                await asyncio.sleep(1 if len(attempts) == 1 else 0)
+                return len(attempts)
+
+            with mock.patch("app.resilience.settings.resilience_hedge_min_delay", 0.01):
+                started = time.perf_counter()
+                self.assertEqual(await upstream.call(read, hedge=True), 2)
+            self.assertLess(time.perf_counter() - started, 0.5)
+            self.assertEqual(upstream.hedges, 1)
+
+            # Without hedge=True (non idempotent calls) there is no second attempt
+            attempts.clear()
+            with self.assertRaises(UpstreamUnavailable):
+                await Upstream("test", timeout=0.05).call(read)
+            self.assertEqual(len(attempts), 1)
+
+        asyncio.run(run())
+
+
+class TestStaleFallback(unittest.TestCase):
+
+    def setUp(self):
+        SharedCache._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        SharedCache(db_file=os.path.join(self.tmp_dir.name, "cache.db"), local_ttl=0)
+
+    def tearDown(self):
+        SharedCache._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_last_known_good(self):
+        async def run():
+            async def good():
+                return {"close": 1.0}
+
+            async def down():
+                raise UpstreamUnavailable("alpaca", "circuit open", 30)
+
+            self.assertEqual(await get_or_load_with_fallback("alpaca:bars:A:1", 0.01, good), ({"close": 1.0}, False))
+            await asyncio.sleep(0.02)
+            # The fresh entry expired and the upstream is down
+            self.assertEqual(await get_or_load_with_fallback("alpaca:bars:A:2", 0.01, down, stale_key="alpaca:bars:A:1|stale"),
+                             ({"close": 1.0}, True))
+            encoded, stale = await get_or_load_with_fallback("alpaca:bars:A:1", 0.01, down, encoded=True)
+            self.assertTrue(stale)
+            self.assertEqual(encoded, b'{"close":1.0}')
+
+            # Uncacheable results count as failed loads
+            async def error_result():
+                return {"status": "error"}
+            result, stale = await get_or_load_with_fallback("alpaca:minute:A", 0.01, lambda: error_result(),
+                                                            cacheable=lambda value: value.get("status") != "error")
+            self.assertEqual(result, {"status": "error"})
+            self.assertFalse(stale)
+
+            with self.assertRaises(UpstreamUnavailable):
+                await get_or_load_with_fallback("alpaca:bars:B:1", 0.01, down)
+
+        asyncio.run(run())
+
+    def test_bars_route_serves_stale_copy(self):
+        class FlakyAlpacaService:
+            down = False
+
+            async def get_historical_bars(self, symbol, timeframe="day", start=None, end=None, cancel_token=None):
+                if self.down:
+                    raise UpstreamUnavailable("alpaca", "circuit open", 12.5)
+                return SimpleNamespace(data={symbol: [{"close": 2.0}]})
+
+            @staticmethod
+            def bar_to_dict(bar):
+                return bar
+
+        service = FlakyAlpacaService()
+        app.dependency_overrides[get_alpaca_service] = lambda: service
+        try:
+            with mock.patch.object(settings, "rate_limit_ips", {"testclient": 1000}):
+                client = TestClient(app)
+                fresh = client.get("/alpaca/fetch_company_bars", params={"symbol": "stale"})
+                self.assertEqual(fresh.status_code, 200)
+                self.assertNotIn("x-data-stale", fresh.headers)
+
+                service.down = True
+                # Next window, the fresh entry is gone
+                SharedCache().delete_prefix("alpaca:bars:STALE:day:30:")
+                stale = client.get("/alpaca/fetch_company_bars", params={"symbol": "stale"})
+                self.assertEqual(stale.status_code, 200)
+                self.assertEqual(stale.headers["x-data-stale"], "true")
+                self.assertEqual(stale.json(), fresh.json())
+
+                missing = client.get("/alpaca/fetch_company_bars", params={"symbol": "never"})
+                self.assertEqual(missing.status_code, 503)
+                self.assertEqual(missing.headers["retry-after"], "13")
+        finally:
+            app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from app.services.retrieval_service import HashingEmbedder, VectorIndex, RetrievalService
+
+
+TICKERS = [
+    {"ticker": "NVDA", "company_name": "NVIDIA Corporation Common Stock", "exchange": "NASDAQ"},
+    {"ticker": "AAPL", "company_name": "Apple Inc. Common Stock", "exchange": "NASDAQ"},
+    {"ticker": "XOM", "company_name": "Exxon Mobil Corporation Common Stock", "exchange": "NYSE"},
+]
+
+
+class TestRetrievalService(unittest.TestCase):
+
+    def setUp(self):
+        RetrievalService._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.service = RetrievalService(index_path=os.path.join(self.tmp_dir.name, "index"), embedder=HashingEmbedder(128))
+
+    def tearDown(self):
+        RetrievalService._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_embedder_is_deterministic(self):
+        embedder = HashingEmbedder(64)
+        first = embedder.embed(["Apple reports record iPhone sales"])
+        second = HashingEmbedder(64).embed(["Apple reports record iPhone sales"])
+        np.testing.assert_array_equal(first, second)
+        self.assertAlmostEqual(float(np.linalg.norm(first[0])), 1.0, places=5)
+
+    def test_retrieve_ticker(self):
+        self.service.add_tickers(TICKERS)
+        results = self.service.retrieve("what is going on with nvidia", k=1)
+        self.assertEqual(results[0]["id"], "ticker:NVDA")
+
+    def test_upsert_and_delete(self):
+        self.service.add_tickers(TICKERS)
+        self.service.add_tickers(TICKERS[:1])
+        self.assertEqual(len(self.service.index), 3)
+
+        self.assertEqual(self.service.delete(["ticker:AAPL"]), 1)
+        ids = {result["id"] for result in self.service.retrieve("apple inc common stock", k=3)}
+        self.assertNotIn("ticker:AAPL", ids)
+
+    def test_ivf_matches_brute_force_with_all_probes(self):
+        embedder = HashingEmbedder(32)
+        texts = [f"document {i} about sector {i % 7}" for i in range(200)]
+        index = VectorIndex(32)
+        index.add([str(i) for i in range(200)], embedder.embed(texts), [{} for _ in texts])
+        query = embedder.embed(["sector 3"])[0]
+
+        brute = [r["id"] for r in index.search(query, k=5)]
+        index.build_ivf(n_lists=8)
+        self.assertEqual([r["id"] for r in index.search(query, k=5, n_probe=8)], brute)
+
+    def test_persist_round_trip(self):
+        self.service.add_tickers(TICKERS)
+        self.service.build_ivf(n_lists=2)
+        self.service.save()
+
+        loaded = VectorIndex.load(self.service.index_path)
+        self.assertEqual(loaded.ids, self.service.index.ids)
+        np.testing.assert_array_equal(loaded.vectors, self.service.index.vectors)
+        self.assertEqual(len(loaded.centroids), 2)
+
+    def test_concurrent_caller_waits_for_complete_instance(self):
+        self.service.add_tickers(TICKERS)
+        self.service.save()
+        RetrievalService._instance = None
+        load = VectorIndex.load
+
+        def slow_load(path):
+            time.sleep(0.1)
+            return load(path)
+
+        with mock.patch.object(VectorIndex, "load", side_effect=slow_load):
+            # Warm-up thread loads the persisted index while a request asks for the service
+            warm_up = threading.Thread(target=RetrievalService, kwargs={"index_path": str(self.service.index_path), "embedder": HashingEmbedder(128)})
+            warm_up.start()
+            time.sleep(0.02)
+            service = RetrievalService()
+            self.assertEqual(len(service.index), len(TICKERS))
+            warm_up.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.search_channel import SearchChannel
+
+
+class TestSearchChannel(unittest.TestCase):
+
+    def setUp(self):
+        self.lookups = []
+        self.sent = []
+
+    async def lookup(self, query, limit):
+        self.lookups.append(query)
+        # Short queries match more and take longer
+        await asyncio.sleep(0.05 if len(query) < 3 else 0)
+        return json.dumps({"results": [{"ticker": query}] * min(limit, 2)}).encode()
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    def test_debounce_and_supersede(self):
+        async def run():
+            channel = SearchChannel(self.lookup, self.send_text, debounce=0.02)
+            # Typed faster than the debounce, only the last one is looked up
+            for query in ("a", "aa", "aap"):
+                await channel.receive(query)
+            await channel.task
+            self.assertEqual(self.lookups, ["AAP"])
+            self.assertEqual(self.sent, [{"id": None, "query": "AAP", "limit": 10, "results": [{"ticker": "AAP"}] * 2}])
+
+            # A slow lookup in flight is cancelled by the next query, its results never arrive
+            self.sent.clear()
+            await channel.receive(json.dumps({"query": "m", "limit": 1, "id": 1}))
+            await asyncio.sleep(0.03)
+            self.assertEqual(self.lookups[-1], "M")
+            await channel.receive(json.dumps({"query": "msft", "limit": 1, "id": 2}))
+            await channel.task
+            self.assertEqual(self.sent, [{"id": 2, "query": "MSFT", "limit": 1, "results": [{"ticker": "MSFT"}]}])
+            self.assertEqual(channel.get_status(), {"received": 5, "superseded": 3, "sent": 2})
+
+            await channel.receive('{"query": ')
+            self.assertIn("error", self.sent[-1])
+            await channel.close()
+
+        asyncio.run(run())
+
+
+class TestSearchWebSocket(unittest.TestCase):
+
+    def test_same_results_as_http_search(self):
+        from app.main import app, search_cache
+        rows = [{"ticker": "AAPL", "company_name": "Apple Inc.", "exchange": "NASDAQ"}]
+        search_cache.clear()
+        with mock.patch("app.main.TickerDB.search_tickers_db", return_value=rows) as search:
+            client = TestClient(app)
+            with client.websocket_connect("/tickers/search/ws") as websocket:
+                websocket.send_text(json.dumps({"query": "aap", "limit": 5, "id": "q1"}))
+                pushed = websocket.receive_json()
+                websocket.send_text("")
+                self.assertEqual(websocket.receive_json()["results"], [])
+            self.assertEqual(pushed, {"id": "q1", "query": "AAP", "limit": 5, "results": rows})
+            self.assertEqual(client.get("/tickers/search", params={"query": "aap", "limit": 5}).json(), {"results": rows})
+            # The HTTP request was answered from the entry the channel cached
+            self.assertEqual(search.call_count, 1)
+        search_cache.clear()
+
+    def test_newer_query_supersedes_a_running_lookup(self):
+        from app.main import app, search_cache
+        released = threading.Event()
+
+        # The scan for "M" only finishes once the "MSFT" one has started, which needs the event loop to stay free
+        def search(query, limit):
+            if query == "M":
+                released.wait(2)
+            else:
+                released.set()
+            return [{"ticker": query, "company_name": query, "exchange": "NASDAQ"}]
+
+        search_cache.clear()
+        with mock.patch("app.main.TickerDB.search_tickers_db", side_effect=search), \
+                mock.patch("app.main.settings.search_channel_debounce", 0):
+            with TestClient(app).websocket_connect("/tickers/search/ws") as websocket:
+                websocket.send_text("m")
+                time.sleep(0.05)
+                websocket.send_text("msft")
+                pushed = websocket.receive_json()
+        self.assertEqual(pushed["query"], "MSFT")
+        search_cache.clear()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import time
+import unittest
+from datetime import datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from unittest import mock
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app import serialization
+from app.serialization import ENCODERS, EncodedCache, FastJSONResponse, dumps
+
+
+class Side(str, Enum):
+    BUY = "buy"
+
+
+class Quote(BaseModel):
+    symbol: str
+    price: float
+
+
+PAYLOAD = {
+    "symbol": "AAPL",
+    "name": "Société Générale",
+    "timestamp": datetime(2024, 1, 2, 9, 30, tzinfo=timezone.utc),
+    "side": Side.BUY,
+    "price": Decimal("185.5"),
+    "volume": np.int64(1200),
+    "closes": np.array([1.5, 2.5]),
+    "quote": Quote(symbol="AAPL", price=1.0),
+    "tags": {"tech"},
+}
+
+EXPECTED = {
+    "symbol": "AAPL", "name": "Société Générale", "timestamp": "2024-01-02T09:30:00+00:00", "side": "buy", "price": 185.5,
+    "volume": 1200, "closes": [1.5, 2.5], "quote": {"symbol": "AAPL", "price": 1.0}, "tags": ["tech"],
+}
+
+
+class TestEncoders(unittest.TestCase):
+
+    def test_encoders_agree(self):
+        for name, encoder in ENCODERS.items():
+            with self.subTest(encoder=name):
+                self.assertEqual(json.loads(encoder(PAYLOAD)), EXPECTED)
+
+    def test_encoder_setting(self):
+        with mock.patch.object(serialization, "_dumps", None), mock.patch.object(serialization.settings, "json_encoder", "json"):
+            self.assertIs(serialization.get_encoder(), ENCODERS["json"])
+            self.assertEqual(serialization.get_encoder_name(), "json")
+        with mock.patch.object(serialization, "_dumps", None), mock.patch.object(serialization.settings, "json_encoder", "missing"):
+            with self.assertRaises(ValueError):
+                serialization.get_encoder()
+
+    def test_response_class(self):
+        app = FastAPI(default_response_class=FastJSONResponse)
+
+        @app.get("/value")
+        async def value():
+            return {"when": datetime(2024, 1, 2), "n": 1}
+
+        @app.get("/encoded")
+        async def encoded():
+            return FastJSONResponse(b'{"cached":true}')
+
+        client = TestClient(app)
+        self.assertEqual(client.get("/value").json(), {"when": "2024-01-02T00:00:00", "n": 1})
+        response = client.get("/encoded")
+        self.assertEqual(response.content, b'{"cached":true}')
+        self.assertEqual(response.headers["content-type"], "application/json")
+
+
+class TestEncodedCache(unittest.TestCase):
+
+    def test_lru_and_ttl(self):
+        cache = EncodedCache(ttl=60, max_entries=2)
+        self.assertEqual(cache.set("a", {"x": 1}), dumps({"x": 1}))
+        cache.set("b", {"x": 2})
+        self.assertIsNotNone(cache.get("a"))
+        # "b" is now the least recently used entry
+        cache.set("c", {"x": 3})
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(json.loads(cache.get("a")), {"x": 1})
+
+        cache.ttl = 0.01
+        cache.set("d", {"x": 4})
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("d"))
+        self.assertEqual(cache.get_status()["hits"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
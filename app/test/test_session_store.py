@@ -0,0 +1,201 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.services.session_store import ConversationSessionStore
+
+
+def turn(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+class TestConversationSessionStore(unittest.TestCase):
+
+    def setUp(self):
+        # Singleton, reset so each test gets its own settings
+        ConversationSessionStore._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ConversationSessionStore._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_append_keeps_history(self):
+        store = ConversationSessionStore(ttl_seconds=60, max_sessions=10, db_file="")
+        session_id = store.create_session()
+
+        store.append(session_id, [turn("user", "hi"), turn("model", "hello")])
+        store.append(session_id, [turn("user", "price of AAPL?")])
+
+        history = store.get_history(session_id)
+        self.assertEqual([t["parts"][0]["text"] for t in history], ["hi", "hello", "price of AAPL?"])
+
+    def test_lru_eviction(self):
+        store = ConversationSessionStore(ttl_seconds=60, max_sessions=2, db_file="")
+        first = store.create_session()
+        second = store.create_session()
+
+        # Touch the first so the second becomes least recently used
+        store.get_history(first)
+        third = store.create_session()
+
+        self.assertIsNotNone(store.get_history(first))
+        self.assertIsNone(store.get_history(second))
+        self.assertIsNotNone(store.get_history(third))
+
+    def test_ttl_expiry(self):
+        store = ConversationSessionStore(ttl_seconds=1, max_sessions=10, db_file="")
+        session_id = store.create_session()
+        store._sessions[session_id] = (time.time() - 5, [])
+
+        self.assertIsNone(store.get_history(session_id))
+
+    def test_sqlite_persistence(self):
+        db_file = os.path.join(self.tmp_dir.name, "sessions.db")
+        store = ConversationSessionStore(ttl_seconds=60, max_sessions=10, db_file=db_file)
+        session_id = store.create_session()
+        store.append(session_id, [turn("user", "hi")])
+
+        # New instance simulates a restarted worker with an empty memory cache
+        ConversationSessionStore._instance = None
+        restored = ConversationSessionStore(ttl_seconds=60, max_sessions=10, db_file=db_file)
+
+        self.assertEqual(restored.get_history(session_id), [turn("user", "hi")])
+        self.assertTrue(restored.delete(session_id))
+        self.assertIsNone(restored.get_history(session_id))
+
+    def test_concurrent_appends_across_workers_are_all_kept(self):
+        db_file = os.path.join(self.tmp_dir.name, "sessions.db")
+        store = ConversationSessionStore(ttl_seconds=60, max_sessions=10, db_file=db_file)
+        session_id = store.create_session()
+        # Second instance stands in for another uvicorn worker on the same file
+        ConversationSessionStore._instance = None
+        other = ConversationSessionStore(ttl_seconds=60, max_sessions=10, db_file=db_file)
+
+        def append_many(target, prefix):
+            for i in range(20):
+                target.append(session_id, [turn("user", f"{prefix}{i}")])
+
+        threads = [threading.Thread(target=append_many, args=(target, prefix)) for target, prefix in ((store, "a"), (other, "b"))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        texts = [t["parts"][0]["text"] for t in store.get_history(session_id)]
+        self.assertEqual(sorted(texts), sorted([f"a{i}" for i in range(20)] + [f"b{i}" for i in range(20)]))
+
+    def test_turns_of_one_session_run_one_at_a_time(self):
+        store = ConversationSessionStore(ttl_seconds=60, max_sessions=10, db_file="")
+        events = []
+
+        async def run_turn(session_id, name):
+            async with store.turn(session_id):
+                events.append(f"{name} start")
+                await asyncio.sleep(0.01)
+                events.append(f"{name} end")
+
+        async def run():
+            await asyncio.gather(run_turn("s1", "first"), run_turn("s1", "second"), run_turn("s2", "other"))
+
+        asyncio.run(run())
+        self.assertGreater(events.index("second start"), events.index("first end"))
+        # Other sessions are not held up, and released locks are dropped
+        self.assertLess(events.index("other start"), events.index("first end"))
+        self.assertEqual(store._turn_locks, {})
+
+
+# Replies "reply to <last message>" after a short wait, history as Gemini would see it is recorded per call
+class FakeGeminiService:
+    def __init__(self):
+        self.histories = []
+
+    def build_turns(self, messages, response_text):
+        return [turn(m.role, m.content) for m in messages] + [turn("model", response_text)]
+
+    async def create_chat_completion(self, messages, model=None, temperature=0.7, max_tokens=150, history=None, context=None):
+        self.histories.append([t["parts"][0]["text"] for t in history or []])
+        await asyncio.sleep(0.01)
+        text = f"reply to {messages[-1].content}"
+        return {"response": text, "usage": {}, "model": "fake", "turns": self.build_turns(messages, text)}
+
+    async def streaming_chat_completion(self, messages, model=None, temperature=None, max_tokens=None, history=None, cancel_token=None):
+        self.histories.append([t["parts"][0]["text"] for t in history or []])
+        yield f"reply to {messages[-1].content}"
+
+
+class TestSessionRoutes(unittest.TestCase):
+
+    def setUp(self):
+        from app.main import app, get_gemini_service, get_session_store
+        ConversationSessionStore._instance = None
+        self.store = ConversationSessionStore(ttl_seconds=60, max_sessions=10, db_file="")
+        self.gemini = FakeGeminiService()
+        app.dependency_overrides[get_gemini_service] = lambda: self.gemini
+        app.dependency_overrides[get_session_store] = lambda: self.store
+        self.limits = mock.patch.object(settings, "rate_limit_ips", {"testclient": 1000})
+        self.limits.start()
+        self.app = app
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.limits.stop()
+        self.app.dependency_overrides.clear()
+        ConversationSessionStore._instance = None
+
+    def message(self, text, session_id=None):
+        return {"messages": [{"role": "user", "content": text}], "session_id": session_id}
+
+    def test_unknown_session_is_404(self):
+        for path in ("/gemini/conversation", "/gemini/stream"):
+            response = self.client.post(path, json=self.message("hi", "missing"))
+            self.assertEqual(response.status_code, 404, path)
+        self.assertEqual(self.gemini.histories, [])
+
+    def test_resume_conversation(self):
+        first = self.client.post("/gemini/conversation", json=self.message("hi")).json()
+        second = self.client.post("/gemini/conversation", json=self.message("and AAPL?", first["session_id"])).json()
+
+        self.assertEqual(second["session_id"], first["session_id"])
+        self.assertEqual(self.gemini.histories, [[], ["hi", "reply to hi"]])
+
+        # The stream continues the same session
+        response = self.client.post("/gemini/stream", json=self.message("thanks", first["session_id"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.gemini.histories[-1], ["hi", "reply to hi", "and AAPL?", "reply to and AAPL?"])
+        self.assertEqual(len(self.store.get_history(first["session_id"])), 6)
+
+    def test_delete_session(self):
+        session_id = self.client.post("/gemini/conversation", json=self.message("hi")).json()["session_id"]
+        self.assertEqual(self.client.delete(f"/gemini/sessions/{session_id}").status_code, 200)
+        self.assertEqual(self.client.delete(f"/gemini/sessions/{session_id}").status_code, 404)
+        self.assertEqual(self.client.post("/gemini/conversation", json=self.message("again", session_id)).status_code, 404)
+
+    def test_concurrent_turns_of_one_session_are_both_kept(self):
+        session_id = self.client.post("/gemini/conversation", json=self.message("hi")).json()["session_id"]
+
+        async def run():
+            async with httpx.AsyncClient(app=self.app, base_url="http://testserver") as client:
+                return await asyncio.gather(*(client.post("/gemini/conversation", json=self.message(text, session_id)) for text in ("one", "two")))
+
+        # httpx's ASGI transport reports 127.0.0.1 as the client
+        with mock.patch.object(settings, "rate_limit_ips", {"127.0.0.1": 1000}):
+            responses = asyncio.run(run())
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        # The second turn was built on the first one's reply
+        self.assertEqual(len(self.gemini.histories[-1]), 4)
+        texts = [t["parts"][0]["text"] for t in self.store.get_history(session_id)]
+        self.assertEqual(len(texts), 6)
+        self.assertEqual(sorted(texts[2:]), sorted(["one", "reply to one", "two", "reply to two"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
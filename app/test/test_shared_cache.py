@@ -0,0 +1,138 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from app.cancellation import OperationCancelled
+from app.shared_cache import SharedCache
+
+
+# Runs in a forked process, like a second uvicorn worker
+def load_in_worker(db_file, log_file):
+    SharedCache._instance = None
+
+    async def loader():
+        with open(log_file, "a") as log:
+            log.write(f"{os.getpid()}\n")
+        await asyncio.sleep(0.5)
+        return {"assets": ["AAPL", "NVDA"]}
+
+    return asyncio.run(SharedCache(db_file=db_file).get_or_load("alpaca:assets", 60, loader))
+
+
+class TestSharedCache(unittest.TestCase):
+
+    def setUp(self):
+        SharedCache._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.tmp_dir.name, "cache.db")
+        self.cache = SharedCache(db_file=self.db_file, local_ttl=0)
+
+    def tearDown(self):
+        SharedCache._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_set_get_expiry(self):
+        self.cache.set("a", {"x": 1}, ttl=60)
+        self.cache.set("b", [1, 2], ttl=0.01)
+        time.sleep(0.02)
+        self.assertEqual(self.cache.get("a"), {"x": 1})
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.delete_prefix("a"), 1)
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_single_load_in_process(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"ok": True}
+
+        async def run():
+            return await asyncio.gather(*(self.cache.get_or_load("k", 60, loader) for _ in range(10)))
+
+        self.assertEqual(asyncio.run(run()), [{"ok": True}] * 10)
+        self.assertEqual(len(calls), 1)
+
+    def test_follower_takes_over_from_cancelled_leader(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            if len(calls) == 2:
+                # The second leader's client disconnects through its cancellation token
+                raise OperationCancelled()
+            return {"ok": len(calls)}
+
+        async def run():
+            leader = asyncio.create_task(self.cache.get_or_load("k", 60, loader))
+            await asyncio.sleep(0.01)
+            followers = [asyncio.create_task(self.cache.get_or_load("k", 60, loader)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await asyncio.gather(*followers, return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual(sum(isinstance(result, OperationCancelled) for result in results), 1)
+        self.assertEqual([result for result in results if isinstance(result, dict)], [{"ok": 3}] * 2)
+        self.assertEqual(len(calls), 3)
+
+    def test_encoded_form(self):
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            return {"symbol": "AAPL", "timestamp": datetime(2024, 1, 2, 9, 30), "close": 185.5}
+
+        async def run():
+            return await asyncio.gather(*(self.cache.get_or_load("bars", 60, loader, encoded=True) for _ in range(5)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(result, bytes) for result in results))
+        # Same document whichever form is read
+        self.assertEqual(self.cache.get("bars", encoded=True), results[0])
+        self.assertEqual(self.cache.get("bars"), {"symbol": "AAPL", "timestamp": "2024-01-02T09:30:00", "close": 185.5})
+
+        self.cache.local_ttl = 60
+        self.cache.set("k", b'{"a":1}', ttl=60)
+        self.assertEqual(self.cache.get("k", encoded=True), b'{"a":1}')
+        self.assertEqual(self.cache.get("k"), {"a": 1})
+        self.cache.set("k", {"a": 2}, ttl=60)
+        self.assertEqual(self.cache.get("k", encoded=True), b'{"a":2}')
+
+    def test_uncacheable_results_are_not_stored(self):
+        async def loader():
+            return {"status": "error"}
+
+        result = asyncio.run(self.cache.get_or_load("k", 60, loader, cacheable=lambda value: value["status"] == "success"))
+        self.assertEqual(result, {"status": "error"})
+        self.assertIsNone(self.cache.get("k"))
+
+    def test_expired_lease_is_taken_over(self):
+        owner = self.cache.try_acquire("job", lease_seconds=0.05)
+        self.assertIsNotNone(owner)
+        self.assertIsNone(self.cache.try_acquire("job"))
+        time.sleep(0.06)
+        self.assertIsNotNone(self.cache.try_acquire("job"))
+
+    def test_single_load_across_processes(self):
+        log_file = os.path.join(self.tmp_dir.name, "loads.log")
+        context = multiprocessing.get_context("fork")
+        with context.Pool(4) as pool:
+            results = pool.starmap(load_in_worker, [(self.db_file, log_file)] * 4)
+
+        self.assertEqual(results, [{"assets": ["AAPL", "NVDA"]}] * 4)
+        with open(log_file) as log:
+            self.assertEqual(len(log.read().split()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from app.startup import StartupTracker, process_start_time
+
+
+class TestStartupTracker(unittest.TestCase):
+
+    def setUp(self):
+        StartupTracker._instance = None
+        self.tracker = StartupTracker()
+
+    def tearDown(self):
+        StartupTracker._instance = None
+
+    def test_process_start_precedes_import(self):
+        self.assertLessEqual(process_start_time(), self.tracker.marks["imported"])
+
+    def test_failed_step_does_not_block_ready(self):
+        calls = []
+
+        async def ok():
+            calls.append("ok")
+
+        async def broken():
+            raise RuntimeError("upstream down")
+
+        async def run():
+            waiter = asyncio.create_task(self.tracker.wait_ready(timeout=5))
+            await self.tracker.warm_up([("broken", broken), ("ok", ok)])
+            return await waiter
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertEqual(calls, ["ok"])
+        status = self.tracker.get_status()
+        self.assertTrue(status["ready"])
+        self.assertEqual([(step["name"], step["error"]) for step in status["warm_up"]], [("broken", "upstream down"), ("ok", None)])
+        self.assertIsNotNone(status["seconds_since_process_start"]["ready"])
+        # Milestones are only recorded the first time
+        self.assertFalse(self.tracker.mark("ready"))
+
+
+class TestLazyStartup(unittest.TestCase):
+
+    def test_main_import_skips_sdks(self):
+        repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        code = "import sys, app.main; print(sorted(m for m in ('google.generativeai', 'alpaca', 'pandas') if m in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], cwd=repo_root, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]")
+
+    def test_ready_endpoint(self):
+        from app.main import app, startup_tracker
+        client = TestClient(app)
+        with mock.patch.dict(startup_tracker.marks), mock.patch.object(app.state, "catalog_version", (1, 1, 4)):
+            startup_tracker.marks.pop("ready", None)
+            self.assertEqual(client.get("/ready").status_code, 503)
+            self.assertEqual(client.get("/health").status_code, 200)
+            self.assertIn("first_health", startup_tracker.marks)
+            startup_tracker.mark("ready")
+            response = client.get("/ready")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.json()["ready"])
+
+
+class TestPopulateTickers(unittest.TestCase):
+
+    def test_failed_fetch_raises_and_leaves_table_empty(self):
+        from app.db import SQLitePool
+        from app.main import populate_tickers
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pool = SQLitePool(os.path.join(tmp_dir, "tickers.db"))
+            with pool.get_connection() as conn:
+                conn.execute("CREATE TABLE tickers (ticker TEXT PRIMARY KEY, company_name TEXT, exchange TEXT)")
+                conn.commit()
+
+            async def fetch_all_tickers():
+                return {"results": [], "error": "alpaca down"}
+
+            service = mock.Mock(fetch_all_tickers=fetch_all_tickers)
+            with mock.patch("app.main.db_pool", pool), mock.patch("app.main.AlpacaMarketService", return_value=service):
+                with self.assertRaises(RuntimeError):
+                    asyncio.run(populate_tickers())
+
+                async def fetched():
+                    return {"results": [{"ticker": "AAPL", "company_name": "Apple Inc.", "exchange": "NASDAQ"}]}
+                service.fetch_all_tickers = fetched
+                asyncio.run(populate_tickers())
+            with pool.get_connection() as conn:
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM tickers").fetchone()[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
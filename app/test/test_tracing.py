@@ -0,0 +1,104 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from app.tracing import Trace, TracedJSONResponse, TracedRoute, TraceRecorder, TracingMiddleware, span, to_thread
+
+
+class Item(BaseModel):
+    name: str
+    qty: int
+
+
+def build_app():
+    app = FastAPI(default_response_class=TracedJSONResponse)
+    app.router.route_class = TracedRoute
+    app.add_middleware(TracingMiddleware)
+
+    @app.post("/items")
+    async def create_item(item: Item):
+        with span("db.insert", table="items"):
+            await to_thread(time.sleep, 0.02)
+        return {"item": item.model_dump()}
+
+    @app.get("/fast")
+    async def fast():
+        return {"ok": True}
+
+    @app.get("/boom")
+    async def boom():
+        raise RuntimeError("boom")
+
+    return app
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        TraceRecorder._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.trace_file = os.path.join(self.tmp_dir.name, "traces.jsonl")
+        self.recorder = TraceRecorder(trace_file=self.trace_file, slow_ms=10, sample_rate=0)
+        self.client = TestClient(build_app(), raise_server_exceptions=False)
+
+    def tearDown(self):
+        self.recorder.stop()
+        TraceRecorder._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_span_outside_request_is_noop(self):
+        with span("idle") as current:
+            pass
+        self.assertIsNone(current.trace)
+
+    def test_phases_of_slow_request(self):
+        response = self.client.post("/items", json={"name": "widget", "qty": 2})
+        self.assertEqual(response.status_code, 200)
+        record = self.recorder.get(response.headers["x-trace-id"])
+        self.assertEqual(record["sampled"], "slow")
+        self.assertEqual(record["route"], "/items")
+
+        spans = {s["name"]: s for s in record["spans"]}
+        for name in ("request.validate", "handler", "db.insert", "executor.queue", "executor.run", "response.serialize", "response.json_encode"):
+            self.assertIn(name, spans)
+        # Parent links follow the nesting, including into the executor thread
+        self.assertEqual(spans["db.insert"]["parent"], spans["handler"]["id"])
+        self.assertEqual(spans["executor.run"]["parent"], spans["db.insert"]["id"])
+        self.assertEqual(spans["db.insert"]["attrs"], {"table": "items"})
+        self.assertGreaterEqual(spans["executor.run"]["duration_ms"], 20)
+
+    def test_tail_sampling(self):
+        self.recorder.slow_ms = 10000
+        self.assertEqual(self.client.get("/fast").status_code, 200)
+        self.assertEqual(self.client.get("/boom").status_code, 500)
+        self.assertEqual([r["route"] for r in self.recorder.recent], ["/boom"])
+        self.assertEqual(self.recorder.get_status()["seen"], 2)
+
+    def test_slowest_and_export(self):
+        self.recorder.slow_ms = 0
+        self.client.get("/fast")
+        self.client.post("/items", json={"name": "widget", "qty": 2})
+        slowest = self.recorder.slowest(limit=1)
+        self.assertEqual(slowest[0]["route"], "/items")
+        self.assertEqual(len(self.recorder.slowest(route="/fast")), 1)
+
+        self.recorder.stop()
+        with open(self.trace_file) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["route"] for line in lines], ["/fast", "/items"])
+
+    def test_span_cap(self):
+        trace = Trace("GET", "/x")
+        for _ in range(300):
+            trace.add_span("s", 0.0, 0.0)
+        self.assertEqual(trace.to_dict()["dropped_spans"], 300 - len(trace.spans))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from types import SimpleNamespace
+
+from app.resilience import Upstream
+from app.services.alpaca_service import AlpacaMarketService, downsample
+from app.shared_cache import SharedCache
+
+
+# Daily closes 100, 101, 102, ... for every requested symbol except "NONE", counts requests
+class FakeHistoricalClient:
+    def __init__(self):
+        self.requests = []
+        self.down = False
+
+    def get_stock_bars(self, request):
+        if self.down:
+            raise ConnectionError("alpaca down")
+        symbols = [request.symbol_or_symbols] if isinstance(request.symbol_or_symbols, str) else list(request.symbol_or_symbols)
+        self.requests.append(symbols)
+        days = (request.end - request.start).days
+        return SimpleNamespace(data={
+            symbol: [SimpleNamespace(timestamp=request.start + timedelta(days=i), close=100.0 + i, volume=1000 + i) for i in range(days)]
+            for symbol in symbols if symbol != "NONE"
+        })
+
+
+class TestDownsample(unittest.TestCase):
+
+    def test_fixed_length_with_endpoints(self):
+        values = list(range(100))
+        points = downsample(values, 10)
+        self.assertEqual(len(points), 10)
+        self.assertEqual((points[0], points[-1]), (0, 99))
+        self.assertEqual(downsample([1, 2, 3], 10), [1, 2, 3])
+
+
+class TestWatchlistSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        SharedCache._instance = None
+        AlpacaMarketService._instance = None
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        SharedCache(db_file=os.path.join(self.tmp_dir.name, "cache.db"), local_ttl=0)
+        self.client = FakeHistoricalClient()
+        self.service = AlpacaMarketService()
+        self.service._historical_client = self.client
+        self.service.upstream = Upstream("alpaca-test", failure_threshold=100)
+
+    def tearDown(self):
+        SharedCache._instance = None
+        AlpacaMarketService._instance = None
+        self.tmp_dir.cleanup()
+
+    def test_batched_fetch_and_per_symbol_cache(self):
+        async def run():
+            first = await self.service.get_watchlist_snapshot(["AAPL", "MSFT", "NONE"], days=30, points=8)
+            self.assertEqual(self.client.requests, [["AAPL", "MSFT", "NONE"]])
+            self.assertEqual([row["symbol"] for row in first["results"]], ["AAPL", "MSFT"])
+            self.assertEqual(first["missing"], ["NONE"])
+            aapl = first["results"][0]
+            self.assertEqual((aapl["price"], aapl["previous_close"], aapl["change"]), (129.0, 128.0, 1.0))
+            self.assertAlmostEqual(aapl["change_pct"], 0.781, places=3)
+            self.assertEqual(len(aapl["sparkline"]), 8)
+            self.assertEqual((aapl["sparkline"][0], aapl["sparkline"][-1]), (100.0, 129.0))
+
+            # Cached symbols are not requested again, only the new one is
+            second = await self.service.get_watchlist_snapshot(["MSFT", "NVDA", "AAPL"], days=30, points=8)
+            self.assertEqual(self.client.requests[-1], ["NVDA"])
+            self.assertEqual([row["symbol"] for row in second["results"]], ["MSFT", "NVDA", "AAPL"])
+            self.assertEqual((second["cached"], second["fetched"]), (2, 1))
+            self.assertEqual(second["results"][2], first["results"][0])
+
+        asyncio.run(run())
+
+    def test_stale_snapshot_when_upstream_fails(self):
+        async def run():
+            await self.service.get_watchlist_snapshot(["AAPL"], days=10, points=4)
+            SharedCache().delete_prefix("alpaca:snapshot:AAPL:10:4")
+            SharedCache().set("alpaca:snapshot:AAPL:10:4|stale", {"symbol": "AAPL", "price": 1.0}, 60)
+            self.client.down = True
+
+            result = await self.service.get_watchlist_snapshot(["AAPL", "MSFT"], days=10, points=4)
+            self.assertEqual(result["results"], [{"symbol": "AAPL", "price": 1.0, "stale": True}])
+            self.assertEqual(result["missing"], ["MSFT"])
+
+            with self.assertRaises(ConnectionError):
+                await self.service.get_watchlist_snapshot(["MSFT"], days=10, points=4)
+
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    unittest.main()
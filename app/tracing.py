@@ -0,0 +1,331 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import json
+import logging
+import queue
+import random
+import secrets
+import time
+from collections import deque
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+
+from app.config import settings
+from app.serialization import FastJSONResponse
+
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[int]] = ContextVar("current_span", default=None)
+
+
+# One request's spans. Spans only hold perf_counter offsets until the trace is kept, and are appended from the
+# event loop and executor threads alike (list.append is atomic under the GIL)
+class Trace:
+    __slots__ = ("trace_id", "method", "path", "route", "status", "started_at", "started", "finished", "spans",
+                 "dropped_spans", "marks", "_ids")
+
+    def __init__(self, method: str, path: str):
+        self.trace_id = secrets.token_hex(8)
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.finished = None
+        self.spans: List[tuple] = []
+        self.dropped_spans = 0
+        # Phase boundaries inside the FastAPI route handler, see TracedRoute
+        self.marks: Dict[str, float] = {}
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def add_span(self, name: str, start: float, end: float, parent: Optional[int] = None, attrs: Optional[Dict[str, Any]] = None,
+                 span_id: Optional[int] = None, error: Optional[str] = None):
+        if len(self.spans) >= settings.trace_max_spans:
+            self.dropped_spans += 1
+            return
+        self.spans.append((span_id or self.next_id(), parent, name, start, end, attrs, error))
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def to_dict(self, reason: Optional[str] = None) -> Dict[str, Any]:
+        spans = []
+        breakdown: Dict[str, float] = {}
+        for span_id, parent, name, start, end, attrs, error in sorted(self.spans, key=lambda s: s[3]):
+            duration_ms = (end - start) * 1000
+            spans.append({
+                "id": span_id, "parent": parent, "name": name, "start_ms": round((start - self.started) * 1000, 3),
+                "duration_ms": round(duration_ms, 3), **({"attrs": attrs} if attrs else {}), **({"error": error} if error else {})
+            })
+            breakdown[name] = breakdown.get(name, 0.0) + duration_ms
+        return {
+            "trace_id": self.trace_id,
+            "method": self.method,
+            "route": self.route,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 3),
+            "sampled": reason,
+            # Total time per span name, nested spans are counted under their own name as well as their parent's
+            "breakdown_ms": {name: round(total, 3) for name, total in sorted(breakdown.items(), key=lambda item: -item[1])},
+            "spans": spans,
+            "dropped_spans": self.dropped_spans,
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+# `with span("db.search"):` times a block under the current span. Outside a traced request it only costs a
+# context variable lookup
+class Span:
+    __slots__ = ("name", "attrs", "trace", "parent", "span_id", "start", "token")
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attrs = attrs
+        self.trace = None
+
+    def __enter__(self):
+        trace = _current_trace.get()
+        if trace is not None:
+            self.trace = trace
+            self.parent = _current_span.get()
+            self.span_id = trace.next_id()
+            self.token = _current_span.set(self.span_id)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            end = time.perf_counter()
+            try:
+                _current_span.reset(self.token)
+            except ValueError:
+                # Exited from another task's context copy, the parent link of later spans may be off
+                pass
+            self.trace.add_span(self.name, self.start, end, self.parent, self.attrs, self.span_id,
+                                exc_type.__name__ if exc_type else None)
+        return False
+
+
+def span(name: str, **attrs) -> Span:
+    return Span(name, attrs or None)
+
+
+# asyncio.to_thread that records how long the call waited for an executor thread separately from how long it ran
+async def to_thread(func: Callable, *args, **kwargs):
+    trace = _current_trace.get()
+    if trace is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    submitted = time.perf_counter()
+    parent = _current_span.get()
+    name = getattr(func, "__qualname__", None) or getattr(func, "__name__", None) or type(func).__name__
+
+    def run():
+        trace.add_span("executor.queue", submitted, time.perf_counter(), parent, {"func": name})
+        with Span("executor.run", {"func": name}):
+            return func(*args, **kwargs)
+
+    return await asyncio.to_thread(run)
+
+
+# Default response class for traced apps, separates JSON encoding from the rest of serialization
+class TracedJSONResponse(FastJSONResponse):
+
+    def render(self, content: Any) -> bytes:
+        trace = _current_trace.get()
+        if trace is None:
+            return super().render(content)
+        trace.marks["render_start"] = time.perf_counter()
+        with Span("response.json_encode"):
+            return super().render(content)
+
+
+# Splits FastAPI's route handler into request.validate (body parsing, dependencies, Pydantic validation),
+# handler (the endpoint itself) and response.serialize (response validation and jsonable_encoder)
+class TracedRoute(APIRoute):
+
+    def get_route_handler(self) -> Callable:
+        endpoint = self.dependant.call
+        if asyncio.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def traced_endpoint(*args, **kwargs):
+                trace = _current_trace.get()
+                if trace is None:
+                    return await endpoint(*args, **kwargs)
+                trace.marks["endpoint_start"] = time.perf_counter()
+                try:
+                    with Span("handler"):
+                        return await endpoint(*args, **kwargs)
+                finally:
+                    trace.marks["endpoint_end"] = time.perf_counter()
+        else:
+            @functools.wraps(endpoint)
+            def traced_endpoint(*args, **kwargs):
+                trace = _current_trace.get()
+                if trace is None:
+                    return endpoint(*args, **kwargs)
+                trace.marks["endpoint_start"] = time.perf_counter()
+                try:
+                    with Span("handler"):
+                        return endpoint(*args, **kwargs)
+                finally:
+                    trace.marks["endpoint_end"] = time.perf_counter()
+        self.dependant.call = traced_endpoint
+        handler = super().get_route_handler()
+
+        async def traced_handler(request):
+            trace = _current_trace.get()
+            if trace is None:
+                return await handler(request)
+            started = time.perf_counter()
+            try:
+                return await handler(request)
+            finally:
+                finished = time.perf_counter()
+                marks = trace.marks
+                parent = _current_span.get()
+                trace.add_span("request.validate", started, marks.get("endpoint_start", finished), parent)
+                if "endpoint_end" in marks:
+                    trace.add_span("response.serialize", marks["endpoint_end"], marks.get("render_start", finished), parent)
+
+        return traced_handler
+
+
+# Keeps every trace that was slow or failed plus a small random share of the rest, decided once the request is
+# over (tail sampling). Kept traces go to an in-memory ring for /traces/slowest and to a rotating JSONL file
+class TraceRecorder:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, trace_file: Optional[str] = None, slow_ms: Optional[float] = None, sample_rate: Optional[float] = None):
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+
+            self.slow_ms = slow_ms if slow_ms is not None else settings.trace_slow_ms
+            self.sample_rate = sample_rate if sample_rate is not None else settings.trace_sample_rate
+            self.recent: deque = deque(maxlen=settings.trace_buffer_size)
+            self.stats = {"seen": 0, "kept_slow": 0, "kept_error": 0, "kept_random": 0, "export_errors": 0}
+
+            trace_file = trace_file if trace_file is not None else settings.trace_file
+            self.trace_file = Path(trace_file) if trace_file else None
+            self._listener = None
+            self._logger = None
+            if self.trace_file:
+                self._start_exporter()
+
+    # File writes happen on the QueueListener's thread, the request path only enqueues the encoded line
+    def _start_exporter(self):
+        self.trace_file.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(self.trace_file, maxBytes=settings.trace_file_max_bytes,
+                                      backupCount=settings.trace_file_backups, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records = queue.SimpleQueue()
+        self._listener = QueueListener(records, handler)
+        self._listener.start()
+
+        self._logger = logging.getLogger(f"{__name__}.export")
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+        self._logger.handlers = [QueueHandler(records)]
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+
+    def sample_reason(self, trace: Trace) -> Optional[str]:
+        if trace.status is None or trace.status >= 500:
+            return "error"
+        if trace.duration * 1000 >= self.slow_ms:
+            return "slow"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "random"
+        return None
+
+    def finish(self, trace: Trace) -> Optional[Dict[str, Any]]:
+        trace.finished = trace.finished or time.perf_counter()
+        self.stats["seen"] += 1
+        reason = self.sample_reason(trace)
+        if reason is None:
+            return None
+        self.stats[f"kept_{reason}"] += 1
+        record = trace.to_dict(reason)
+        self.recent.append(record)
+        if self._logger is not None:
+            try:
+                self._logger.info(json.dumps(record, default=str))
+            except Exception:
+                self.stats["export_errors"] += 1
+        return record
+
+    def slowest(self, limit: int = 10, route: Optional[str] = None, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        records = [r for r in list(self.recent) if (route is None or r["route"] == route) and (since is None or r["started_at"] >= since)]
+        return heapq.nlargest(limit, records, key=lambda r: r["duration_ms"])
+
+    def get(self, trace_id: str) -> Optional[Dict[str, Any]]:
+        for record in reversed(list(self.recent)):
+            if record["trace_id"] == trace_id:
+                return record
+        return None
+
+    def get_status(self):
+        return {
+            **self.stats,
+            "buffered": len(self.recent),
+            "slow_ms": self.slow_ms,
+            "sample_rate": self.sample_rate,
+            "trace_file": str(self.trace_file) if self.trace_file else None
+        }
+
+
+# Starts a trace per HTTP request and hands it to the TraceRecorder once the response is fully sent (for
+# streaming responses that is after the last chunk). The trace id is returned in the X-Trace-Id header
+class TracingMiddleware:
+    def __init__(self, app, route_template: Optional[Callable[[dict], str]] = None):
+        self.app = app
+        self.route_template = route_template or (lambda scope: scope.get("path", ""))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.trace_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        header = (b"x-trace-id", trace.trace_id.encode())
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [header]
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            _current_trace.reset(token)
+            trace.finished = time.perf_counter()
+            trace.route = self.route_template(scope)
+            TraceRecorder().finish(trace)